@@ -0,0 +1,263 @@
+"""
+Admission control for /graphql: concurrency budgets and per-caller rate limits.
+
+Under a spike, accepting every request only moves the queue into the database,
+and every caller waits. Instead each worker process admits at most a fixed
+number of operations at a time, with separate budgets for queries and
+mutations, so a burst of one kind cannot starve the other:
+
+- A request that finds its budget full waits in a bounded queue for at most
+  `queue_timeout` seconds. When the queue is full, or the wait runs out, it is
+  rejected at once with 503 and a `Retry-After` header.
+- Each caller (client address) draws from a token bucket refilled at `rate`
+  operations per second, up to `burst`. A caller that runs dry gets 429 with
+  the time until its next token in `Retry-After`. A batch costs one token per
+  operation; one that costs more than `burst` could never be paid for and is
+  rejected with 400.
+
+A request turned away with 503 gets its tokens back, since it did no work.
+
+Limits are per process; with several gunicorn workers the effective limit is
+the sum over workers. A request only reaches the limiter once one of the
+worker's request threads picks it up, and a queued request keeps its thread
+while it waits, so the defaults are derived from the thread count by
+`default_limits`: budgets and queues fit within the threads with one to spare,
+and a burst is turned away with 503 instead of piling up in the server's
+backlog. Counters and the current queue depths are served as JSON from
+/metrics/admission.
+
+Settings are read from the environment by `create_app`:
+
+    GRAPHQL_MAX_CONCURRENT_QUERIES      queries running at once (default: half the threads, 0 = unlimited)
+    GRAPHQL_MAX_CONCURRENT_MUTATIONS    mutations running at once (default: a quarter of the threads)
+    GRAPHQL_MAX_QUEUE                   requests waiting per budget (default: what the threads leave)
+    GRAPHQL_QUEUE_TIMEOUT               seconds a request may wait for a slot (default 2)
+    GRAPHQL_RATE_LIMIT                  operations per second per caller (default 0 = off)
+    GRAPHQL_RATE_BURST                  bucket size per caller (default 20)
+
+Callers are told apart by `request.remote_addr`. Behind a reverse proxy, set
+TRUSTED_PROXIES to the number of proxies in front of the app so that the
+address comes from X-Forwarded-For (see `create_app`).
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+
+def default_limits(threads: int) -> Dict[str, int]:
+    """
+    Query and mutation budgets, and the queue of each, for `threads` request
+    threads per process: half of them for queries, a quarter for mutations,
+    and the queues share what is left but one thread.
+    """
+    queries = max(1, threads // 2)
+    mutations = max(1, threads // 4)
+    queue = max(0, threads - queries - mutations - 1) // 2
+    return {"queries": queries, "mutations": mutations, "queue": queue}
+
+
+class Rejected(Exception):
+    """A request turned away by admission control."""
+
+    def __init__(self, status_code: int, code: str, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.code = code
+        self.message = message
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> Optional[str]:
+        # Retry-After takes whole seconds; None when retrying cannot help
+        if self.retry_after is None:
+            return None
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class ConcurrencyLimiter:
+    """At most `limit` holders at a time, with a bounded queue of waiters."""
+
+    def __init__(self, limit: int, max_queue: int = 0, queue_timeout: float = 0.0):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.queue_full = 0
+        self.timed_out = 0
+        self._condition = threading.Condition()
+
+    def acquire(self) -> bool:
+        """Take a slot, waiting in the queue if needed. False if rejected."""
+        with self._condition:
+            if self.limit <= 0 or self.active < self.limit:
+                return self._admit()
+            if self.waiting >= self.max_queue:
+                self.queue_full += 1
+                return False
+            self.waiting += 1
+            try:
+                deadline = time.monotonic() + self.queue_timeout
+                while self.active >= self.limit:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timed_out += 1
+                        return False
+                    self._condition.wait(remaining)
+                return self._admit()
+            finally:
+                self.waiting -= 1
+
+    def _admit(self) -> bool:
+        self.active += 1
+        self.admitted += 1
+        return True
+
+    def release(self) -> None:
+        with self._condition:
+            self.active -= 1
+            self._condition.notify()
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {
+                "limit": self.limit,
+                "active": self.active,
+                "queueDepth": self.waiting,
+                "maxQueue": self.max_queue,
+                "admitted": self.admitted,
+                "rejectedQueueFull": self.queue_full,
+                "rejectedTimeout": self.timed_out,
+            }
+
+
+class TokenBucketLimiter:
+    """A token bucket per caller, refilled at `rate` tokens per second up to `burst`."""
+
+    def __init__(self, rate: float, burst: float, max_callers: int = 10000,
+                 clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.max_callers = max_callers
+        self.clock = clock
+        self.limited = 0
+        # caller -> (tokens, time of last refill), least recently seen first
+        self._buckets: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def take(self, caller: str, cost: float = 1.0) -> float:
+        """
+        Spend `cost` tokens of the caller's bucket.
+
+        Returns 0 when allowed, otherwise the seconds until the bucket holds
+        enough tokens (nothing is spent then), or infinity when `cost` is more
+        than the bucket can ever hold.
+        """
+        if not self.enabled:
+            return 0.0
+        if cost > self.burst:
+            with self._lock:
+                self.limited += 1
+            return math.inf
+        now = self.clock()
+        with self._lock:
+            tokens, last = self._buckets.pop(caller, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens >= cost:
+                tokens -= cost
+                wait = 0.0
+            else:
+                self.limited += 1
+                wait = (cost - tokens) / self.rate
+            self._buckets[caller] = (tokens, now)
+            # Forget the callers seen longest ago; a new bucket starts full anyway
+            while len(self._buckets) > self.max_callers:
+                self._buckets.popitem(last=False)
+            return wait
+
+    def refund(self, caller: str, cost: float = 1.0) -> None:
+        """Give back tokens spent on a request that was turned away afterwards."""
+        if not self.enabled:
+            return
+        with self._lock:
+            bucket = self._buckets.get(caller)
+            if bucket is not None:
+                self._buckets[caller] = (min(self.burst, bucket[0] + cost), bucket[1])
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "rate": self.rate,
+                "burst": self.burst,
+                "callers": len(self._buckets),
+                "rejected": self.limited,
+            }
+
+
+class AdmissionControl:
+    """Rate limits and separate concurrency budgets for queries and mutations."""
+
+    def __init__(self, max_queries: int = 8, max_mutations: int = 2, max_queue: int = 16,
+                 queue_timeout: float = 2.0, rate: float = 0.0, burst: float = 20.0):
+        self.budgets: Dict[str, ConcurrencyLimiter] = {
+            "query": ConcurrencyLimiter(max_queries, max_queue, queue_timeout),
+            "mutation": ConcurrencyLimiter(max_mutations, max_queue, queue_timeout),
+        }
+        self.rate_limiter = TokenBucketLimiter(rate, burst)
+        self.queue_timeout = queue_timeout
+
+    @classmethod
+    def from_config(cls, config) -> "AdmissionControl":
+        return cls(
+            max_queries=config['GRAPHQL_MAX_CONCURRENT_QUERIES'],
+            max_mutations=config['GRAPHQL_MAX_CONCURRENT_MUTATIONS'],
+            max_queue=config['GRAPHQL_MAX_QUEUE'],
+            queue_timeout=config['GRAPHQL_QUEUE_TIMEOUT'],
+            rate=config['GRAPHQL_RATE_LIMIT'],
+            burst=config['GRAPHQL_RATE_BURST'],
+        )
+
+    @contextmanager
+    def admit(self, caller: str, mutation: bool = False, cost: int = 1):
+        """
+        Hold a slot of the query or mutation budget for the body of the block.
+
+        Raises:
+            Rejected: The request costs more than the rate limit's burst (400),
+                the caller is over its rate limit (429), or the budget and its
+                queue are full (503, the tokens are refunded)
+        """
+        wait = self.rate_limiter.take(caller, cost)
+        if math.isinf(wait):
+            raise Rejected(400, "BATCH_TOO_LARGE",
+                           f"Request of {cost} operations exceeds the rate limit burst of "
+                           f"{self.rate_limiter.burst:g}")
+        if wait > 0:
+            raise Rejected(429, "RATE_LIMITED", "Rate limit exceeded, retry later", wait)
+        kind = "mutation" if mutation else "query"
+        budget = self.budgets[kind]
+        if not budget.acquire():
+            self.rate_limiter.refund(caller, cost)
+            raise Rejected(503, "SERVER_BUSY", f"Server is busy ({kind} capacity exhausted), retry later",
+                           max(self.queue_timeout, 1.0))
+        try:
+            yield
+        finally:
+            budget.release()
+
+    def stats(self) -> dict:
+        return {
+            "queries": self.budgets["query"].stats(),
+            "mutations": self.budgets["mutation"].stats(),
+            "rateLimit": self.rate_limiter.stats(),
+        }
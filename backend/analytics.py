@@ -0,0 +1,480 @@
+"""
+In-process columnar cache of invoice facts for the dashboard aggregates.
+
+Revenue by month, top suppliers and the markup distribution are aggregates
+over every invoice. Instead of scanning `materials_invoices` and
+`transactions` for each widget, the cache keeps one NumPy array per column:
+
+    invoice_id, client_id, supplier_id   int64
+    day                                  datetime64[D] (invoice date)
+    month                                int32 (months since 1970-01, from day)
+    base_cents, amount_cents             int64 (baseAmount, transaction amount)
+
+Archived invoices are included, so archiving does not change the figures.
+The arrays are loaded on first use and grown in place afterwards: invoices
+created through the ORM are appended when their transaction commits.
+Repricing re-reads only the repriced client's transaction amounts on the next
+query. Writes that leave the cached columns alone (settling sets status and
+paidDate) keep the cache. Any other write to a cached column (bulk statements
+such as archiving, and ORM updates or deletes) marks the cache stale, and the
+next query reloads it. Each process has its own cache, so it is also reloaded
+after ANALYTICS_CACHE_TTL seconds to pick up writes made by other processes.
+
+Loads and refreshes read the database without holding the cache's lock. One
+reader at a time does the reading, the others wait for its result, and the
+result replaces the columns in one step. Readers never see a half-built cache.
+
+NumPy is an optional dependency; without it (or with ANALYTICS_CACHE=0) the
+`invoiceAnalytics` query reports that analytics are unavailable.
+"""
+
+import logging
+import os
+import threading
+import time
+from datetime import date
+from decimal import Decimal
+from typing import Dict, List, Optional
+
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.orm import Session
+
+from models import (
+    db, MaterialsInvoice, Transaction, ArchivedMaterialsInvoice, ArchivedTransaction, cents_sql,
+)
+from cache import entity_cache
+from utils import to_global_id
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency
+    np = None
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = {
+    "invoice_id": "int64",
+    "client_id": "int64",
+    "supplier_id": "int64",
+    "day": "datetime64[D]",
+    "base_cents": "int64",
+    "amount_cents": "int64",
+    # Derived from day when rows are written; grouping by month is the hot path
+    "month": "int32",
+}
+# Columns given per row to `append`; the rest are derived
+ROW_COLUMNS = ("invoice_id", "client_id", "supplier_id", "day", "base_cents", "amount_cents")
+
+GROUP_BY = ("client", "supplier", "month")
+MEASURES = ("baseAmount", "amount", "markup")
+
+# Rows fetched from the cursor at a time while loading
+LOAD_BATCH_SIZE = 10000
+INITIAL_CAPACITY = 1024
+
+def _to_cents(value) -> int:
+    return int((Decimal(str(value)) * 100).to_integral_value())
+
+def _money(cents) -> Decimal:
+    return Decimal(int(cents)) / 100
+
+def parse_day(value: Optional[str]) -> Optional[date]:
+    """Parse a dateFrom/dateTo argument (YYYY-MM-DD)."""
+    if value is None:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid date: {value}. Expected YYYY-MM-DD")
+
+class AnalyticsView:
+    """Vectorized aggregates over a snapshot of the cached columns."""
+
+    def __init__(self, columns: Dict[str, "np.ndarray"], date_from: Optional[date] = None,
+                 date_to: Optional[date] = None):
+        if date_from is not None or date_to is not None:
+            mask = np.ones(len(columns["day"]), dtype=bool)
+            if date_from is not None:
+                mask &= columns["day"] >= np.datetime64(date_from, "D")
+            if date_to is not None:
+                mask &= columns["day"] <= np.datetime64(date_to, "D")
+            columns = {name: values[mask] for name, values in columns.items()}
+        self.columns = columns
+
+    @property
+    def count(self) -> int:
+        return len(self.columns["invoice_id"])
+
+    def _measure(self, measure: str) -> "np.ndarray":
+        if measure == "baseAmount":
+            return self.columns["base_cents"]
+        if measure == "amount":
+            return self.columns["amount_cents"]
+        if measure == "markup":
+            return self.columns["amount_cents"] - self.columns["base_cents"]
+        raise ValueError(f"Invalid measure: {measure}. Must be one of: {', '.join(MEASURES)}")
+
+    def total(self, measure: str) -> Decimal:
+        return _money(self._measure(measure).sum())
+
+    def groups(self, by: str, measure: str = "amount", first: Optional[int] = None) -> List[dict]:
+        """
+        Count and total of `measure` per client, supplier or month.
+
+        Months are returned in date order, clients and suppliers by descending total.
+        """
+        values = self._measure(measure)
+        if by == "client":
+            keys = self.columns["client_id"]
+        elif by == "supplier":
+            keys = self.columns["supplier_id"]
+        elif by == "month":
+            keys = self.columns["month"]
+        else:
+            raise ValueError(f"Invalid groupBy: {by}. Must be one of: {', '.join(GROUP_BY)}")
+        if len(keys) == 0:
+            return []
+
+        # Keys are dense (ids, months), so bincount groups in one linear pass.
+        # float64 weights add cents exactly up to 2**53.
+        offset = keys.min()
+        counts = np.bincount(keys - offset)
+        totals = np.bincount(keys - offset, weights=values)
+        present = np.flatnonzero(counts)
+        if by != "month":
+            present = present[np.argsort(-totals[present], kind="stable")]
+        if first is not None:
+            present = present[:max(first, 0)]
+
+        keys = [index + int(offset) for index in present.tolist()]
+        if by == "client":
+            counterparties = entity_cache.get_clients(keys)
+        elif by == "supplier":
+            counterparties = entity_cache.get_suppliers(keys)
+
+        groups = []
+        for index, key in zip(present.tolist(), keys):
+            if by == "client":
+                group = {"key": to_global_id("Client", key), "counterparty": counterparties.get(key)}
+            elif by == "supplier":
+                group = {"key": to_global_id("Supplier", key), "counterparty": counterparties.get(key)}
+            else:
+                group = {"key": str(np.datetime64(key, "M")), "counterparty": None}
+            group["count"] = int(counts[index])
+            group["total"] = _money(round(totals[index]))
+            groups.append(group)
+        return groups
+
+    def markup_histogram(self, bins: int = 10) -> List[dict]:
+        """Distribution of the effective markup rate (markup / baseAmount) over equal-width bins."""
+        if bins <= 0:
+            raise ValueError("bins must be positive")
+        base = self.columns["base_cents"]
+        priced = base > 0
+        if not priced.any():
+            return []
+        rates = (self.columns["amount_cents"][priced] - base[priced]) / base[priced]
+        counts, edges = np.histogram(rates, bins=bins)
+        return [{"low": float(edges[i]), "high": float(edges[i + 1]), "count": int(counts[i])}
+                for i in range(len(counts))]
+
+class AnalyticsCache:
+    """Growable NumPy columns of invoice facts, shared by the threads of a process."""
+
+    def __init__(self, ttl: float = 300.0, enabled: bool = True):
+        self.ttl = ttl
+        self.enabled = enabled
+        # Guards the fields below; never held while reading from the database
+        self._condition = threading.Condition()
+        self._columns: Optional[Dict[str, "np.ndarray"]] = None
+        self._size = 0
+        self._loaded_at = 0.0
+        self._loaded_max_id = 0
+        # Bumped by every invalidation; the columns reflect _loaded_generation
+        self._generation = 0
+        self._loaded_generation = -1
+        # Clients whose transaction amounts changed since the last refresh
+        self._repriced_clients = set()
+        # Set while one thread reads from the database for everyone
+        self._loading = False
+        # Rows appended during a full load, written once it is installed
+        self._appended_while_loading: Optional[List[tuple]] = None
+
+    @property
+    def available(self) -> bool:
+        return self.enabled and np is not None
+
+    def clear(self) -> None:
+        with self._condition:
+            self._columns = None
+            self._size = 0
+            self._generation += 1
+            self._repriced_clients.clear()
+
+    def invalidate(self) -> None:
+        """Reload from the database on the next query."""
+        with self._condition:
+            self._generation += 1
+
+    def reprice_clients(self, client_ids) -> None:
+        """Re-read the transaction amounts of these clients' invoices on the next query."""
+        with self._condition:
+            self._repriced_clients.update(client_ids)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def view(self, date_from: Optional[date] = None, date_to: Optional[date] = None) -> AnalyticsView:
+        """Aggregates over the current columns. Must be called inside an app context."""
+        return AnalyticsView(self._snapshot(), date_from, date_to)
+
+    def append(self, rows: List[tuple]) -> None:
+        """Append (invoice_id, client_id, supplier_id, day, base_cents, amount_cents) rows."""
+        with self._condition:
+            if self._appended_while_loading is not None:
+                self._appended_while_loading.extend(rows)
+            elif self._columns is not None and self._loaded_generation == self._generation:
+                self._append_new(rows)
+            # Otherwise the next load reads them from the database
+
+    def _snapshot(self) -> Dict[str, "np.ndarray"]:
+        """
+        Up to date columns, reading the database first if needed.
+
+        One thread at a time reads, without holding the lock, and installs its
+        result in one step; the others wait for it. A reader asks for the
+        invalidations and repricings made before it arrived, so a stream of
+        writes cannot keep it reloading forever.
+        """
+        with self._condition:
+            wanted_generation = self._generation
+            wanted_clients = set(self._repriced_clients)
+        while True:
+            with self._condition:
+                while self._loading:
+                    self._condition.wait()
+                if (self._columns is None or self._loaded_generation < wanted_generation
+                        or time.monotonic() - self._loaded_at > self.ttl):
+                    clients = None
+                    self._appended_while_loading = []
+                elif wanted_clients & self._repriced_clients:
+                    clients = set(self._repriced_clients)
+                else:
+                    # Appends write past _size or into new arrays, and repricing
+                    # replaces the amount column, so these views stay consistent
+                    return {name: values[:self._size] for name, values in self._columns.items()}
+                self._loading = True
+                generation = self._generation
+                self._repriced_clients.clear()
+
+            try:
+                if clients is None:
+                    loaded = self._load()
+                else:
+                    amounts = self._load_amounts(clients)
+            except BaseException:
+                with self._condition:
+                    self._loading = False
+                    self._appended_while_loading = None
+                    if clients is not None:
+                        self._repriced_clients.update(clients)
+                    self._condition.notify_all()
+                raise
+
+            with self._condition:
+                if clients is None:
+                    self._columns, self._size, self._loaded_max_id = loaded
+                    self._loaded_at = time.monotonic()
+                    self._loaded_generation = generation
+                    appended, self._appended_while_loading = self._appended_while_loading, None
+                    self._append_new(appended)
+                else:
+                    self._install_amounts(amounts)
+                self._loading = False
+                self._condition.notify_all()
+
+    def _append_new(self, rows):
+        # Committed before the last load, so already loaded
+        rows = [row for row in rows if row[0] > self._loaded_max_id]
+        if rows:
+            self._columns, self._size = _write(self._columns, self._size, rows)
+
+    def _load(self):
+        """Read every invoice into new columns: (columns, size, highest invoice id)."""
+        started = time.perf_counter()
+        columns = {name: np.empty(INITIAL_CAPACITY, dtype=dtype) for name, dtype in COLUMNS.items()}
+        size = 0
+        for invoice_class, transaction_class in ((MaterialsInvoice, Transaction),
+                                                 (ArchivedMaterialsInvoice, ArchivedTransaction)):
+            query = (
+                select(invoice_class.id, invoice_class.client_id, invoice_class.supplier_id,
+                       invoice_class.invoiceDate, cents_sql(invoice_class.baseAmount),
+                       func.coalesce(cents_sql(transaction_class.amount), 0))
+                .outerjoin(transaction_class, transaction_class.invoice_id == invoice_class.id)
+                # Every invoice gets a date on creation; an undated row has no month to group by
+                .where(invoice_class.invoiceDate.isnot(None))
+            )
+            result = db.session.execute(query, execution_options={"yield_per": LOAD_BATCH_SIZE})
+            for batch in result.partitions():
+                columns, size = _write(columns, size, batch)
+        max_id = int(columns["invoice_id"][:size].max()) if size else 0
+        logger.info(f"Loaded {size} invoices into the analytics cache "
+                    f"in {(time.perf_counter() - started) * 1000:.0f} ms")
+        return columns, size, max_id
+
+    @staticmethod
+    def _load_amounts(client_ids):
+        """(invoice ids, amount cents) of the live transactions of these clients' invoices."""
+        # Archived invoices are PAID, and repricing leaves PAID invoices alone
+        rows = db.session.execute(
+            select(Transaction.invoice_id, cents_sql(Transaction.amount))
+            .join(MaterialsInvoice, MaterialsInvoice.id == Transaction.invoice_id)
+            .where(MaterialsInvoice.client_id.in_(client_ids))
+        ).all()
+        invoice_ids = np.array([row[0] for row in rows], dtype=COLUMNS["invoice_id"])
+        amounts = np.array([row[1] for row in rows], dtype=COLUMNS["amount_cents"])
+        return invoice_ids, amounts
+
+    def _install_amounts(self, loaded):
+        invoice_ids, amounts = loaded
+        if len(invoice_ids) == 0:
+            return
+        order = np.argsort(invoice_ids)
+        invoice_ids, amounts = invoice_ids[order], amounts[order]
+        cached_ids = self._columns["invoice_id"][:self._size]
+        rows = np.flatnonzero(np.isin(cached_ids, invoice_ids))
+        # A new array rather than writes in place, which views handed out would see
+        repriced = self._columns["amount_cents"].copy()
+        repriced[rows] = amounts[np.searchsorted(invoice_ids, cached_ids[rows])]
+        self._columns = dict(self._columns, amount_cents=repriced)
+
+
+def _write(columns, size, rows):
+    """Write rows after the first `size` of the columns, growing them as needed."""
+    needed = size + len(rows)
+    capacity = len(columns["invoice_id"])
+    if needed > capacity:
+        while capacity < needed:
+            capacity *= 2
+        grown = {}
+        for name, values in columns.items():
+            grown[name] = np.empty(capacity, dtype=values.dtype)
+            grown[name][:size] = values[:size]
+        columns = grown
+
+    end = size + len(rows)
+    for index, name in enumerate(ROW_COLUMNS):
+        values = [row[index] for row in rows]
+        if name == "day":
+            values = [d.date() for d in values]
+        columns[name][size:end] = np.array(values, dtype=COLUMNS[name])
+    columns["month"][size:end] = columns["day"][size:end].astype("datetime64[M]").astype(COLUMNS["month"])
+    return columns, end
+
+analytics_cache = AnalyticsCache(
+    ttl=float(os.getenv('ANALYTICS_CACHE_TTL', '300')),
+    enabled=os.getenv('ANALYTICS_CACHE', '1').lower() not in ('0', 'false', 'no'),
+)
+
+
+# Keep the cache in step with committed writes
+_PENDING_KEY = 'analytics_pending'
+# Execution option naming the client whose transactions a bulk statement reprices
+REPRICED_CLIENT_OPTION = 'analytics_repriced_client'
+_CACHED_CLASSES = (MaterialsInvoice, Transaction, ArchivedMaterialsInvoice, ArchivedTransaction)
+# Attributes (and columns) the cache holds; writes to any other column leave it valid
+_CACHED_ATTRIBUTES = {
+    MaterialsInvoice: ("id", "client_id", "supplier_id", "invoiceDate", "baseAmount"),
+    ArchivedMaterialsInvoice: ("id", "client_id", "supplier_id", "invoiceDate", "baseAmount"),
+    Transaction: ("invoice_id", "amount"),
+    ArchivedTransaction: ("invoice_id", "amount"),
+}
+_CACHED_COLUMNS = {
+    model.__table__: frozenset(model.__table__.c[name].name for name in names)
+    for model, names in _CACHED_ATTRIBUTES.items()
+}
+
+
+def _pending(session) -> dict:
+    return session.info.setdefault(_PENDING_KEY, {"invoices": {}, "amounts": {}, "clients": set(),
+                                                  "stale": False})
+
+
+def _changes_cached_attributes(obj) -> bool:
+    state = inspect(obj)
+    return any(state.attrs[name].history.has_changes() for name in _CACHED_ATTRIBUTES[type(obj)])
+
+
+def _mark_stale(session) -> None:
+    _pending(session)["stale"] = True
+    analytics_cache.invalidate()
+
+
+def _on_after_flush(session, flush_context):
+    if not analytics_cache.available:
+        return
+    for obj in session.new:
+        if isinstance(obj, MaterialsInvoice) and obj.invoiceDate is not None:
+            _pending(session)["invoices"][obj.id] = (
+                obj.id, obj.client_id, obj.supplier_id, obj.invoiceDate, _to_cents(obj.baseAmount))
+        elif isinstance(obj, Transaction):
+            amounts = _pending(session)["amounts"]
+            amounts[obj.invoice_id] = amounts.get(obj.invoice_id, 0) + _to_cents(obj.amount)
+    if (any(isinstance(obj, _CACHED_CLASSES) for obj in session.deleted)
+            or any(isinstance(obj, _CACHED_CLASSES) and _changes_cached_attributes(obj) for obj in session.dirty)):
+        _mark_stale(session)
+
+
+def _updated_columns(statement) -> Optional[frozenset]:
+    # Column names set by an UPDATE ... VALUES, or None when they cannot be told
+    values = getattr(statement, "_values", None)
+    if not statement.is_update or not values:
+        return None
+    return frozenset(getattr(key, "name", key) for key in values)
+
+
+def _on_orm_execute(orm_execute_state):
+    # Core-style bulk statements (repricing, archiving, ...) bypass the flush hooks
+    statement = orm_execute_state.statement
+    if orm_execute_state.is_select or not analytics_cache.available:
+        return
+    table = getattr(statement, "table", None)
+    if table not in _CACHED_COLUMNS:
+        return
+    # Settling only sets status and paidDate, which the cache does not hold
+    updated = _updated_columns(statement)
+    if updated is not None and not updated & _CACHED_COLUMNS[table]:
+        return
+    repriced_client = orm_execute_state.execution_options.get(REPRICED_CLIENT_OPTION)
+    if repriced_client is not None and table.name == Transaction.__tablename__ and updated == {"amount"}:
+        _pending(orm_execute_state.session)["clients"].add(repriced_client)
+        return
+    _mark_stale(orm_execute_state.session)
+
+
+def _on_after_commit(session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending is None:
+        return
+    if pending["stale"]:
+        # A concurrent reader may have reloaded between flush and commit
+        analytics_cache.invalidate()
+        return
+    analytics_cache.append([
+        invoice + (pending["amounts"].get(invoice_id, 0),)
+        for invoice_id, invoice in sorted(pending["invoices"].items())
+    ])
+    if pending["clients"]:
+        analytics_cache.reprice_clients(pending["clients"])
+
+
+def _on_after_rollback(session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending is not None and pending["stale"]:
+        analytics_cache.invalidate()
+
+
+event.listen(Session, 'after_flush', _on_after_flush)
+event.listen(Session, 'do_orm_execute', _on_orm_execute)
+event.listen(Session, 'after_commit', _on_after_commit)
+event.listen(Session, 'after_rollback', _on_after_rollback)
@@ -18,25 +18,78 @@ Key Features:
 
 import os
 import sys
+import hmac
 import logging
-from flask import Flask, request, jsonify
-from flask_migrate import Migrate
+import weakref
+import click
+from flask import Flask, Response, g, make_response, request, jsonify, stream_with_context
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 from models import db
 from ariadne import graphql_sync
-from ariadne.explorer import ExplorerGraphiQL
 from schema import schema
+from cache import entity_cache
+from analytics import analytics_cache
+from jobs import JobRunner, run_jobs_command
+from archive import archive_invoices_command
+from reconcile import reconcile_ledger_command
+from statements import generate_statements_command
+from aging import iter_aging_csv, parse_as_of, PARTIES
+from responses import graphql_response, is_query_operation, parse_document, selected_operation
+from admission import AdmissionControl, Rejected, default_limits
+from deadlines import operation_deadline, deadline_middleware, collapse_deadline_errors
+from slow_queries import slow_query_log, graphql_operation
+from profiling import PROFILE_HEADER, ProfilerBusy, profiled
+from serialization import loads
+from persisted_queries import (
+    PersistedQueryStore, apply_persisted_query, parse_get_params, PERSISTED_QUERY_NOT_FOUND
+)
+from events import event_bus, PostgresEventRelay
 from sqlalchemy import text
+from sqlalchemy.engine import make_url
 
-def create_app(testing=False):
-    # Configure logging
+logger = logging.getLogger(__name__)
+
+_logging_configured = False
+
+def configure_logging():
+    """Configure process-wide logging once, however many apps are created."""
+    global _logging_configured
+    if _logging_configured:
+        return
     logging.basicConfig(
         level=logging.INFO,
         format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
         filename='app.log',
         filemode='a'
     )
-    logger = logging.getLogger(__name__)
+    _logging_configured = True
+
+def dispose_engines(app):
+    """
+    Drop the app's pooled database connections without closing them.
+
+    Called in a child process after fork: connections inherited from the parent
+    share its sockets and file handles, so the child must open its own. Passing
+    close=False leaves the parent's connections untouched.
+    """
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+# Apps whose pools are reset in forked children; fork hooks cannot be
+# unregistered, so a single hook serves every app created in this process
+_apps = weakref.WeakSet()
+
+def _dispose_engines_after_fork():
+    for app in list(_apps):
+        dispose_engines(app)
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_dispose_engines_after_fork)
+
+def create_app(testing=False):
+    configure_logging()
     
     app = Flask(__name__)
 
@@ -45,49 +98,315 @@ def create_app(testing=False):
     if testing:
         app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Threads serving requests in each server process (see gunicorn.conf.py and asgi.py)
+    app.config['WORKER_THREADS'] = int(os.getenv('GUNICORN_THREADS', '4'))
+    # "false" leaves background jobs to a `flask run-jobs` process instead of the web workers
+    app.config['JOBS_IN_PROCESS'] = os.getenv('JOBS_IN_PROCESS', 'true').lower() != 'false'
+    # Responses smaller than this many bytes are sent uncompressed
+    app.config['GRAPHQL_COMPRESS_MIN_SIZE'] = int(os.getenv('GRAPHQL_COMPRESS_MIN_SIZE', '1024'))
+    # Results with a list at least this long are streamed in chunks
+    app.config['GRAPHQL_STREAM_MIN_ITEMS'] = int(os.getenv('GRAPHQL_STREAM_MIN_ITEMS', '2000'))
+    # Seconds that shared caches may serve a GET query result without revalidating
+    app.config['GRAPHQL_GET_MAX_AGE'] = int(os.getenv('GRAPHQL_GET_MAX_AGE', '0'))
+    # Operations accepted in one batched POST
+    app.config['GRAPHQL_MAX_BATCH_SIZE'] = int(os.getenv('GRAPHQL_MAX_BATCH_SIZE', '10'))
+    # Admission control (see admission.py); limits are per worker process
+    # Defaults are sized to the worker's threads, or the limits could never be reached
+    limits = default_limits(app.config['WORKER_THREADS'])
+    app.config['GRAPHQL_MAX_CONCURRENT_QUERIES'] = int(os.getenv('GRAPHQL_MAX_CONCURRENT_QUERIES', limits['queries']))
+    app.config['GRAPHQL_MAX_CONCURRENT_MUTATIONS'] = int(os.getenv('GRAPHQL_MAX_CONCURRENT_MUTATIONS', limits['mutations']))
+    app.config['GRAPHQL_MAX_QUEUE'] = int(os.getenv('GRAPHQL_MAX_QUEUE', limits['queue']))
+    app.config['GRAPHQL_QUEUE_TIMEOUT'] = float(os.getenv('GRAPHQL_QUEUE_TIMEOUT', '2'))
+    app.config['GRAPHQL_RATE_LIMIT'] = float(os.getenv('GRAPHQL_RATE_LIMIT', '0'))
+    app.config['GRAPHQL_RATE_BURST'] = float(os.getenv('GRAPHQL_RATE_BURST', '20'))
+    # Reverse proxies in front of the app whose X-Forwarded-For/-Proto headers are trusted
+    app.config['TRUSTED_PROXIES'] = int(os.getenv('TRUSTED_PROXIES', '0'))
+    # Seconds each GraphQL operation may run, SQL included (see deadlines.py); 0 disables
+    app.config['GRAPHQL_OPERATION_TIMEOUT'] = float(os.getenv('GRAPHQL_OPERATION_TIMEOUT', '30'))
+    # Statements slower than this are kept with their plans (see slow_queries.py); 0 disables
+    app.config['SLOW_QUERY_THRESHOLD_MS'] = float(os.getenv('SLOW_QUERY_THRESHOLD_MS', '200'))
+    app.config['SLOW_QUERY_LOG_SIZE'] = int(os.getenv('SLOW_QUERY_LOG_SIZE', '200'))
+    # Bearer token for the /debug endpoints; unset disables them
+    app.config['DEBUG_TOKEN'] = os.getenv('DEBUG_TOKEN')
+    # Secret expected in the X-Profile header to profile a request (see profiling.py); unset disables it
+    app.config['PROFILE_TOKEN'] = os.getenv('PROFILE_TOKEN')
+    app.config['PROFILE_DIR'] = os.getenv('PROFILE_DIR', os.path.join(app.instance_path, 'profiles'))
+    # Relay artifacts whose operations are preloaded as persisted queries
+    app.config['PERSISTED_QUERIES_DIR'] = os.getenv(
+        'PERSISTED_QUERIES_DIR',
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'frontend', 'src', '__generated__')
+    )
 
     # Initialize database and migrations
     db.init_app(app)
-    migrate = Migrate(app, db)
+    # Pre-forking servers (gunicorn with preload_app) create the app once in the
+    # master; every worker then needs its own connection pool
+    _apps.add(app)
+
+    # Subscribers in other server processes hear about mutations through
+    # PostgreSQL NOTIFY; other databases keep events within the process
+    if event_bus.relay is not None:
+        event_bus.relay.close()
+    postgresql = make_url(app.config['SQLALCHEMY_DATABASE_URI']).get_backend_name() == 'postgresql'
+    event_bus.relay = PostgresEventRelay(app, event_bus) if postgresql else None
+    # Flask-Migrate imports Alembic, which is a large part of startup time; only
+    # the `flask db` commands need it, and those create the app inside a CLI context
+    if click.get_current_context(silent=True) is not None:
+        from flask_migrate import Migrate
+        Migrate(app, db)
+
+    # Cached snapshots and analytics columns belong to the previous database, start empty
+    entity_cache.clear()
+    analytics_cache.clear()
+    slow_query_log.configure(app.config['SLOW_QUERY_THRESHOLD_MS'], app.config['SLOW_QUERY_LOG_SIZE'])
 
     # Enable CORS so that React (on a different port) can make requests
     CORS(app)
 
+    # `flask archive-invoices` moves settled invoices into the archive tables
+    app.cli.add_command(archive_invoices_command)
+    # `flask reconcile-ledger` checks every invoice's transaction and debts
+    app.cli.add_command(reconcile_ledger_command)
+    # `flask generate-statements` writes a statement file per client
+    app.cli.add_command(generate_statements_command)
+    # `flask run-jobs` runs the jobs queued by web processes (see jobs.py)
+    app.cli.add_command(run_jobs_command)
+
+    # Background jobs run on a thread pool owned by the app, or in `flask run-jobs`
+    app.extensions['jobs'] = JobRunner(app, in_process=app.config['JOBS_IN_PROCESS'])
+
+    # Persisted queries: preload the frontend's Relay operations when available
+    persisted_queries = PersistedQueryStore()
+    if os.path.isdir(app.config['PERSISTED_QUERIES_DIR']):
+        persisted_queries.load_relay_artifacts(app.config['PERSISTED_QUERIES_DIR'])
+    app.extensions['persisted_queries'] = persisted_queries
+
+    # Concurrency budgets and rate limits in front of GraphQL execution
+    app.extensions['admission'] = AdmissionControl.from_config(app.config)
+    # Rate limits are per caller address, which behind a proxy is the proxy's own
+    if app.config['TRUSTED_PROXIES'] > 0:
+        proxies = app.config['TRUSTED_PROXIES']
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxies, x_proto=proxies)
+
     # GraphQL endpoints
+    explorer_html = []
+
     @app.route("/graphql", methods=["GET"])
     def graphql_playground():
-        # Serve GraphQL Playground for interactive queries
-        return ExplorerGraphiQL().html(None), 200
+        # Without parameters, serve GraphQL Playground for interactive queries.
+        # The explorer is imported and rendered on first use, then reused.
+        if not request.args:
+            if not explorer_html:
+                from ariadne.explorer import ExplorerGraphiQL
+                explorer_html.append(ExplorerGraphiQL().html(None))
+            return explorer_html[0], 200
+
+        # Otherwise this is a (persisted) query sent as query string parameters
+        try:
+            data = parse_get_params(request.args)
+        except ValueError as e:
+            return jsonify({"errors": [{"message": str(e)}]}), 400
+        return execute_graphql(data, read_only=True)
 
     @app.route("/graphql", methods=["POST"])
     def graphql_server():
-        # Handle GraphQL queries
-        data = request.get_json()
-        
+        if PROFILE_HEADER in request.headers:
+            return profiled_graphql_post()
+        return graphql_post()
+
+    def profiled_graphql_post():
+        token = app.config['PROFILE_TOKEN']
+        if not token:
+            return graphql_post()
+        if not hmac.compare_digest(request.headers[PROFILE_HEADER].encode(), token.encode()):
+            return jsonify({"errors": [{"message": "Invalid profiling token"}]}), 403
+        try:
+            with profiled(app.config['PROFILE_DIR']) as profile_id:
+                g.profile_id = profile_id
+                response = make_response(graphql_post())
+        except ProfilerBusy as e:
+            return jsonify({"errors": [{"message": str(e)}]}), 409
+        logger.info("Profiled GraphQL request %s into %s", profile_id, app.config['PROFILE_DIR'])
+        response.headers['X-Profile-Id'] = profile_id
+        return response
+
+    def graphql_post():
+        # Handle GraphQL queries, decoding JSON bodies with the fast decoder
+        if not request.is_json:
+            return execute_graphql(request.get_json())
+        try:
+            data = loads(request.get_data())
+        except ValueError:
+            return jsonify({"errors": [{"message": "Request body is not valid JSON"}]}), 400
+        if isinstance(data, list):
+            return execute_graphql_batch(data)
+        return execute_graphql(data)
+
+    def admitted(mutation, cost=1):
+        # Callers are told apart by address, taken from X-Forwarded-For with TRUSTED_PROXIES
+        return app.extensions['admission'].admit(request.remote_addr or "", mutation=mutation, cost=cost)
+
+    def rejection_response(rejected):
+        response = jsonify({"errors": [{
+            "message": rejected.message,
+            "extensions": {"code": rejected.code},
+        }]})
+        response.status_code = rejected.status_code
+        if rejected.retry_after_header is not None:
+            response.headers['Retry-After'] = rejected.retry_after_header
+        return response
+
+    def graphql_context():
+        # Loaders memoize lookups for the whole HTTP request (see schema.request_cached)
+        return {"request": request, "loaders": {}}
+
+    def run_graphql(data, context, document=None):
         # Enhanced logging for debugging
         logger.info("=" * 80)
         logger.info("GraphQL Request from: %s", request.remote_addr)
         logger.info("Request Headers: %s", dict(request.headers))
-        logger.info("GraphQL Query: %s", data.get('query') if data else None)
-        logger.info("GraphQL Variables: %s", data.get('variables') if data else None)
-        
-        success, result = graphql_sync(
-            schema,
-            data,
-            context_value={"request": request},
-            debug=app.debug
-        )
-        
-        # Log response data
+        logger.info("GraphQL Query: %s", data.get('query') if isinstance(data, dict) else None)
+        logger.info("GraphQL Variables: %s", data.get('variables') if isinstance(data, dict) else None)
+
+        timeout = app.config['GRAPHQL_OPERATION_TIMEOUT']
+        # Named from the document: Relay does not send operationName
+        operation = selected_operation(data, document)
+        operation_name = operation.name.value if operation is not None and operation.name else "anonymous"
+        with operation_deadline(timeout), graphql_operation(operation_name):
+            success, result = graphql_sync(
+                schema,
+                data,
+                context_value=context,
+                debug=app.debug,
+                middleware=[deadline_middleware] if timeout > 0 else None,
+                # Parsed once up front; None lets Ariadne parse and report syntax errors
+                query_document=document
+            )
+        result = collapse_deadline_errors(result)
+        profile_id = g.get('profile_id')
+        if profile_id is not None:
+            result.setdefault("extensions", {})["profile"] = {"id": profile_id}
+
+        # Log response data; formatting large results is expensive, so only at debug level
         if success:
-            logger.info("GraphQL Response: %s", result)
+            logger.debug("GraphQL Response: %s", result)
         else:
             logger.error("GraphQL Errors: %s", result.get('errors'))
-        
+
         logger.info("=" * 80)
-        
+        return success, result
+
+    def execute_graphql_batch(operations):
+        # Relay's batching network layer sends an array of operations and expects
+        # an array of results in the same order. The operations run one after
+        # another on this request's session and share its loader cache.
+        max_size = app.config['GRAPHQL_MAX_BATCH_SIZE']
+        if not operations:
+            return jsonify({"errors": [{"message": "Batch must contain at least one operation"}]}), 400
+        if len(operations) > max_size:
+            return jsonify({"errors": [{
+                "message": f"Batch of {len(operations)} operations exceeds the limit of {max_size}"
+            }]}), 400
+
+        # (data, document, is_query, error_result) per operation; errors are answered without running
+        resolved = []
+        for data in operations:
+            data, error_result = apply_persisted_query(data, persisted_queries)
+            document = parse_document(data) if error_result is None else None
+            is_query = error_result is None and is_query_operation(data, document)
+            resolved.append((data, document, is_query, error_result))
+        runnable = [is_query for _, _, is_query, error_result in resolved if error_result is None]
+
+        context = graphql_context()
+        results = []
+        cacheable = len(runnable) == len(resolved)
+        # The whole batch takes one slot, from the mutation budget if it writes at all
+        try:
+            with admitted(mutation=not all(runnable), cost=len(operations)):
+                for data, document, is_query, error_result in resolved:
+                    if error_result is not None:
+                        results.append(error_result)
+                        continue
+                    success, result = run_graphql(data, context, document)
+                    if not is_query:
+                        # Later operations must see what a mutation wrote
+                        context["loaders"].clear()
+                    cacheable = cacheable and success and not result.get('errors') and is_query
+                    results.append(result)
+        except Rejected as rejected:
+            return rejection_response(rejected)
+        return graphql_response(results, 200, cacheable=cacheable)
+
+    def execute_graphql(data, read_only=False):
+        # Resolve the query text from the persisted store if only a hash was sent
+        data, error_result = apply_persisted_query(data, persisted_queries)
+        if error_result is not None:
+            # Clients detect a miss from the error message, not the status code
+            not_found = error_result['errors'][0]['message'] == PERSISTED_QUERY_NOT_FOUND
+            return jsonify(error_result), 200 if not_found else 400
+
+        # GET requests may be replayed by caches and browsers, so they must not write
+        document = parse_document(data)
+        is_query = is_query_operation(data, document)
+        if read_only and not is_query:
+            response = jsonify({"errors": [{"message": "Only query operations can be sent with GET"}]})
+            response.status_code = 405
+            response.headers['Allow'] = 'POST'
+            return response
+
+        try:
+            with admitted(mutation=not is_query):
+                success, result = run_graphql(data, graphql_context(), document)
+        except Rejected as rejected:
+            return rejection_response(rejected)
         status_code = 200 if success else 400
-        return jsonify(result), status_code
+        cacheable = success and not result.get('errors') and is_query
+        response = graphql_response(result, status_code, cacheable=cacheable)
+        if read_only and cacheable and response.status_code == 200:
+            max_age = app.config['GRAPHQL_GET_MAX_AGE']
+            response.headers['Cache-Control'] = f"public, max-age={max_age}" if max_age > 0 else "public, no-cache"
+        return response
+
+    @app.route('/reports/aging.csv', methods=['GET'])
+    def aging_report_csv():
+        """Per-counterparty aging rows, streamed as CSV while the cursor is read."""
+        party = request.args.get('party', 'client')
+        try:
+            as_of = parse_as_of(request.args.get('asOf', ''))
+        except ValueError as e:
+            return jsonify({"errors": [{"message": str(e)}]}), 400
+        if party not in PARTIES:
+            return jsonify({"errors": [{"message": f"Invalid party: {party}. Must be one of: {', '.join(PARTIES)}"}]}), 400
+
+        response = Response(stream_with_context(iter_aging_csv(as_of, party)), mimetype='text/csv')
+        response.headers['Content-Disposition'] = f'attachment; filename="aging-{party}-{as_of.isoformat()}.csv"'
+        return response
+
+    @app.route('/metrics/admission', methods=['GET'])
+    def admission_metrics():
+        """Queue depths, active operations and rejection counts of this worker process."""
+        return jsonify(app.extensions['admission'].stats()), 200
+
+    def debug_authorized():
+        token = app.config['DEBUG_TOKEN']
+        supplied = request.headers.get('Authorization', '')
+        return bool(token) and hmac.compare_digest(supplied.encode(), f"Bearer {token}".encode())
+
+    @app.route('/debug/slow-queries', methods=['GET'])
+    def slow_queries_report():
+        """Recent slow SQL statements and per-fingerprint stats of this worker process."""
+        if not app.config['DEBUG_TOKEN']:
+            return jsonify({"error": "Not found"}), 404
+        if not debug_authorized():
+            response = jsonify({"error": "Unauthorized"})
+            response.status_code = 401
+            response.headers['WWW-Authenticate'] = 'Bearer'
+            return response
+        return jsonify({
+            "thresholdMs": slow_query_log.threshold_ms,
+            "recent": slow_query_log.recent(),
+            "fingerprints": slow_query_log.fingerprints(),
+        }), 200
 
     @app.route('/healthcheck', methods=['GET'])
     def healthcheck():
@@ -118,8 +437,12 @@ if __name__ == '__main__':
     host = os.environ.get('HOST', '0.0.0.0')
     debug = os.environ.get('DEBUG', 'false').lower() == 'true'
     
-    logger = logging.getLogger(__name__)
     logger.info(f"Starting server on {host}:{port}, debug={debug}")
     
     app = create_app()
+    # Bring the schema up to date, skipping Alembic entirely when it already is
+    from db_migrations import upgrade_if_needed, check_storage_mode
+    upgrade_if_needed(app)
+    check_storage_mode(app)
+    app.extensions['jobs'].fail_interrupted()
     app.run(host=host, port=port, debug=debug)
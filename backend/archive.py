@@ -0,0 +1,165 @@
+"""
+Archival of settled invoices into cold archive tables.
+
+`materials_invoices`, `transactions` and `debts` only need to hold open
+business. `archive_paid_invoices` moves PAID invoices dated before a cutoff,
+together with their transaction and debts, into the `archived_*` tables:
+
+- Candidates are moved in chunks, each chunk in its own transaction with
+  INSERT ... SELECT followed by DELETE, so a row is always in exactly one of
+  the two tables and debt totals over both never change.
+- Rows keep their ids, so global IDs stay valid and connections can merge hot
+  and archived rows in id order (`includeArchived`).
+- The newest row of each hot table is never archived: SQLite hands out
+  max(id) + 1 as the next id, and moving the newest row away would let a new
+  invoice reuse an archived id.
+
+Run from the command line:
+
+    flask archive-invoices --before 2024-01-01 --chunk-size 500
+
+or as the `archive_invoices` background job.
+"""
+
+import logging
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import and_, delete, func, insert, literal, select
+
+from models import (
+    db, MaterialsInvoice, Transaction, Debt, InvoiceStatus,
+    ArchivedMaterialsInvoice, ArchivedTransaction, ArchivedDebt,
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 500
+
+# Hot model -> archive model with the same columns plus archivedDate
+ARCHIVE_MODELS = {
+    MaterialsInvoice: ArchivedMaterialsInvoice,
+    Transaction: ArchivedTransaction,
+    Debt: ArchivedDebt,
+}
+
+class ArchiveError(Exception):
+    """Raised when a chunk would not move every row intact; the chunk is rolled back."""
+
+def archivable_invoice_ids(cutoff: datetime) -> List[int]:
+    """Ids of PAID invoices dated before `cutoff` that may be archived, in id order."""
+    newest_transaction = select(func.max(Transaction.id)).scalar_subquery()
+    newest_debt = select(func.max(Debt.id)).scalar_subquery()
+    query = (
+        select(MaterialsInvoice.id)
+        .where(MaterialsInvoice.status == InvoiceStatus.PAID)
+        .where(MaterialsInvoice.invoiceDate < cutoff)
+        .where(MaterialsInvoice.id < select(func.max(MaterialsInvoice.id)).scalar_subquery())
+        .where(~select(Transaction.id).where(and_(
+            Transaction.invoice_id == MaterialsInvoice.id, Transaction.id == newest_transaction)).exists())
+        .where(~select(Debt.id).where(and_(
+            Debt.invoice_id == MaterialsInvoice.id, Debt.id == newest_debt)).exists())
+        .order_by(MaterialsInvoice.id)
+    )
+    return list(db.session.execute(query).scalars())
+
+def _copy_rows(model_class, where, archived_at: datetime) -> int:
+    """INSERT ... SELECT matching rows into the archive table; returns the row count."""
+    archive_class = ARCHIVE_MODELS[model_class]
+    columns = [column.name for column in model_class.__table__.columns]
+    return db.session.execute(
+        insert(archive_class).from_select(
+            columns + ['archivedDate'],
+            select(*(model_class.__table__.c[name] for name in columns),
+                   literal(archived_at, archive_class.archivedDate.type)).where(where),
+        )
+    ).rowcount
+
+def archive_chunk(invoice_ids: List[int], archived_at: Optional[datetime] = None) -> Dict[str, int]:
+    """
+    Move a chunk of invoices with their transactions and debts, then commit.
+
+    Invoices that stopped being PAID since they were selected are skipped.
+    """
+    archived_at = archived_at or datetime.utcnow()
+    try:
+        # Re-check the status inside this transaction; the candidate list may be stale
+        invoice_ids = list(db.session.execute(
+            select(MaterialsInvoice.id)
+            .where(MaterialsInvoice.id.in_(invoice_ids))
+            .where(MaterialsInvoice.status == InvoiceStatus.PAID)
+        ).scalars())
+
+        wheres = {
+            MaterialsInvoice: MaterialsInvoice.id.in_(invoice_ids),
+            Transaction: Transaction.invoice_id.in_(invoice_ids),
+            Debt: Debt.invoice_id.in_(invoice_ids),
+        }
+        # Parents go into the archive first and leave the hot tables last
+        counts = {model_class: _copy_rows(model_class, where, archived_at)
+                  for model_class, where in wheres.items()}
+        for model_class in (Debt, Transaction, MaterialsInvoice):
+            deleted = db.session.execute(delete(model_class).where(wheres[model_class])).rowcount
+            if deleted != counts[model_class]:
+                raise ArchiveError(
+                    f"Copied {counts[model_class]} rows into {ARCHIVE_MODELS[model_class].__tablename__} "
+                    f"but deleted {deleted} from {model_class.__tablename__}")
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return {
+        "invoices": counts[MaterialsInvoice],
+        "transactions": counts[Transaction],
+        "debts": counts[Debt],
+    }
+
+def archive_paid_invoices(cutoff: datetime, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                          progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, int]:
+    """
+    Archive PAID invoices dated before `cutoff`, one committed chunk at a time.
+
+    Args:
+        cutoff: Invoices dated strictly before this are archived
+        chunk_size: Invoices moved per transaction
+        progress: Called with (invoices processed, total candidates) after each chunk
+
+    Returns:
+        Number of invoices, transactions and debts moved
+    """
+    if chunk_size <= 0:
+        raise ValueError("chunk_size must be positive")
+
+    invoice_ids = archivable_invoice_ids(cutoff)
+    # Release the read transaction before the first write
+    db.session.rollback()
+    totals = {"invoices": 0, "transactions": 0, "debts": 0}
+    logger.info(f"Archiving {len(invoice_ids)} PAID invoices dated before {cutoff.isoformat()}")
+
+    for start in range(0, len(invoice_ids), chunk_size):
+        moved = archive_chunk(invoice_ids[start:start + chunk_size])
+        for key, count in moved.items():
+            totals[key] += count
+        if progress is not None:
+            progress(min(start + chunk_size, len(invoice_ids)), len(invoice_ids))
+
+    logger.info(f"Archived {totals['invoices']} invoices, {totals['transactions']} transactions "
+                f"and {totals['debts']} debts")
+    return totals
+
+@click.command('archive-invoices')
+@click.option('--before', 'cutoff', required=True, type=click.DateTime(formats=['%Y-%m-%d']),
+              help='Archive PAID invoices dated before this day (YYYY-MM-DD).')
+@click.option('--chunk-size', default=DEFAULT_CHUNK_SIZE, show_default=True,
+              help='Invoices moved per transaction.')
+@with_appcontext
+def archive_invoices_command(cutoff, chunk_size):
+    """Move settled invoices into the archive tables."""
+    totals = archive_paid_invoices(
+        cutoff, chunk_size,
+        progress=lambda done, total: click.echo(f"{done}/{total} invoices processed"),
+    )
+    click.echo(f"Archived {totals['invoices']} invoices, {totals['transactions']} transactions "
+               f"and {totals['debts']} debts")
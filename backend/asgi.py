@@ -0,0 +1,77 @@
+"""
+ASGI entry point: GraphQL subscriptions over WebSockets next to the Flask app.
+
+WebSocket connections to /graphql are handled by Ariadne using the
+graphql-transport-ws protocol (the one spoken by the `graphql-ws` client);
+every other request is passed through to the Flask app unchanged, on a pool
+of WORKER_THREADS threads. Mutations reach subscribers through the event bus,
+which relays them between server processes on PostgreSQL (see events.py).
+
+This is the production entry point (see gunicorn.conf.py):
+
+    gunicorn -c gunicorn.conf.py "asgi:create_asgi_app()"
+"""
+
+import functools
+
+from a2wsgi import WSGIMiddleware
+from ariadne import make_executable_schema
+from ariadne.asgi import GraphQL
+from ariadne.asgi.handlers import GraphQLTransportWSHandler
+from graphql import GraphQLObjectType, default_field_resolver
+
+from app import create_app
+from schema import type_defs, bindables
+
+def bind_app_context(schema, flask_app):
+    """
+    Wrap every field resolver of `schema` in its own Flask app context.
+
+    Subscription events are executed on the event loop, outside any Flask
+    request, and an app context cannot safely span the awaits between events.
+    Resolvers here are synchronous, so each one gets a short-lived context.
+    """
+    def wrap(resolver):
+        @functools.wraps(resolver)
+        def resolve_in_app_context(obj, info, **kwargs):
+            with flask_app.app_context():
+                return resolver(obj, info, **kwargs)
+        return resolve_in_app_context
+
+    for type_name, graphql_type in schema.type_map.items():
+        if type_name.startswith("__") or not isinstance(graphql_type, GraphQLObjectType):
+            continue
+        for field in graphql_type.fields.values():
+            field.resolve = wrap(field.resolve or default_field_resolver)
+    return schema
+
+def create_asgi_app(flask_app=None):
+    """Build the ASGI application around a Flask app."""
+    flask_app = flask_app or create_app()
+
+    # A separate schema instance, so the WSGI path keeps unwrapped resolvers
+    subscription_schema = bind_app_context(make_executable_schema(type_defs, *bindables), flask_app)
+    graphql_ws = GraphQL(
+        subscription_schema,
+        websocket_handler=GraphQLTransportWSHandler(),
+        debug=flask_app.debug,
+    )
+    wsgi = WSGIMiddleware(flask_app, workers=flask_app.config['WORKER_THREADS'])
+
+    async def application(scope, receive, send):
+        if scope["type"] == "websocket" and scope["path"] == "/graphql":
+            await graphql_ws(scope, receive, send)
+        elif scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    flask_app.extensions['jobs'].shutdown(wait=False)
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        else:
+            await wsgi(scope, receive, send)
+
+    application.flask_app = flask_app
+    return application
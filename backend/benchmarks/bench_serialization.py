@@ -0,0 +1,108 @@
+"""
+Benchmark JSON encoding of large GraphQL connection responses.
+
+Compares Flask's default `jsonify` encoding with the fast path in
+serialization.py (orjson when installed) and with the streaming encoder, on a
+synthetic `invoices` page with nested client/supplier/debts, and optionally end
+to end through the /graphql endpoint.
+
+Usage:
+    python benchmarks/bench_serialization.py [--edges 10000] [--repeat 5] [--e2e]
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from datetime import date
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from serialization import dumps, iter_encode, orjson
+
+def invoices_result(edges):
+    """A GraphQL result shaped like the frontend's invoice list query."""
+    return {"data": {"invoices": {
+        "edges": [{
+            "node": {
+                "id": f"TWF0ZXJpYWxzSW52b2ljZTo{i}",
+                "invoiceDate": "2024-01-15",
+                "baseAmount": 1000.5 + i,
+                "status": "UNPAID",
+                "client": {"id": "Q2xpZW50OjE=", "name": "Test Client", "markup_rate": 0.15},
+                "supplier": {"id": "U3VwcGxpZXI6MQ==", "name": "Test Supplier"},
+                "debts": {"edges": [
+                    {"node": {"party": "client", "amount": 1150.58 + i}},
+                    {"node": {"party": "supplier", "amount": 1000.5 + i}},
+                ]},
+            },
+            "cursor": str(i),
+        } for i in range(edges)],
+        "pageInfo": {"hasNextPage": False, "hasPreviousPage": False,
+                     "startCursor": "0", "endCursor": str(edges - 1)},
+    }}}
+
+def measure(label, func, repeat):
+    """Print best wall time and peak traced memory for func()."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<32} {best * 1000:>9.1f} ms {peak / 1024 / 1024:>9.1f} MiB peak")
+
+def run_serialization(edges, repeat):
+    result = invoices_result(edges)
+    flask_app = Flask(__name__)
+
+    def drain(chunks):
+        for _ in chunks:
+            pass
+
+    print(f"Encoding a {edges}-edge invoices result (orjson {'available' if orjson else 'not installed'})")
+    with flask_app.app_context():
+        measure("flask jsonify (stdlib)", lambda: flask_app.json.response(result).get_data(), repeat)
+    measure("serialization.dumps", lambda: dumps(result), repeat)
+    measure("serialization.iter_encode", lambda: drain(iter_encode(result)), repeat)
+
+def run_end_to_end(edges, repeat):
+    from app import create_app
+    from models import db, Client, Supplier, MaterialsInvoice, InvoiceStatus
+
+    app = create_app(testing=True)
+    with app.app_context():
+        db.create_all()
+        client = Client(name="Bench Client", markup_rate=Decimal("0.15"))
+        supplier = Supplier(name="Bench Supplier")
+        db.session.add_all([client, supplier])
+        db.session.flush()
+        db.session.bulk_save_objects([
+            MaterialsInvoice(client_id=client.id, supplier_id=supplier.id, invoiceDate=date(2024, 1, 15),
+                             baseAmount=Decimal("1000.50"), status=InvoiceStatus.UNPAID)
+            for _ in range(edges)
+        ])
+        db.session.commit()
+
+    query = ("{ invoices(first: %d) { edges { node { id invoiceDate baseAmount status "
+             "client { id name } supplier { id name } } cursor } } }" % edges)
+    test_client = app.test_client()
+    print(f"End to end POST /graphql returning {edges} invoices")
+    measure("POST /graphql", lambda: test_client.post('/graphql', json={'query': query}).get_data(), repeat)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark GraphQL response serialization.")
+    parser.add_argument("--edges", type=int, default=10000, help="Number of edges in the result")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed repetitions per encoder")
+    parser.add_argument("--e2e", action="store_true", help="Also benchmark the /graphql endpoint end to end")
+    args = parser.parse_args()
+
+    run_serialization(args.edges, args.repeat)
+    if args.e2e:
+        run_end_to_end(args.edges, args.repeat)
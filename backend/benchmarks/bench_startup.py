@@ -0,0 +1,59 @@
+"""
+Benchmark worker cold start.
+
+Each run starts a fresh interpreter and times the phases a new worker goes
+through: importing the app module, `create_app()`, and serving its first
+GraphQL request. Reports the median and worst run per phase.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 10]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in the child interpreter; prints phase timings as JSON
+CHILD_SCRIPT = """
+import json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+flask_app = app.create_app(testing=True)
+created = time.perf_counter()
+with flask_app.app_context():
+    app.db.create_all()
+response = flask_app.test_client().post('/graphql', json={'query': '{ clients(first: 1) { edges { cursor } } }'})
+assert response.status_code == 200, response.data
+served = time.perf_counter()
+print(json.dumps({
+    "import app": imported - start,
+    "create_app()": created - imported,
+    "first request": served - created,
+    "total": served - start,
+}))
+"""
+
+def run_once():
+    started = subprocess.run(
+        [sys.executable, "-c", CHILD_SCRIPT],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+    )
+    return json.loads(started.stdout.strip().splitlines()[-1])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark application cold start.")
+    parser.add_argument("--runs", type=int, default=10, help="Number of fresh interpreters to start")
+    args = parser.parse_args()
+
+    runs = [run_once() for _ in range(args.runs)]
+    print(f"Cold start over {args.runs} runs")
+    print(f"{'phase':<16} {'median':>10} {'max':>10}")
+    for phase in runs[0]:
+        values = [run[phase] * 1000 for run in runs]
+        print(f"{phase:<16} {statistics.median(values):>8.1f}ms {max(values):>8.1f}ms")
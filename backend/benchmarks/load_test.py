@@ -0,0 +1,384 @@
+"""
+Load test a running backend with the frontend's real GraphQL operations.
+
+Operations are read from the Relay artifacts in frontend/src/__generated__ and
+the `graphql` tagged templates in frontend/src/mutations; operations that only
+exist for frontend tests are skipped. Their variables are filled in from the
+names the frontend uses: page sizes (`first`, `clientsFirst`, ...) get the
+frontend's page size, `id` a random client, supplier or invoice, and
+`clientId`, `supplierId`, `invoiceDate`, `baseAmount` a random client, a random
+supplier, today and a random amount. Ids are sampled from the server before
+the run starts, so the database needs at least one client and supplier
+(`python seed.py --seed`).
+
+Concurrency ramps through stages. In each stage a number of worker threads
+(one keep-alive connection each) send operations picked from a weighted mix
+for a fixed time. Every stage reports per operation:
+- throughput
+- latency percentiles
+- error rate, split into HTTP errors, GraphQL errors and connection errors
+
+A JSON report records the git commit and all settings. Pass an earlier report
+to --compare to print the differences, so runs can be compared between
+commits. Use the same --seed, stages, mix and database for a fair comparison.
+
+Usage:
+    python benchmarks/load_test.py [--url http://localhost:5000/graphql]
+        [--stages 1,4,8,16] [--stage-duration 10]
+        [--mix ClientListQuery=4,CreateMaterialsInvoiceMutation=1]
+        [--output report.json] [--compare baseline.json]
+
+The default mix weights every query 4 and every mutation 1. Against SQLite,
+concurrent mutations may fail with "database is locked"; they are counted as
+errors like any other. The load generator shares one Python process with its
+threads. Past a few dozen workers it can become the bottleneck, so watch its
+CPU use.
+"""
+
+import argparse
+import glob
+import http.client
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import date, datetime, timezone
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from graphql import parse, OperationDefinitionNode, NonNullTypeNode
+from persisted_queries import RELAY_TEXT_PATTERN
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+FRONTEND_SRC = os.path.join(REPO_ROOT, 'frontend', 'src')
+# Page size the frontend's list components request
+PAGE_SIZE = 10
+DEFAULT_WEIGHTS = {"query": 4, "mutation": 1}
+PERCENTILES = (50, 90, 99)
+
+GRAPHQL_TAG_PATTERN = re.compile(r"graphql`([^`]*)`")
+SAMPLE_IDS_QUERY = """
+query LoadTestSampleIds($first: Int) {
+  clients(first: $first) { edges { node { id } } }
+  suppliers(first: $first) { edges { node { id } } }
+  invoices(first: $first) { edges { node { id } } }
+}
+"""
+
+@dataclass
+class Operation:
+    name: str
+    kind: str
+    text: str
+    # (variable name, required)
+    variables: List[tuple] = field(default_factory=list)
+
+def parse_operation(text: str) -> Optional[Operation]:
+    definitions = [d for d in parse(text).definitions if isinstance(d, OperationDefinitionNode)]
+    if len(definitions) != 1 or definitions[0].name is None:
+        return None
+    definition = definitions[0]
+    variables = [(v.variable.name.value, isinstance(v.type, NonNullTypeNode) and v.default_value is None)
+                 for v in definition.variable_definitions]
+    return Operation(definition.name.value, definition.operation.value, text, variables)
+
+def load_operations(src_dir: str = FRONTEND_SRC) -> Dict[str, Operation]:
+    """The frontend's operations by name, from Relay artifacts and mutation modules."""
+    texts = []
+    for path in sorted(glob.glob(os.path.join(src_dir, '__generated__', '*.graphql.ts'))):
+        with open(path, encoding="utf-8") as f:
+            match = RELAY_TEXT_PATTERN.search(f.read())
+        if match:
+            texts.append(json.loads(match.group(1)))
+    for path in sorted(glob.glob(os.path.join(src_dir, 'mutations', '*.ts'))):
+        with open(path, encoding="utf-8") as f:
+            texts.extend(GRAPHQL_TAG_PATTERN.findall(f.read()))
+
+    operations = {}
+    for text in texts:
+        operation = parse_operation(text)
+        # Artifacts win over the templates they were compiled from; test-only operations are skipped
+        if operation is None or "Test" in operation.name or operation.name in operations:
+            continue
+        operations[operation.name] = operation
+    return operations
+
+
+class GraphQLClient:
+    """A keep-alive HTTP connection posting GraphQL operations."""
+
+    def __init__(self, url: str, timeout: float = 30.0):
+        parts = urlsplit(url)
+        connection_class = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+        self.path = parts.path or "/graphql"
+        self._connect = lambda: connection_class(parts.netloc, timeout=timeout)
+        self._connection = self._connect()
+
+    def post(self, name: str, query: str, variables: dict):
+        """Send an operation and return (HTTP status, decoded body)."""
+        body = json.dumps({"query": query, "operationName": name, "variables": variables})
+        try:
+            self._connection.request("POST", self.path, body, {"Content-Type": "application/json"})
+            response = self._connection.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            # Start over on a fresh connection next time
+            self._connection.close()
+            self._connection = self._connect()
+            raise
+        return response.status, json.loads(data) if data else None
+
+    def close(self):
+        self._connection.close()
+
+def sample_ids(url: str) -> Dict[str, List[str]]:
+    client = GraphQLClient(url)
+    try:
+        status, body = client.post("LoadTestSampleIds", SAMPLE_IDS_QUERY, {"first": 100})
+    finally:
+        client.close()
+    if status != 200 or not body or body.get("errors"):
+        raise RuntimeError(f"Could not sample ids from {url}: HTTP {status} {body}")
+    return {kind: [edge["node"]["id"] for edge in body["data"][kind]["edges"]]
+            for kind in ("clients", "suppliers", "invoices")}
+
+def make_variables(operation: Operation, ids: Dict[str, List[str]], rng: random.Random) -> Optional[dict]:
+    """Variables for one call of the operation, or None if a required one cannot be filled."""
+    variables = {}
+    for name, required in operation.variables:
+        value = None
+        if name == "first" or name.endswith("First"):
+            value = PAGE_SIZE
+        elif name == "id":
+            value = rng.choice(ids["clients"] + ids["suppliers"] + ids["invoices"])
+        elif name == "clientId" and ids["clients"]:
+            value = rng.choice(ids["clients"])
+        elif name == "supplierId" and ids["suppliers"]:
+            value = rng.choice(ids["suppliers"])
+        elif name == "invoiceDate":
+            value = date.today().isoformat()
+        elif name == "baseAmount":
+            value = round(rng.uniform(10, 1000), 2)
+        if value is not None:
+            variables[name] = value
+        elif required:
+            return None
+    return variables
+
+def parse_mix(spec: Optional[str], operations: Dict[str, Operation]) -> Dict[str, float]:
+    """Operation weights from "Name=weight,..." or the default mix."""
+    if not spec:
+        return {name: DEFAULT_WEIGHTS[op.kind] for name, op in operations.items()}
+    weights = {}
+    for item in spec.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in operations:
+            raise ValueError(f"Unknown operation: {name}. Known: {', '.join(sorted(operations))}")
+        weights[name] = float(weight or 1)
+    return weights
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, min(len(sorted_values), round(p / 100 * len(sorted_values) + 0.5)))
+    return sorted_values[rank - 1]
+
+
+class StageRecorder:
+    """Latencies and error counts of one stage, per operation."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(lambda: defaultdict(int))
+        self._lock = threading.Lock()
+
+    def record(self, name: str, latency: float, error: Optional[str]) -> None:
+        with self._lock:
+            self.latencies[name].append(latency)
+            if error is not None:
+                self.errors[name][error] += 1
+
+    def summary(self, duration: float) -> Dict[str, dict]:
+        operations = {}
+        for name in sorted(self.latencies):
+            latencies = sorted(self.latencies[name])
+            errors = dict(self.errors[name])
+            failed = sum(errors.values())
+            operations[name] = {
+                "requests": len(latencies),
+                "throughput": round(len(latencies) / duration, 2),
+                "errorRate": round(failed / len(latencies), 4),
+                "errors": errors,
+                "latencyMs": {
+                    **{f"p{p}": round(percentile(latencies, p) * 1000, 2) for p in PERCENTILES},
+                    "mean": round(sum(latencies) / len(latencies) * 1000, 2),
+                    "max": round(latencies[-1] * 1000, 2),
+                },
+            }
+        return operations
+
+def run_stage(url: str, workers: int, duration: float, operations: Dict[str, Operation],
+              weights: Dict[str, float], ids: Dict[str, List[str]], seed: int) -> dict:
+    recorder = StageRecorder()
+    names = list(weights)
+    weight_values = [weights[name] for name in names]
+    stop_at = time.perf_counter() + duration
+
+    def worker(index):
+        rng = random.Random(f"{seed}-{workers}-{index}")
+        client = GraphQLClient(url)
+        try:
+            while time.perf_counter() < stop_at:
+                operation = operations[rng.choices(names, weight_values)[0]]
+                variables = make_variables(operation, ids, rng)
+                started = time.perf_counter()
+                try:
+                    status, body = client.post(operation.name, operation.text, variables)
+                    if status != 200:
+                        error = f"http_{status}"
+                    elif body is None or body.get("errors") or body.get("data") is None:
+                        error = "graphql"
+                    else:
+                        # Mutation payloads report failures in their own errors field
+                        payloads = body["data"].values()
+                        error = "payload" if any(isinstance(p, dict) and p.get("errors") for p in payloads) else None
+                except (OSError, http.client.HTTPException, ValueError):
+                    error = "connection"
+                recorder.record(operation.name, time.perf_counter() - started, error)
+        finally:
+            client.close()
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(workers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    per_operation = recorder.summary(elapsed)
+    total = sum(op["requests"] for op in per_operation.values())
+    failed = sum(sum(op["errors"].values()) for op in per_operation.values())
+    return {
+        "workers": workers,
+        "durationS": round(elapsed, 3),
+        "requests": total,
+        "throughput": round(total / elapsed, 2),
+        "errorRate": round(failed / total, 4) if total else 0.0,
+        "operations": per_operation,
+    }
+
+def git_revision() -> dict:
+    def git(*args):
+        try:
+            return subprocess.run(["git", *args], cwd=REPO_ROOT, capture_output=True, text=True,
+                                  check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+    status = git("status", "--porcelain", "--untracked-files=no")
+    return {"commit": git("rev-parse", "HEAD"), "dirty": bool(status) if status is not None else None}
+
+def run_load_test(url: str, stages: List[int], stage_duration: float, mix: Optional[str] = None,
+                  seed: int = 0, src_dir: str = FRONTEND_SRC, progress=print) -> dict:
+    """Run every stage against `url` and return the report."""
+    operations = load_operations(src_dir)
+    weights = parse_mix(mix, operations)
+    ids = sample_ids(url)
+    if not ids["clients"] or not ids["suppliers"]:
+        raise RuntimeError("The database needs at least one client and supplier (python seed.py --seed)")
+
+    runnable = {}
+    for name, weight in weights.items():
+        if weight <= 0:
+            continue
+        if make_variables(operations[name], ids, random.Random(seed)) is None:
+            progress(f"Skipping {name}: cannot fill in its variables")
+            continue
+        runnable[name] = weight
+    if not runnable:
+        raise RuntimeError("No operation in the mix can be run")
+
+    report = {
+        "startedAt": datetime.now(timezone.utc).isoformat(),
+        "git": git_revision(),
+        "settings": {"url": url, "stages": stages, "stageDurationS": stage_duration,
+                     "mix": runnable, "seed": seed, "pageSize": PAGE_SIZE},
+        "stages": [],
+    }
+    for workers in stages:
+        progress(f"Stage: {workers} workers for {stage_duration:g}s")
+        stage = run_stage(url, workers, stage_duration, operations, runnable, ids, seed)
+        report["stages"].append(stage)
+        progress(format_stage(stage))
+    return report
+
+def format_stage(stage: dict) -> str:
+    lines = [f"{stage['workers']} workers: {stage['throughput']:.1f} req/s, "
+             f"{stage['errorRate']:.2%} errors over {stage['requests']} requests",
+             f"  {'operation':<40} {'req/s':>8} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'errors':>8}"]
+    for name, op in stage["operations"].items():
+        latency = op["latencyMs"]
+        lines.append(f"  {name:<40} {op['throughput']:>8.1f} {latency['p50']:>8.1f} {latency['p90']:>8.1f} "
+                     f"{latency['p99']:>8.1f} {op['errorRate']:>8.2%}")
+    return "\n".join(lines)
+
+def compare_reports(baseline: dict, current: dict) -> str:
+    """Per stage and operation: throughput and p50/p99 changes from a baseline report."""
+    def change(old, new):
+        return f"{(new - old) / old:+.1%}" if old else "n/a"
+
+    lines = [f"Comparing against {(baseline.get('git') or {}).get('commit') or 'baseline'}"]
+    if baseline.get("settings", {}).get("mix") != current["settings"]["mix"]:
+        lines.append("  warning: the operation mixes differ")
+    baseline_stages = {stage["workers"]: stage for stage in baseline.get("stages", [])}
+    for stage in current["stages"]:
+        old_stage = baseline_stages.get(stage["workers"])
+        if old_stage is None:
+            continue
+        lines.append(f"{stage['workers']} workers: throughput {change(old_stage['throughput'], stage['throughput'])}, "
+                     f"errors {old_stage['errorRate']:.2%} -> {stage['errorRate']:.2%}")
+        for name, op in stage["operations"].items():
+            old = old_stage["operations"].get(name)
+            if old is None:
+                continue
+            lines.append(f"  {name:<40} req/s {change(old['throughput'], op['throughput']):>8} "
+                         f"p50 {change(old['latencyMs']['p50'], op['latencyMs']['p50']):>8} "
+                         f"p99 {change(old['latencyMs']['p99'], op['latencyMs']['p99']):>8}")
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test a running backend with the frontend's operations.")
+    parser.add_argument("--url", default="http://localhost:5000/graphql", help="GraphQL endpoint")
+    parser.add_argument("--stages", default="1,4,8,16", help="Comma-separated worker counts, run in order")
+    parser.add_argument("--stage-duration", type=float, default=10.0, help="Seconds per stage")
+    parser.add_argument("--mix", help="Operation weights, e.g. ClientListQuery=4,CreateMaterialsInvoiceMutation=1")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the operation and variable choices")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    parser.add_argument("--compare", help="A previous JSON report to compare against")
+    parser.add_argument("--list", action="store_true", help="List the operations found and exit")
+    args = parser.parse_args()
+
+    if args.list:
+        for name, operation in load_operations().items():
+            print(f"{operation.kind:<10} {name}")
+        sys.exit(0)
+
+    report = run_load_test(args.url, [int(n) for n in args.stages.split(",")], args.stage_duration,
+                           args.mix, args.seed)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print(compare_reports(json.load(f), report))
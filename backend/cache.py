@@ -0,0 +1,216 @@
+"""
+Process-level cache for rarely changing reference data.
+
+Clients and suppliers are read for every invoice row in a list query, but they
+change rarely. This module keeps detached, read-only snapshots of those rows in
+a bounded LRU cache with a TTL, so hot paths can avoid a database round trip
+per lookup.
+
+Snapshots may be up to a TTL old, so they serve display fields only. Anything
+that decides an amount (such as the markup rate of a new invoice) is read from
+the database inside the write transaction.
+
+Invalidation:
+- ORM writes to Client/Supplier rows invalidate the affected entries on flush
+  and again after commit, so readers never keep a value that was replaced.
+- Set-based writes that bypass the ORM must call `invalidate_on_commit()`.
+- The TTL bounds staleness across worker processes, which do not share a cache.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from models import db, Client, Supplier
+
+
+@dataclass(frozen=True)
+class ClientSnapshot:
+    """Detached, read-only view of a Client row."""
+    id: int
+    name: str
+    markup_rate: Decimal
+
+
+@dataclass(frozen=True)
+class SupplierSnapshot:
+    """Detached, read-only view of a Supplier row."""
+    id: int
+    name: str
+
+
+class EntityCache:
+    """Thread-safe LRU cache of entity snapshots with a per-entry TTL."""
+
+    def __init__(self, maxsize: int = 4096, ttl: float = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_client(self, client_id: int) -> Optional[ClientSnapshot]:
+        """Return a snapshot of the client, loading it on a miss."""
+        return self._get(Client, client_id, self._load_client)
+
+    def get_supplier(self, supplier_id: int) -> Optional[SupplierSnapshot]:
+        """Return a snapshot of the supplier, loading it on a miss."""
+        return self._get(Supplier, supplier_id, self._load_supplier)
+
+    def get_clients(self, client_ids: Iterable[int]) -> Dict[int, ClientSnapshot]:
+        """Snapshots of several clients by id, loading the misses with one query."""
+        return self._get_many(Client, client_ids, self._load_clients)
+
+    def get_suppliers(self, supplier_ids: Iterable[int]) -> Dict[int, SupplierSnapshot]:
+        """Snapshots of several suppliers by id, loading the misses with one query."""
+        return self._get_many(Supplier, supplier_ids, self._load_suppliers)
+
+    def invalidate(self, model_class, entity_id: Optional[int] = None) -> None:
+        """Drop one entry, or every entry of `model_class` when no id is given."""
+        with self._lock:
+            if entity_id is not None:
+                self._entries.pop((model_class.__name__, entity_id), None)
+                return
+            for key in [k for k in self._entries if k[0] == model_class.__name__]:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        """Drop every entry and reset the statistics."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _get(self, model_class, entity_id, loader):
+        if self.maxsize <= 0:
+            return loader(entity_id)
+
+        key = (model_class.__name__, entity_id)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        # Load outside the lock so a slow query does not serialize all readers.
+        # Misses are not cached, so newly created rows become visible at once.
+        snapshot = loader(entity_id)
+        if snapshot is None:
+            return None
+
+        with self._lock:
+            self._entries[key] = (now + self.ttl, snapshot)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return snapshot
+
+    def _get_many(self, model_class, entity_ids, loader):
+        found = {}
+        missing = []
+        now = time.monotonic()
+        with self._lock:
+            for entity_id in dict.fromkeys(entity_ids):
+                entry = self._entries.get((model_class.__name__, entity_id)) if self.maxsize > 0 else None
+                if entry is not None and entry[0] > now:
+                    self._entries.move_to_end((model_class.__name__, entity_id))
+                    self.hits += 1
+                    found[entity_id] = entry[1]
+                else:
+                    self.misses += 1
+                    missing.append(entity_id)
+        if not missing:
+            return found
+
+        loaded = loader(missing)
+        found.update(loaded)
+        if self.maxsize > 0:
+            with self._lock:
+                for entity_id, snapshot in loaded.items():
+                    key = (model_class.__name__, entity_id)
+                    self._entries[key] = (now + self.ttl, snapshot)
+                    self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return found
+
+    @staticmethod
+    def _load_client(client_id):
+        row = db.session.execute(
+            select(Client.id, Client.name, Client.markup_rate).where(Client.id == client_id)
+        ).first()
+        return ClientSnapshot(*row) if row else None
+
+    @staticmethod
+    def _load_supplier(supplier_id):
+        row = db.session.execute(
+            select(Supplier.id, Supplier.name).where(Supplier.id == supplier_id)
+        ).first()
+        return SupplierSnapshot(*row) if row else None
+
+    @staticmethod
+    def _load_clients(client_ids):
+        rows = db.session.execute(
+            select(Client.id, Client.name, Client.markup_rate).where(Client.id.in_(client_ids))
+        )
+        return {row.id: ClientSnapshot(*row) for row in rows}
+
+    @staticmethod
+    def _load_suppliers(supplier_ids):
+        rows = db.session.execute(
+            select(Supplier.id, Supplier.name).where(Supplier.id.in_(supplier_ids))
+        )
+        return {row.id: SupplierSnapshot(*row) for row in rows}
+
+
+entity_cache = EntityCache(
+    maxsize=int(os.getenv('ENTITY_CACHE_SIZE', '4096')),
+    ttl=float(os.getenv('ENTITY_CACHE_TTL', '300')),
+)
+
+
+# Invalidation hooks for ORM writes
+_PENDING_KEY = 'entity_cache_pending'
+
+
+def invalidate_on_commit(session, model_class, entity_id: int) -> None:
+    """Drop an entry now and again when the session's transaction ends."""
+    entity_cache.invalidate(model_class, entity_id)
+    session.info.setdefault(_PENDING_KEY, set()).add((model_class, entity_id))
+
+
+def _on_entity_write(mapper, connection, target):
+    session = Session.object_session(target)
+    if session is not None:
+        invalidate_on_commit(session, type(target), target.id)
+    else:
+        entity_cache.invalidate(type(target), target.id)
+
+
+def _on_session_end(session):
+    # A concurrent reader may have re-cached the old row between flush and
+    # commit, so invalidate once more when the transaction ends.
+    for model_class, entity_id in session.info.pop(_PENDING_KEY, ()):
+        entity_cache.invalidate(model_class, entity_id)
+
+
+for _model in (Client, Supplier):
+    for _event_name in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(_model, _event_name, _on_entity_write)
+
+event.listen(Session, 'after_commit', _on_session_end)
+event.listen(Session, 'after_rollback', _on_session_end)
@@ -0,0 +1,102 @@
+"""
+Cheap "is the database schema current?" checks run before serving.
+
+`flask db upgrade` loads Alembic, its migration environment and every revision
+script on each container start, even when there is nothing to do. Here the
+head revision is read from the version scripts as text and compared with the
+database's `alembic_version` row; Flask-Migrate is only imported when an
+upgrade is actually needed.
+
+`check_storage_mode` compares the COMPACT_STORAGE setting with the column
+types the database actually has, so a server started with the wrong setting
+stops at once instead of failing on the first row it reads or writes.
+"""
+
+import glob
+import logging
+import os
+import re
+
+from sqlalchemy import Integer, inspect, text
+
+from models import db, COMPACT_STORAGE
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+_REVISION_PATTERN = re.compile(r"^revision\s*=\s*['\"]([^'\"]+)['\"]", re.MULTILINE)
+_DOWN_REVISION_PATTERN = re.compile(r"^down_revision\s*=\s*(.+)$", re.MULTILINE)
+
+# Columns stored as integers under COMPACT_STORAGE: money, invoice status and debt party
+STORAGE_PROBE_COLUMNS = (("materials_invoices", "baseAmount"), ("materials_invoices", "status"),
+                         ("debts", "party"))
+
+class StorageModeMismatch(RuntimeError):
+    """The database was migrated with a different COMPACT_STORAGE setting."""
+
+def head_revisions(migrations_dir: str = MIGRATIONS_DIR) -> set:
+    """Revision ids that no other revision script builds on."""
+    revisions = set()
+    parents = set()
+    for path in glob.glob(os.path.join(migrations_dir, 'versions', '*.py')):
+        with open(path, encoding='utf-8') as f:
+            source = f.read()
+        revision = _REVISION_PATTERN.search(source)
+        if not revision:
+            continue
+        revisions.add(revision.group(1))
+        down_revision = _DOWN_REVISION_PATTERN.search(source)
+        if down_revision:
+            # Handles None, a single id and tuples of ids (merge revisions)
+            parents.update(re.findall(r"['\"]([^'\"]+)['\"]", down_revision.group(1)))
+    return revisions - parents
+
+def current_revisions() -> set:
+    """Revision ids recorded in the database. Must be called inside an app context."""
+    if not inspect(db.engine).has_table('alembic_version'):
+        return set()
+    with db.engine.connect() as connection:
+        return {row[0] for row in connection.execute(text('SELECT version_num FROM alembic_version'))}
+
+def upgrade_if_needed(app, migrations_dir: str = MIGRATIONS_DIR) -> bool:
+    """
+    Run `flask db upgrade` only if the database is behind the migration scripts.
+
+    Returns:
+        True if an upgrade was run
+    """
+    with app.app_context():
+        heads = head_revisions(migrations_dir)
+        if heads and current_revisions() == heads:
+            logger.info(f"Database is at head revision {', '.join(sorted(heads))}, skipping migrations")
+            return False
+
+        from flask_migrate import Migrate, upgrade
+        if 'migrate' not in app.extensions:
+            Migrate(app, db, directory=migrations_dir)
+        logger.info("Database is behind the migration scripts, upgrading")
+        upgrade(directory=migrations_dir)
+        return True
+
+def check_storage_mode(app) -> None:
+    """
+    Raise StorageModeMismatch if the database's column types do not match COMPACT_STORAGE.
+
+    Tables that do not exist yet are skipped; migrations create them in the configured mode.
+    """
+    with app.app_context():
+        inspector = inspect(db.engine)
+        mismatched = []
+        for table, column in STORAGE_PROBE_COLUMNS:
+            if not inspector.has_table(table):
+                continue
+            column_type = next(c["type"] for c in inspector.get_columns(table) if c["name"] == column)
+            if isinstance(column_type, Integer) != COMPACT_STORAGE:
+                mismatched.append(f"{table}.{column} is {column_type}")
+    if mismatched:
+        raise StorageModeMismatch(
+            f"COMPACT_STORAGE is {'set' if COMPACT_STORAGE else 'not set'}, but the database uses "
+            f"{'default' if COMPACT_STORAGE else 'compact'} storage ({', '.join(mismatched)}). "
+            f"Start with the setting the database was migrated with, or convert it (see "
+            f"migrations/versions/b4e8c1d6a207_compact_storage.py)")
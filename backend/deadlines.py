@@ -0,0 +1,145 @@
+"""
+Per-operation deadlines for GraphQL execution, enforced down to the SQL layer.
+
+`run_graphql` executes each operation inside `operation_deadline(seconds)`.
+While the deadline is running:
+
+- `deadline_middleware` checks it before every resolver. Once it has passed,
+  the remaining fields fail with a DEADLINE_EXCEEDED error instead of
+  running, so the client gets whatever data was resolved so far.
+- Every SQL statement is checked before it is sent, and statements already
+  running are interrupted when the deadline passes: SQLite through a progress
+  handler on the connection, PostgreSQL through `SET LOCAL statement_timeout`
+  set to the time left (it lapses with the transaction). The timeout is sent
+  once per operation and transaction, and again only when the one in force
+  could outlive the deadline by more than `STATEMENT_TIMEOUT_SLACK` seconds,
+  so resolver queries do not each pay an extra round trip.
+
+An interrupted statement surfaces as a database error, which the middleware
+turns into the same DEADLINE_EXCEEDED error. Failing fields produce one error
+each; `collapse_deadline_errors` keeps only the first of them, so a list of
+10,000 rows does not come back with 10,000 copies.
+
+The deadline lives in a context variable, so it only affects the request
+thread that set it; background jobs and CLI commands run without one.
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional, Tuple
+
+from graphql import GraphQLError
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.pool import Pool
+
+DEADLINE_EXCEEDED = "DEADLINE_EXCEEDED"
+# SQLite virtual machine instructions between deadline checks
+SQLITE_PROGRESS_STEPS = 10000
+# Seconds a PostgreSQL statement timeout may outlive the deadline before it is renewed
+STATEMENT_TIMEOUT_SLACK = 1.0
+# conn.info key: (deadline, time set) of the statement timeout in force
+_TIMEOUT_KEY = "deadline_statement_timeout"
+
+# (monotonic time the deadline passes, timeout in seconds) of the running operation
+_deadline: ContextVar[Optional[Tuple[float, float]]] = ContextVar("graphql_deadline", default=None)
+
+
+class DeadlineExceeded(GraphQLError):
+    """The operation ran past its deadline."""
+
+    def __init__(self, timeout: float):
+        super().__init__(f"Operation exceeded its deadline of {timeout:g}s",
+                         extensions={"code": DEADLINE_EXCEEDED})
+
+
+@contextmanager
+def operation_deadline(seconds: Optional[float]):
+    """Run the body under a deadline of `seconds`; None or 0 means no deadline."""
+    if not seconds or seconds <= 0:
+        yield
+        return
+    token = _deadline.set((time.monotonic() + seconds, seconds))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+def time_left() -> Optional[float]:
+    """Seconds until the current deadline (negative once passed), None without one."""
+    current = _deadline.get()
+    return None if current is None else current[0] - time.monotonic()
+
+def check_deadline() -> None:
+    """Raise DeadlineExceeded if the current deadline has passed."""
+    current = _deadline.get()
+    if current is not None and time.monotonic() >= current[0]:
+        raise DeadlineExceeded(current[1])
+
+def deadline_middleware(resolve, obj, info, **kwargs):
+    """GraphQL middleware: stop resolving fields once the deadline has passed."""
+    check_deadline()
+    try:
+        return resolve(obj, info, **kwargs)
+    except DBAPIError as e:
+        # An interrupted or timed out statement; report it as the deadline it is
+        current = _deadline.get()
+        if current is not None and time.monotonic() >= current[0]:
+            raise DeadlineExceeded(current[1]) from e
+        raise
+
+def collapse_deadline_errors(result: dict) -> dict:
+    """Keep only the first DEADLINE_EXCEEDED error of a result."""
+    errors = result.get("errors")
+    if not errors:
+        return result
+    kept, seen = [], False
+    for error in errors:
+        if (error.get("extensions") or {}).get("code") == DEADLINE_EXCEEDED:
+            if seen:
+                continue
+            seen = True
+        kept.append(error)
+    if len(kept) != len(errors):
+        result["errors"] = kept
+    return result
+
+def _sqlite_progress() -> int:
+    # A non-zero return value makes SQLite abort the statement ("interrupted")
+    current = _deadline.get()
+    return int(current is not None and time.monotonic() >= current[0])
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _apply_deadline_to_statement(conn, cursor, statement, parameters, context, executemany):
+    current = _deadline.get()
+    if current is None:
+        return
+    now = time.monotonic()
+    left = current[0] - now
+    if left <= 0:
+        raise DeadlineExceeded(current[1])
+    dialect = conn.dialect.name
+    if dialect == "sqlite":
+        conn.connection.dbapi_connection.set_progress_handler(_sqlite_progress, SQLITE_PROGRESS_STEPS)
+    elif dialect == "postgresql":
+        # A timeout set at time t lets a statement run until deadline + (now - t)
+        in_force = conn.info.get(_TIMEOUT_KEY)
+        if in_force is None or in_force[0] is not current or now - in_force[1] > STATEMENT_TIMEOUT_SLACK:
+            cursor.execute(f"SET LOCAL statement_timeout = {max(1, int(left * 1000))}")
+            conn.info[_TIMEOUT_KEY] = (current, now)
+
+@event.listens_for(Engine, "commit")
+@event.listens_for(Engine, "rollback")
+def _forget_statement_timeout(conn):
+    # SET LOCAL lapses with the transaction
+    conn.info.pop(_TIMEOUT_KEY, None)
+
+@event.listens_for(Pool, "checkin")
+def _clear_sqlite_progress_handler(dbapi_connection, connection_record):
+    # Connections go back to the pool without the per-statement callback or a timeout record
+    if connection_record is not None:
+        connection_record.info.pop(_TIMEOUT_KEY, None)
+    if dbapi_connection is not None and hasattr(dbapi_connection, "set_progress_handler"):
+        dbapi_connection.set_progress_handler(None, 0)
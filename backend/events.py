@@ -0,0 +1,211 @@
+"""
+Event bus feeding GraphQL subscriptions.
+
+Mutations publish small event payloads (ids and foreign keys, never ORM objects)
+after their transaction commits. Subscribers are asyncio consumers running on
+the ASGI event loop (see `asgi.py`), while publishers are usually WSGI worker
+threads, so delivery hands events to each subscriber's loop with
+`call_soon_threadsafe`.
+
+On its own the bus is per process: a subscriber only sees events published by
+the same process. With several server processes, `create_app` attaches a
+`PostgresEventRelay` when the database is PostgreSQL: events are then sent with
+NOTIFY, and every process that has subscribers LISTENs on a dedicated
+connection and delivers what arrives, its own events included. Other
+databases have no such channel, so there subscriptions only see mutations
+handled by their own process.
+
+Slow subscribers have a bounded queue and drop events on overflow rather than
+blocking publishers.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import select
+import threading
+from typing import Any, Callable, Optional
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# Topics published by the mutations in schema.py
+INVOICE_CREATED = "invoiceCreated"
+DEBT_CHANGED = "debtChanged"
+
+# PostgreSQL channel carrying events between processes
+EVENTS_CHANNEL = "graphql_events"
+# Seconds the listener waits for a notification before checking whether to stop
+LISTEN_POLL_INTERVAL = 5.0
+# Seconds before a lost listener connection is opened again
+LISTEN_RECONNECT_DELAY = 1.0
+
+class EventSubscription:
+    """Async iterator over the events of one topic for one subscriber."""
+
+    def __init__(self, bus, topic: str, predicate: Optional[Callable[[Any], bool]], maxsize: int):
+        self.bus = bus
+        self.topic = topic
+        self.predicate = predicate
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.bus is None:
+            raise StopAsyncIteration
+        return await self.queue.get()
+
+    async def aclose(self):
+        """Unsubscribe; the iterator stops after this call."""
+        if self.bus is not None:
+            self.bus._unsubscribe(self)
+            self.bus = None
+
+    def _deliver(self, payload):
+        # Runs on the subscriber's event loop
+        try:
+            self.queue.put_nowait(payload)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.warning(f"Dropped {self.topic} event for a slow subscriber ({self.dropped} dropped so far)")
+
+class EventBus:
+    """Thread-safe publish/subscribe hub for subscription events."""
+
+    def __init__(self, maxsize: int = 100):
+        self.maxsize = maxsize
+        # Cross-process transport; None delivers within this process only
+        self.relay = None
+        self._subscriptions = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, topic: str, predicate: Optional[Callable[[Any], bool]] = None) -> EventSubscription:
+        """
+        Register a subscriber. Must be called from a running event loop; the
+        subscriber is registered immediately, not on first iteration.
+        """
+        subscription = EventSubscription(self, topic, predicate, self.maxsize)
+        with self._lock:
+            self._subscriptions.setdefault(topic, set()).add(subscription)
+        if self.relay is not None:
+            self.relay.listen()
+        return subscription
+
+    def publish(self, topic: str, payload: Any) -> None:
+        """
+        Send a JSON-serializable payload to every matching subscriber, through
+        the relay when there is one. Callable from any thread.
+        """
+        if self.relay is None:
+            self.deliver(topic, payload)
+            return
+        try:
+            self.relay.send(topic, payload)
+        except Exception as e:
+            # Subscriptions are best effort; never fail the mutation that published
+            logger.error(f"Could not relay {topic} event: {e}")
+
+    def deliver(self, topic: str, payload: Any) -> None:
+        """Hand a payload to this process's matching subscribers."""
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(topic, ()))
+        for subscription in subscriptions:
+            if subscription.predicate is not None and not subscription.predicate(payload):
+                continue
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._deliver, payload)
+            except RuntimeError:
+                # The subscriber's loop has been closed
+                self._unsubscribe(subscription)
+
+    def subscriber_count(self, topic: str) -> int:
+        """Number of active subscribers for a topic."""
+        with self._lock:
+            return len(self._subscriptions.get(topic, ()))
+
+    def _unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.get(subscription.topic, set()).discard(subscription)
+
+class PostgresEventRelay:
+    """
+    Carries events between processes with PostgreSQL NOTIFY/LISTEN (psycopg2).
+
+    `send` notifies on a pooled connection of the app's engine. The listener is
+    a daemon thread started on the first subscription of each process (threads
+    do not survive a fork) that holds its own connection, detached from the pool.
+    """
+
+    def __init__(self, app, bus, channel: str = EVENTS_CHANNEL):
+        self.app = app
+        self.bus = bus
+        self.channel = channel
+        self._listener_pid = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def send(self, topic: str, payload: Any) -> None:
+        from models import db
+        message = json.dumps({"topic": topic, "payload": payload})
+        with self.app.app_context(), db.engine.begin() as connection:
+            connection.execute(text("SELECT pg_notify(:channel, :message)"),
+                               {"channel": self.channel, "message": message})
+
+    def listen(self) -> None:
+        """Start this process's listener unless it is running."""
+        with self._lock:
+            if self._listener_pid == os.getpid():
+                return
+            self._listener_pid = os.getpid()
+            self._stop.clear()
+        threading.Thread(target=self._listen_forever, name="event-relay", daemon=True).start()
+
+    def close(self) -> None:
+        """Stop the listener within LISTEN_POLL_INTERVAL seconds."""
+        self._stop.set()
+        with self._lock:
+            self._listener_pid = None
+
+    def _listen_forever(self):
+        while not self._stop.is_set():
+            try:
+                self._listen()
+            except Exception as e:
+                logger.error(f"Event relay listener failed, reconnecting: {e}")
+                self._stop.wait(LISTEN_RECONNECT_DELAY)
+
+    def _listen(self):
+        from models import db
+        with self.app.app_context():
+            pooled = db.engine.raw_connection()
+        # Held for as long as the process listens, so it must not count against the pool
+        pooled.detach()
+        connection = pooled.driver_connection
+        try:
+            connection.autocommit = True
+            with connection.cursor() as cursor:
+                cursor.execute(f'LISTEN "{self.channel}"')
+            while not self._stop.is_set():
+                readable, _, _ = select.select([connection], [], [], LISTEN_POLL_INTERVAL)
+                if not readable:
+                    continue
+                connection.poll()
+                while connection.notifies:
+                    self._dispatch(connection.notifies.pop(0).payload)
+        finally:
+            pooled.close()
+
+    def _dispatch(self, message: str):
+        try:
+            event = json.loads(message)
+            self.bus.deliver(event["topic"], event["payload"])
+        except Exception as e:
+            logger.error(f"Dropped malformed relayed event: {e}")
+
+event_bus = EventBus()
@@ -0,0 +1,117 @@
+"""
+Typed connection filters translated into SQL predicates.
+
+The `filter` argument of the invoices, transactions and debts connections is an
+input object (`InvoiceFilter`, `TransactionFilter`, `DebtFilter`). Every field
+maps to a column predicate, so filtering happens in the database and composes
+with cursor pagination:
+
+    clientId / supplierId / invoiceId   foreign key equality (global IDs)
+    status                              invoice status IN (...)
+    party                               debt party equality ("client" or "supplier")
+    dateFrom / dateTo                   inclusive range on the row's date column
+    minAmount / maxAmount               inclusive range on the row's amount column
+
+On the live tables the foreign keys, invoice status, debt party, invoice date
+and transaction date are indexed; the archive tables index only their foreign
+keys. `Debt.createdDate` and the amount columns are not indexed, so those
+ranges only narrow the rows that the other predicates or the primary key scan
+of the page already select.
+
+Invalid values raise GraphQLError, which is reported on the connection field.
+"""
+
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+from typing import List, Optional
+
+from graphql import GraphQLError
+
+from models import (
+    MaterialsInvoice, Transaction, Debt, InvoiceStatus, DEBT_PARTIES,
+    ArchivedMaterialsInvoice, ArchivedTransaction, ArchivedDebt,
+)
+from utils import from_global_id
+
+# Column holding the date and the amount that dateFrom/dateTo and minAmount/maxAmount filter on
+DATE_COLUMNS = {
+    MaterialsInvoice: "invoiceDate",
+    Transaction: "transactionDate",
+    Debt: "createdDate",
+}
+AMOUNT_COLUMNS = {
+    MaterialsInvoice: "baseAmount",
+    Transaction: "amount",
+    Debt: "amount",
+}
+for _hot, _archived in ((MaterialsInvoice, ArchivedMaterialsInvoice),
+                        (Transaction, ArchivedTransaction),
+                        (Debt, ArchivedDebt)):
+    DATE_COLUMNS[_archived] = DATE_COLUMNS[_hot]
+    AMOUNT_COLUMNS[_archived] = AMOUNT_COLUMNS[_hot]
+
+# Filter field -> (foreign key column, global ID type)
+FOREIGN_KEY_FILTERS = {
+    "clientId": ("client_id", "Client"),
+    "supplierId": ("supplier_id", "Supplier"),
+    "invoiceId": ("invoice_id", "MaterialsInvoice"),
+}
+
+def _db_id(global_id: str, type_name: str) -> int:
+    try:
+        id_type, db_id = from_global_id(global_id)
+    except Exception:
+        raise GraphQLError(f"Invalid ID: {global_id}")
+    if id_type != type_name:
+        raise GraphQLError(f"Invalid ID type for {type_name}: {global_id}")
+    return db_id
+
+def _parse_date(value: str) -> datetime:
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise GraphQLError(f"Invalid date: {value}. Expected YYYY-MM-DD or an ISO datetime")
+
+def _parse_amount(value) -> Decimal:
+    try:
+        return Decimal(str(value))
+    except InvalidOperation:
+        raise GraphQLError(f"Invalid amount: {value}")
+
+def filter_predicates(model_class, filters: Optional[dict]) -> List:
+    """Build the SQL predicates for a connection filter input on `model_class`."""
+    predicates = []
+    for name, value in (filters or {}).items():
+        if value is None:
+            continue
+
+        if name in FOREIGN_KEY_FILTERS:
+            column_name, type_name = FOREIGN_KEY_FILTERS[name]
+            predicates.append(getattr(model_class, column_name) == _db_id(value, type_name))
+        elif name == "status":
+            try:
+                statuses = [InvoiceStatus[status] for status in value]
+            except KeyError as e:
+                raise GraphQLError(
+                    f"Invalid status: {e.args[0]}. Must be one of: {', '.join(s.name for s in InvoiceStatus)}")
+            predicates.append(model_class.status.in_(statuses))
+        elif name == "party":
+            if value not in DEBT_PARTIES:
+                raise GraphQLError(f"Invalid party: {value}. Must be one of: {', '.join(DEBT_PARTIES)}")
+            predicates.append(model_class.party == value)
+        elif name == "dateFrom":
+            predicates.append(getattr(model_class, DATE_COLUMNS[model_class]) >= _parse_date(value))
+        elif name == "dateTo":
+            column = getattr(model_class, DATE_COLUMNS[model_class])
+            if len(value) == 10:
+                # A bare date includes the whole day
+                predicates.append(column < _parse_date(value) + timedelta(days=1))
+            else:
+                predicates.append(column <= _parse_date(value))
+        elif name == "minAmount":
+            predicates.append(getattr(model_class, AMOUNT_COLUMNS[model_class]) >= _parse_amount(value))
+        elif name == "maxAmount":
+            predicates.append(getattr(model_class, AMOUNT_COLUMNS[model_class]) <= _parse_amount(value))
+        else:
+            raise GraphQLError(f"Unsupported filter field: {name}")
+    return predicates
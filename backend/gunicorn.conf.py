@@ -0,0 +1,97 @@
+"""
+Gunicorn configuration for running the backend in production.
+
+    gunicorn -c gunicorn.conf.py "asgi:create_asgi_app()"
+
+Workers run the ASGI app (uvicorn workers), so the same processes serve plain
+HTTP and GraphQL subscriptions over WebSockets; Flask requests run on a pool
+of GUNICORN_THREADS threads in each worker. Subscribers see mutations handled
+by any worker when the database is PostgreSQL (see events.py); on other
+databases they only see their own worker's, and the master warns about it.
+
+The app is created once in the master (`preload_app`) and workers are forked
+from it, so the schema, persisted queries and imports are shared copy-on-write
+and a new worker starts serving immediately. `create_app` gives each forked
+worker its own database connection pool.
+
+Migrations run once in the master before any worker is forked. The master
+then refuses to start if the database's storage does not match COMPACT_STORAGE,
+and marks FAILED the jobs whose process stopped sending heartbeats (see jobs.py).
+
+Settings are read from the environment:
+
+    WEB_CONCURRENCY                 worker processes (default: 2 * CPUs + 1)
+    GUNICORN_THREADS                threads per worker (default: 4)
+    GUNICORN_WORKER_CLASS           worker class (default: uvicorn.workers.UvicornWorker)
+    GUNICORN_MAX_REQUESTS           recycle a worker after this many requests (default: 1000 with
+                                    JOBS_IN_PROCESS=false, otherwise 0, which disables it)
+    GUNICORN_MAX_REQUESTS_JITTER    random extra requests so workers do not recycle together (default: 100)
+    GUNICORN_TIMEOUT                seconds a silent worker may take before it is killed (default: 60)
+    GUNICORN_GRACEFUL_TIMEOUT       seconds workers get to finish requests on restart (default: 30)
+    GUNICORN_KEEPALIVE              seconds to keep idle connections open (default: 5)
+    HOST, PORT                      listen address (default: 0.0.0.0:5000)
+    RUN_MIGRATIONS                  set to "false" to skip the migration check
+
+Background jobs run in the workers by default, and recycling a worker would
+cancel the jobs it is running, so workers are only recycled when jobs run in
+a separate process (JOBS_IN_PROCESS=false and `flask run-jobs`, see jobs.py).
+
+The plain WSGI app, without subscriptions, runs on threaded workers:
+
+    GUNICORN_WORKER_CLASS=gthread gunicorn -c gunicorn.conf.py wsgi:app
+"""
+
+import multiprocessing
+import os
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+bind = f"{os.environ.get('HOST', '0.0.0.0')}:{_env_int('PORT', 5000)}"
+
+workers = _env_int('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1)
+threads = _env_int('GUNICORN_THREADS', 4)
+# uvicorn workers hand Flask requests to their own thread pool, sized from the same setting
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'uvicorn.workers.UvicornWorker')
+
+preload_app = True
+
+_jobs_in_workers = os.environ.get('JOBS_IN_PROCESS', 'true').lower() != 'false'
+max_requests = _env_int('GUNICORN_MAX_REQUESTS', 0 if _jobs_in_workers else 1000)
+max_requests_jitter = _env_int('GUNICORN_MAX_REQUESTS_JITTER', 100)
+
+timeout = _env_int('GUNICORN_TIMEOUT', 60)
+graceful_timeout = _env_int('GUNICORN_GRACEFUL_TIMEOUT', 30)
+keepalive = _env_int('GUNICORN_KEEPALIVE', 5)
+
+accesslog = '-'
+
+def _flask_app(application):
+    """The Flask app behind a loaded application, unwrapping the ASGI entry point."""
+    return getattr(application, 'flask_app', application)
+
+def on_starting(server):
+    from app import create_app
+    from db_migrations import upgrade_if_needed, check_storage_mode
+    from events import event_bus
+    flask_app = _flask_app(server.app.wsgi()) if server.cfg.preload_app else create_app()
+    if os.environ.get('RUN_MIGRATIONS', 'true').lower() != 'false':
+        upgrade_if_needed(flask_app)
+    check_storage_mode(flask_app)
+    if server.cfg.workers > 1 and event_bus.relay is None:
+        server.log.warning("Subscriptions only see mutations handled by their own worker: "
+                           "relaying events between workers needs PostgreSQL")
+    # Fail jobs whose process is gone; the workers' heartbeat threads keep doing so
+    flask_app.extensions['jobs'].fail_interrupted()
+
+def post_worker_init(worker):
+    # Threads do not survive the fork, so each worker starts its own
+    jobs = _flask_app(worker.wsgi).extensions['jobs']
+    jobs.start_heartbeat()
+
+def worker_exit(server, worker):
+    # On shutdown, let running background jobs stop without holding up the restart
+    application = getattr(worker, 'wsgi', None)
+    jobs = getattr(_flask_app(application), 'extensions', {}).get('jobs')
+    if jobs is not None:
+        jobs.shutdown(wait=False)
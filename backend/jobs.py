@@ -0,0 +1,410 @@
+"""
+In-process background job runner for long-running operations.
+
+Exports, rebuilds and bulk recomputations should not run inside a request
+thread. A request calls `JobRunner.submit()`, which persists a `Job` row and
+hands the work to a thread pool; clients then poll the `job(id)` query.
+
+Job kinds are registered with the `job_handler` decorator. A handler receives a
+`JobContext` followed by the job's JSON parameters as keyword arguments, and
+returns a JSON-serializable result:
+
+    @job_handler("reprice_client")
+    def reprice_client_job(ctx, clientId, rate, repriceUnpaid=True):
+        ...
+        ctx.report(done, total)   # also raises JobCancelled when requested
+        return {"repricedInvoices": repriced}
+
+Progress is tracked in memory and written to the job row at most once per
+`progress_interval` seconds through its own connection, so a handler's open
+transaction is never committed by a progress update. Cancellation is
+cooperative: `cancel()` sets a flag that the handler observes at its next
+`report()` or `check_cancelled()` call.
+
+By default jobs run in the process that queued them. With JOBS_IN_PROCESS
+set to "false", web processes only queue jobs and a separate process started
+with `flask run-jobs` claims and runs them, so restarting or recycling web
+workers never cancels a job. Either way a job runs in a single process, so one
+that was QUEUED or RUNNING when its process died would keep that status forever. Each job
+records its owner (host:pid), and a heartbeat thread in that process
+refreshes the job's `heartbeatDate` every `heartbeat_interval` seconds. The
+same thread calls `fail_interrupted()`, which marks FAILED the unfinished jobs
+whose heartbeat is more than `MISSED_HEARTBEATS` intervals old, wherever they
+were running; the server entry points also call it once at startup. Jobs of
+other live processes or instances keep beating and are left alone. Hosts are
+assumed to keep their clocks in sync to well within the stale period. Queued
+jobs that no process has claimed yet have no owner and are never failed.
+"""
+
+import json
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Callable, Dict, Optional
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import and_, inspect, or_, select, update
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import db, Job, JobStatus
+from pricing import update_client_markup
+from archive import archive_paid_invoices, DEFAULT_CHUNK_SIZE
+from cache import entity_cache
+from events import event_bus, DEBT_CHANGED
+from utils import from_global_id
+
+logger = logging.getLogger(__name__)
+
+# Registered job kinds, keyed by name
+JOB_HANDLERS: Dict[str, Callable] = {}
+
+FINISHED_STATUSES = (JobStatus.SUCCEEDED, JobStatus.FAILED, JobStatus.CANCELLED)
+INTERRUPTED_ERROR = "Interrupted: its process stopped sending heartbeats"
+# Heartbeat intervals a job may miss before it is considered interrupted
+MISSED_HEARTBEATS = 4
+
+def job_owner() -> str:
+    """Identifies the current process across hosts and restarts."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def job_handler(kind: str):
+    """Register a function as the handler for a job kind."""
+    def decorator(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return decorator
+
+class JobCancelled(Exception):
+    """Raised inside a handler when its job has been cancelled."""
+
+class JobContext:
+    """Progress reporting and cancellation checks for a running handler."""
+
+    def __init__(self, runner, job_id: int):
+        self.runner = runner
+        self.job_id = job_id
+        self.progress = 0
+        self.total = None
+        self.message = None
+        self.cancel_event = threading.Event()
+        self._last_persist = time.monotonic()
+
+    def report(self, progress: int, total: Optional[int] = None, message: Optional[str] = None) -> None:
+        """Record progress and raise JobCancelled if cancellation was requested."""
+        self.progress = progress
+        if total is not None:
+            self.total = total
+        if message is not None:
+            self.message = message[:255]
+
+        now = time.monotonic()
+        if now - self._last_persist >= self.runner.progress_interval:
+            self._last_persist = now
+            self._persist_progress()
+        self.check_cancelled()
+
+    def check_cancelled(self) -> None:
+        """Raise JobCancelled if cancellation was requested."""
+        if self.cancel_event.is_set():
+            raise JobCancelled()
+
+    def _persist_progress(self):
+        # Uses a separate connection so the handler's own transaction is untouched.
+        # The returned flag picks up cancellations requested from other processes.
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(
+                    update(Job).where(Job.id == self.job_id)
+                    .values(progress=self.progress, total=self.total, message=self.message,
+                            heartbeatDate=datetime.utcnow())
+                )
+                cancel_requested = connection.execute(
+                    select(Job.cancel_requested).where(Job.id == self.job_id)
+                ).scalar()
+            if cancel_requested:
+                self.cancel_event.set()
+        except SQLAlchemyError as e:
+            # Progress is best effort; the database may be busy with the handler's writes
+            logger.debug(f"Could not persist progress for job ID={self.job_id}: {str(e)}")
+
+class JobRunner:
+    """Runs registered job handlers on a thread pool inside an app context."""
+
+    def __init__(self, app, max_workers: Optional[int] = None, progress_interval: float = 1.0,
+                 heartbeat_interval: float = 15.0, in_process: bool = True):
+        self.app = app
+        self.progress_interval = progress_interval
+        self.heartbeat_interval = heartbeat_interval
+        # False: submitted jobs are left for `flask run-jobs` to claim
+        self.in_process = in_process
+        self.max_workers = max_workers or int(os.getenv('JOB_WORKERS', '2'))
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='job')
+        self._contexts: Dict[int, JobContext] = {}
+        self._futures = {}
+        self._lock = threading.Lock()
+        # Process the heartbeat thread runs in; threads do not survive a fork
+        self._heartbeat_pid = None
+        self._stopped = threading.Event()
+
+    def submit(self, kind: str, params: Optional[dict] = None) -> Job:
+        """
+        Persist a new job and schedule it here, or leave it queued for `flask
+        run-jobs` when jobs run in another process. Must be called inside an
+        app context.
+        """
+        if kind not in JOB_HANDLERS:
+            raise ValueError(f"Unknown job kind: {kind}. Must be one of: {', '.join(sorted(JOB_HANDLERS))}")
+
+        job = Job(kind=kind, status=JobStatus.QUEUED, params=json.dumps(params or {}),
+                  progress=0, cancel_requested=False, heartbeatDate=datetime.utcnow(),
+                  owner=job_owner() if self.in_process else None)
+        db.session.add(job)
+        db.session.commit()
+        if self.in_process:
+            self._start(job.id, kind, params or {})
+        logger.info(f"Queued job ID={job.id} kind={kind}")
+        return job
+
+    def claim(self) -> int:
+        """
+        Take queued jobs that no process owns, as many as there are idle
+        threads, and run them here. Returns the number of jobs claimed.
+        """
+        with self._lock:
+            idle = self.max_workers - len(self._contexts)
+        if idle <= 0:
+            return 0
+        claimed = 0
+        with self.app.app_context():
+            queued = db.session.execute(
+                select(Job.id, Job.kind, Job.params)
+                .where(Job.status == JobStatus.QUEUED, Job.owner.is_(None))
+                .order_by(Job.id)
+                .limit(idle)
+            ).all()
+            for job_id, kind, params in queued:
+                # Another process may claim the same job first
+                result = db.session.execute(
+                    update(Job)
+                    .where(Job.id == job_id, Job.status == JobStatus.QUEUED, Job.owner.is_(None))
+                    .values(owner=job_owner(), heartbeatDate=datetime.utcnow())
+                )
+                db.session.commit()
+                if result.rowcount:
+                    self._start(job_id, kind, json.loads(params or "{}"))
+                    claimed += 1
+        return claimed
+
+    def run_forever(self, poll_interval: float = 1.0) -> None:
+        """Claim and run queued jobs until `shutdown()` is called."""
+        self.start_heartbeat()
+        while not self._stopped.wait(poll_interval):
+            try:
+                self.claim()
+            except SQLAlchemyError as e:
+                logger.warning(f"Could not claim queued jobs: {str(e)}")
+
+    def cancel(self, job_id: int) -> bool:
+        """Request cancellation. Returns False if the job does not exist or has finished."""
+        result = db.session.execute(
+            update(Job)
+            .where(Job.id == job_id)
+            .where(Job.status.notin_(FINISHED_STATUSES))
+            .values(cancel_requested=True)
+        )
+        db.session.commit()
+        with self._lock:
+            context = self._contexts.get(job_id)
+        if context is not None:
+            context.cancel_event.set()
+        return result.rowcount > 0
+
+    def live_progress(self, job_id: int) -> Optional[JobContext]:
+        """Return the in-memory context of a job running in this process, if any."""
+        with self._lock:
+            return self._contexts.get(job_id)
+
+    def wait(self, job_id: int, timeout: Optional[float] = None) -> None:
+        """Block until a job submitted by this runner has finished."""
+        with self._lock:
+            future = self._futures.get(job_id)
+        if future is not None:
+            future.result(timeout=timeout)
+
+    def start_heartbeat(self) -> None:
+        """Start this process's heartbeat thread unless it is running."""
+        with self._lock:
+            if self._heartbeat_pid == os.getpid() or self._stopped.is_set():
+                return
+            self._heartbeat_pid = os.getpid()
+        threading.Thread(target=self._beat_forever, name='job-heartbeat', daemon=True).start()
+
+    def beat(self) -> None:
+        """Refresh the heartbeat of the unfinished jobs of this runner."""
+        with self._lock:
+            own = list(self._contexts)
+        if not own:
+            return
+        with self.app.app_context(), db.engine.begin() as connection:
+            connection.execute(
+                update(Job)
+                .where(Job.id.in_(own))
+                .where(Job.status.notin_(FINISHED_STATUSES))
+                .values(heartbeatDate=datetime.utcnow())
+            )
+
+    def fail_interrupted(self) -> int:
+        """
+        Mark unfinished jobs whose heartbeat is stale as FAILED.
+
+        Jobs of this runner, of other live processes and queued jobs waiting to
+        be claimed are left alone, so this is safe to call at any time. Returns
+        the number of jobs marked.
+        """
+        stale = datetime.utcnow() - timedelta(seconds=self.heartbeat_interval * MISSED_HEARTBEATS)
+        with self.app.app_context():
+            # Before the first migration there is nothing to recover
+            if not inspect(db.engine).has_table(Job.__tablename__):
+                return 0
+            with self._lock:
+                own = list(self._contexts)
+            result = db.session.execute(
+                update(Job)
+                .where(Job.status.notin_(FINISHED_STATUSES))
+                .where(Job.id.notin_(own))
+                .where(or_(Job.heartbeatDate.is_(None),
+                           and_(Job.owner.isnot(None), Job.heartbeatDate < stale)))
+                .values(status=JobStatus.FAILED, error=INTERRUPTED_ERROR, finishedDate=datetime.utcnow())
+            )
+            db.session.commit()
+        if result.rowcount:
+            logger.warning(f"Marked {result.rowcount} jobs whose process stopped sending heartbeats as FAILED")
+        return result.rowcount
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Cancel running jobs and stop the worker and heartbeat threads."""
+        self._stopped.set()
+        with self._lock:
+            contexts = list(self._contexts.values())
+        for context in contexts:
+            context.cancel_event.set()
+        self._executor.shutdown(wait=wait)
+
+    def _beat_forever(self):
+        while not self._stopped.wait(self.heartbeat_interval):
+            try:
+                self.beat()
+                self.fail_interrupted()
+            except SQLAlchemyError as e:
+                logger.warning(f"Job heartbeat failed: {str(e)}")
+
+    def _start(self, job_id: int, kind: str, params: dict):
+        context = JobContext(self, job_id)
+        with self._lock:
+            self._contexts[job_id] = context
+            self._futures[job_id] = self._executor.submit(self._run, context, kind, params)
+        self.start_heartbeat()
+
+    def _run(self, context: JobContext, kind: str, params: dict):
+        with self.app.app_context():
+            try:
+                self._execute(context, kind, params)
+            finally:
+                db.session.remove()
+                with self._lock:
+                    self._contexts.pop(context.job_id, None)
+                    self._futures.pop(context.job_id, None)
+
+    def _execute(self, context, kind, params):
+        job = db.session.get(Job, context.job_id)
+        if job.cancel_requested:
+            context.cancel_event.set()
+        if context.cancel_event.is_set():
+            self._finish(context, JobStatus.CANCELLED)
+            return
+
+        job.status = JobStatus.RUNNING
+        job.startedDate = datetime.utcnow()
+        job.heartbeatDate = job.startedDate
+        db.session.commit()
+        logger.info(f"Started job ID={context.job_id} kind={kind}")
+
+        try:
+            result = JOB_HANDLERS[kind](context, **params)
+            db.session.commit()
+            self._finish(context, JobStatus.SUCCEEDED, result=json.dumps(result, default=str))
+        except JobCancelled:
+            db.session.rollback()
+            self._finish(context, JobStatus.CANCELLED)
+        except Exception as e:
+            logger.error(f"Job ID={context.job_id} kind={kind} failed: {str(e)}")
+            db.session.rollback()
+            self._finish(context, JobStatus.FAILED, error=str(e))
+
+    def _finish(self, context, status, result=None, error=None):
+        job = db.session.get(Job, context.job_id)
+        job.status = status
+        job.progress = context.progress
+        job.total = context.total
+        job.message = context.message
+        job.result = result
+        job.error = error
+        job.finishedDate = datetime.utcnow()
+        db.session.commit()
+        logger.info(f"Finished job ID={context.job_id} with status={status.name}")
+
+@click.command('run-jobs')
+@click.option('--poll-interval', default=1.0, show_default=True,
+              help='Seconds between checks for queued jobs.')
+@with_appcontext
+def run_jobs_command(poll_interval):
+    """Run queued background jobs until stopped (for JOBS_IN_PROCESS=false)."""
+    runner = current_app.extensions['jobs']
+    # Cancel running jobs cleanly on a stop request instead of dying mid-job
+    signal.signal(signal.SIGTERM, lambda *_: runner.shutdown(wait=False))
+    click.echo(f"Running queued jobs on {runner.max_workers} threads")
+    try:
+        runner.run_forever(poll_interval)
+    except KeyboardInterrupt:
+        pass
+    runner.shutdown()
+
+# Built-in job kinds
+
+@job_handler("reprice_client")
+def reprice_client_job(ctx, clientId, rate, repriceUnpaid=True):
+    """Background variant of the updateClientMarkup mutation."""
+    client_type, client_db_id = from_global_id(clientId)
+    if client_type != "Client":
+        raise ValueError("Invalid ID types provided")
+    rate = Decimal(str(rate))
+    if rate < 0:
+        raise ValueError(f"Invalid markup_rate: {rate}. Must be >= 0.")
+    if not entity_cache.get_client(client_db_id):
+        raise ValueError(f"Client not found for ID={clientId}")
+
+    ctx.report(0, total=1, message="Repricing unpaid invoices")
+    result = update_client_markup(client_db_id, rate, reprice_unpaid=repriceUnpaid)
+    ctx.report(1, total=1, message=f"Repriced {result.repriced_invoices} invoices")
+    # Committed here rather than by the runner, so subscribers are notified
+    # only once the rows are visible to other sessions
+    db.session.commit()
+    for debt_id, invoice_id, party in result.repriced_debts:
+        event_bus.publish(DEBT_CHANGED, {"id": debt_id, "invoice_id": invoice_id, "party": party})
+    return {"repricedInvoices": result.repriced_invoices}
+
+@job_handler("archive_invoices")
+def archive_invoices_job(ctx, before, chunkSize=DEFAULT_CHUNK_SIZE):
+    """Background variant of `flask archive-invoices`; `before` is a YYYY-MM-DD date."""
+    cutoff = datetime.strptime(before, '%Y-%m-%d')
+    ctx.report(0, message=f"Archiving PAID invoices dated before {before}")
+    # Each chunk commits on its own, so a cancelled job keeps the chunks already moved
+    return archive_paid_invoices(cutoff, int(chunkSize), progress=lambda done, total: ctx.report(done, total))
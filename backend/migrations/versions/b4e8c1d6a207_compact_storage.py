@@ -0,0 +1,136 @@
+"""compact storage (opt-in)
+
+Revision ID: b4e8c1d6a207
+Revises: a9d3f5b7e284
+Create Date: 2026-10-19 16:05:41.218734
+
+Converts money columns to BIGINT cents and invoice status / debt party to
+SMALLINT codes when COMPACT_STORAGE is set, matching the column types that
+models.py picks for that setting. Without COMPACT_STORAGE the revision does
+nothing, so the default schema is unchanged.
+
+The setting in effect when the revision runs decides the storage. To switch
+an existing database, run the downgrade with the old setting and the upgrade
+with the new one:
+
+    flask db downgrade a9d3f5b7e284 && COMPACT_STORAGE=1 flask db upgrade
+"""
+import os
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b4e8c1d6a207'
+down_revision = 'a9d3f5b7e284'
+branch_labels = None
+depends_on = None
+
+# Frozen copies of the codes in models.StatusCode and models.PartyCode
+STATUS_CODES = {'DRAFT': 1, 'PENDING': 2, 'PAID': 3, 'UNPAID': 4}
+PARTY_CODES = {'client': 1, 'supplier': 2}
+
+MONEY_COLUMNS = {
+    'materials_invoices': ['baseAmount'],
+    'transactions': ['amount'],
+    'debts': ['amount'],
+    'archived_materials_invoices': ['baseAmount'],
+    'archived_transactions': ['amount'],
+    'archived_debts': ['amount'],
+}
+STATUS_TABLES = ['materials_invoices', 'archived_materials_invoices']
+PARTY_TABLES = ['debts', 'archived_debts']
+
+
+def _compact_storage():
+    return os.getenv('COMPACT_STORAGE', '').lower() in ('1', 'true', 'yes')
+
+
+def _case(expression, mapping):
+    # CASE expression WHEN old THEN new ... END
+    whens = " ".join(f"WHEN {old!r} THEN {new!r}" for old, new in mapping.items())
+    return f"CASE {expression} {whens} END"
+
+
+def _status_enum(**kwargs):
+    return sa.Enum('DRAFT', 'PENDING', 'PAID', 'UNPAID', name='invoicestatus', **kwargs)
+
+
+def upgrade():
+    if not _compact_storage():
+        return
+    postgresql = op.get_bind().dialect.name == 'postgresql'
+
+    for table, columns in MONEY_COLUMNS.items():
+        if not postgresql:
+            # SQLite copies the rows with CAST(... AS BIGINT), so scale them first
+            for column in columns:
+                op.execute(f'UPDATE {table} SET "{column}" = round("{column}" * 100)')
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            for column in columns:
+                batch_op.alter_column(column, existing_type=sa.Numeric(10, 2), type_=sa.BigInteger(),
+                                      existing_nullable=False,
+                                      postgresql_using=f'round("{column}" * 100)::bigint')
+
+    for table in STATUS_TABLES:
+        if not postgresql:
+            op.execute(f'UPDATE {table} SET status = {_case("status", STATUS_CODES)}')
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.alter_column('status', existing_type=_status_enum(), type_=sa.SmallInteger(),
+                                  existing_nullable=False,
+                                  postgresql_using=_case('status::text', STATUS_CODES))
+
+    for table in PARTY_TABLES:
+        # Parties without a code would become NULL and fail the NOT NULL constraint
+        known = ", ".join(repr(party) for party in PARTY_CODES)
+        unknown = op.get_bind().execute(sa.text(
+            f"SELECT DISTINCT party FROM {table} WHERE lower(party) NOT IN ({known})")).scalars().all()
+        if unknown:
+            raise RuntimeError(f"Cannot convert {table}.party to codes, unknown parties: {unknown}")
+        if not postgresql:
+            op.execute(f'UPDATE {table} SET party = {_case("lower(party)", PARTY_CODES)}')
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.alter_column('party', existing_type=sa.String(length=50), type_=sa.SmallInteger(),
+                                  existing_nullable=False,
+                                  postgresql_using=_case('lower(party)', PARTY_CODES))
+
+    if postgresql:
+        _status_enum().drop(op.get_bind(), checkfirst=True)
+
+
+def downgrade():
+    if not _compact_storage():
+        return
+    postgresql = op.get_bind().dialect.name == 'postgresql'
+    status_names = {code: name for name, code in STATUS_CODES.items()}
+    party_names = {code: name for name, code in PARTY_CODES.items()}
+
+    if postgresql:
+        _status_enum().create(op.get_bind(), checkfirst=True)
+
+    for table in PARTY_TABLES:
+        if not postgresql:
+            op.execute(f'UPDATE {table} SET party = {_case("party", party_names)}')
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.alter_column('party', existing_type=sa.SmallInteger(), type_=sa.String(length=50),
+                                  existing_nullable=False,
+                                  postgresql_using=_case('party', party_names))
+
+    for table in STATUS_TABLES:
+        if not postgresql:
+            op.execute(f'UPDATE {table} SET status = {_case("status", status_names)}')
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.alter_column('status', existing_type=sa.SmallInteger(),
+                                  type_=_status_enum(create_type=False), existing_nullable=False,
+                                  postgresql_using=f'({_case("status", status_names)})::invoicestatus')
+
+    for table, columns in MONEY_COLUMNS.items():
+        if not postgresql:
+            for column in columns:
+                op.execute(f'UPDATE {table} SET "{column}" = "{column}" / 100.0')
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            for column in columns:
+                batch_op.alter_column(column, existing_type=sa.BigInteger(), type_=sa.Numeric(10, 2),
+                                      existing_nullable=False,
+                                      postgresql_using=f'"{column}" / 100.0')
@@ -0,0 +1,76 @@
+"""add counterparty search index
+
+Revision ID: f2a6c8e0d417
+Revises: e1b4d7a9c360
+Create Date: 2026-10-19 14:10:33.482019
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2a6c8e0d417'
+down_revision = 'e1b4d7a9c360'
+branch_labels = None
+depends_on = None
+
+# Frozen copies of the DDL in search.py at this revision
+SQLITE_SEARCH_DDL = [
+    "CREATE VIRTUAL TABLE counterparty_search USING fts5("
+    "name, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')",
+    "CREATE TRIGGER clients_search_insert AFTER INSERT ON clients BEGIN "
+    "INSERT INTO counterparty_search(rowid, name) VALUES (new.id * 2, new.name); END",
+    "CREATE TRIGGER clients_search_update AFTER UPDATE OF name ON clients BEGIN "
+    "UPDATE counterparty_search SET name = new.name WHERE rowid = new.id * 2; END",
+    "CREATE TRIGGER clients_search_delete AFTER DELETE ON clients BEGIN "
+    "DELETE FROM counterparty_search WHERE rowid = old.id * 2; END",
+    "CREATE TRIGGER suppliers_search_insert AFTER INSERT ON suppliers BEGIN "
+    "INSERT INTO counterparty_search(rowid, name) VALUES (new.id * 2 + 1, new.name); END",
+    "CREATE TRIGGER suppliers_search_update AFTER UPDATE OF name ON suppliers BEGIN "
+    "UPDATE counterparty_search SET name = new.name WHERE rowid = new.id * 2 + 1; END",
+    "CREATE TRIGGER suppliers_search_delete AFTER DELETE ON suppliers BEGIN "
+    "DELETE FROM counterparty_search WHERE rowid = old.id * 2 + 1; END",
+    "INSERT INTO counterparty_search(rowid, name) SELECT id * 2, name FROM clients",
+    "INSERT INTO counterparty_search(rowid, name) SELECT id * 2 + 1, name FROM suppliers",
+]
+
+POSTGRES_SEARCH_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_clients_name_trgm ON clients USING gin (name gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_suppliers_name_trgm ON suppliers USING gin (name gin_trgm_ops)",
+]
+
+SQLITE_SEARCH_DROP_DDL = [
+    "DROP TRIGGER IF EXISTS clients_search_insert",
+    "DROP TRIGGER IF EXISTS clients_search_update",
+    "DROP TRIGGER IF EXISTS clients_search_delete",
+    "DROP TRIGGER IF EXISTS suppliers_search_insert",
+    "DROP TRIGGER IF EXISTS suppliers_search_update",
+    "DROP TRIGGER IF EXISTS suppliers_search_delete",
+    "DROP TABLE IF EXISTS counterparty_search",
+]
+
+POSTGRES_SEARCH_DROP_DDL = [
+    "DROP INDEX IF EXISTS ix_suppliers_name_trgm",
+    "DROP INDEX IF EXISTS ix_clients_name_trgm",
+]
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        # Databases built by db.create_all() already have the index
+        exists = bind.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'counterparty_search'"
+        ).first()
+        statements = [] if exists else SQLITE_SEARCH_DDL
+    else:
+        statements = {'postgresql': POSTGRES_SEARCH_DDL}.get(bind.dialect.name, [])
+    for statement in statements:
+        op.execute(statement)
+
+
+def downgrade():
+    statements = {'sqlite': SQLITE_SEARCH_DROP_DDL, 'postgresql': POSTGRES_SEARCH_DROP_DDL}
+    for statement in statements.get(op.get_bind().dialect.name, []):
+        op.execute(statement)
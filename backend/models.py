@@ -1,11 +1,23 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
 import enum
+import os
 from typing import List, Optional
-from sqlalchemy import Numeric
+from sqlalchemy import BigInteger, Numeric, SmallInteger, cast, func, type_coerce
+from sqlalchemy.types import TypeDecorator
 
 db = SQLAlchemy()
 
+# Opt-in compact storage (see migrations/versions/b4e8c1d6a207_compact_storage.py):
+# money as BIGINT cents, invoice status and debt party as small integer codes.
+# Read once at import; the database must have been migrated with the same setting,
+# which the server entry points check at startup (db_migrations.check_storage_mode).
+COMPACT_STORAGE = os.getenv('COMPACT_STORAGE', '').lower() in ('1', 'true', 'yes')
+
+# Values of a debt's party column
+DEBT_PARTIES = ("client", "supplier")
+
 class InvoiceStatus(enum.Enum):
     """Status options for an invoice."""
     DRAFT = "DRAFT"
@@ -13,6 +25,93 @@ class InvoiceStatus(enum.Enum):
     PAID = "PAID"
     UNPAID = "UNPAID"
 
+class Cents(TypeDecorator):
+    """Money stored as integer cents, exposed as a two-place Decimal."""
+    impl = BigInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return int((Decimal(str(value)) * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return (Decimal(int(value)) / 100).quantize(Decimal("0.01"))
+
+class InvalidCode(ValueError):
+    """A value with no code, or a stored code with no value."""
+
+class _Codes(TypeDecorator):
+    """A fixed set of values stored as small integer codes."""
+    impl = SmallInteger
+    cache_ok = True
+    codes: dict = {}
+
+    def _coerce(self, value):
+        return value
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        try:
+            return self.codes[self._coerce(value)]
+        except KeyError:
+            raise InvalidCode(f"Invalid {type(self).__name__} value: {value!r}")
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        try:
+            return self._values[value]
+        except KeyError:
+            raise InvalidCode(f"Unknown {type(self).__name__} code in the database: {value!r}")
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._values = {code: value for value, code in cls.codes.items()}
+
+class StatusCode(_Codes):
+    """InvoiceStatus stored as a code; accepts members or their names."""
+    cache_ok = True
+    codes = {
+        InvoiceStatus.DRAFT: 1,
+        InvoiceStatus.PENDING: 2,
+        InvoiceStatus.PAID: 3,
+        InvoiceStatus.UNPAID: 4,
+    }
+
+    def _coerce(self, value):
+        return InvoiceStatus[value] if isinstance(value, str) else value
+
+class PartyCode(_Codes):
+    """Debt party ("client" or "supplier") stored as a code."""
+    cache_ok = True
+    codes = {party: code for code, party in enumerate(DEBT_PARTIES, start=1)}
+
+# Column types of the money, status and party columns for the configured storage
+def money_type():
+    return Cents() if COMPACT_STORAGE else Numeric(10, 2)
+
+def status_type():
+    return StatusCode() if COMPACT_STORAGE else db.Enum(InvoiceStatus)
+
+def party_type():
+    return PartyCode() if COMPACT_STORAGE else db.String(50)
+
+def cents_sql(column):
+    """SQL expression for a money column in integer cents, for either storage."""
+    if COMPACT_STORAGE:
+        return type_coerce(column, BigInteger)
+    return cast(func.round(column * 100), BigInteger)
+
+def money_from_cents_sql(cents):
+    """SQL value to store in a money column from an integer cents expression."""
+    if COMPACT_STORAGE:
+        return cents
+    return cast(cents, Numeric(12, 2)) / 100
+
 class Client(db.Model):
     """Client model representing organizations that place orders."""
     __tablename__ = 'clients'
@@ -42,11 +141,14 @@ class MaterialsInvoice(db.Model):
     """Invoice model for materials purchases."""
     __tablename__ = 'materials_invoices'
     id = db.Column(db.Integer, primary_key=True)
-    client_id = db.Column(db.Integer, db.ForeignKey('clients.id'), nullable=False)
-    supplier_id = db.Column(db.Integer, db.ForeignKey('suppliers.id'), nullable=False)
-    invoiceDate = db.Column(db.DateTime, default=datetime.utcnow)
-    baseAmount = db.Column(Numeric(10, 2), nullable=False)
-    status = db.Column(db.Enum(InvoiceStatus), default=InvoiceStatus.UNPAID, nullable=False)
+    client_id = db.Column(db.Integer, db.ForeignKey('clients.id'), nullable=False, index=True)
+    supplier_id = db.Column(db.Integer, db.ForeignKey('suppliers.id'), nullable=False, index=True)
+    invoiceDate = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    baseAmount = db.Column(money_type(), nullable=False)
+    status = db.Column(status_type(), default=InvoiceStatus.UNPAID, nullable=False, index=True)
+    paidDate = db.Column(db.DateTime, nullable=True)
+    # Markup rate the transaction was billed at; NULL for invoices created before it was recorded
+    markupRate = db.Column(Numeric(10, 4), nullable=True)
 
     # One-to-one relationship with Transaction
     transaction = db.relationship('Transaction', uselist=False, backref='invoice')
@@ -68,9 +170,9 @@ class Transaction(db.Model):
     """Transaction model for financial exchanges."""
     __tablename__ = 'transactions'
     id = db.Column(db.Integer, primary_key=True)
-    invoice_id = db.Column(db.Integer, db.ForeignKey('materials_invoices.id'), nullable=False)
-    transactionDate = db.Column(db.DateTime, default=datetime.utcnow)
-    amount = db.Column(Numeric(10, 2), nullable=False)
+    invoice_id = db.Column(db.Integer, db.ForeignKey('materials_invoices.id'), nullable=False, index=True)
+    transactionDate = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    amount = db.Column(money_type(), nullable=False)
     
     def __repr__(self) -> str:
         """String representation of Transaction."""
@@ -80,11 +182,93 @@ class Debt(db.Model):
     """Debt model for tracking what is owed by different parties."""
     __tablename__ = 'debts'
     id = db.Column(db.Integer, primary_key=True)
-    invoice_id = db.Column(db.Integer, db.ForeignKey('materials_invoices.id'), nullable=False)
-    party = db.Column(db.String(50), nullable=False)
-    amount = db.Column(Numeric(10, 2), nullable=False)
+    invoice_id = db.Column(db.Integer, db.ForeignKey('materials_invoices.id'), nullable=False, index=True)
+    party = db.Column(party_type(), nullable=False, index=True)
+    amount = db.Column(money_type(), nullable=False)
     createdDate = db.Column(db.DateTime, default=datetime.utcnow)
+    # Set when the invoice is settled; the amount is zeroed at the same time
+    settledDate = db.Column(db.DateTime, nullable=True)
     
     def __repr__(self) -> str:
         """String representation of Debt."""
-        return f"<Debt id={self.id} party={self.party} amount={self.amount}>" 
\ No newline at end of file
+        return f"<Debt id={self.id} party={self.party} amount={self.amount}>" 
+
+# Archive tables: settled invoices moved out of the hot tables by archive.py.
+# Rows keep their original ids, so global IDs stay valid after archival.
+
+class ArchivedMaterialsInvoice(db.Model):
+    """A PAID invoice moved out of materials_invoices."""
+    __tablename__ = 'archived_materials_invoices'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    client_id = db.Column(db.Integer, db.ForeignKey('clients.id'), nullable=False, index=True)
+    supplier_id = db.Column(db.Integer, db.ForeignKey('suppliers.id'), nullable=False, index=True)
+    invoiceDate = db.Column(db.DateTime)
+    baseAmount = db.Column(money_type(), nullable=False)
+    status = db.Column(status_type(), nullable=False)
+    paidDate = db.Column(db.DateTime, nullable=True)
+    markupRate = db.Column(Numeric(10, 4), nullable=True)
+    archivedDate = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self) -> str:
+        """String representation of ArchivedMaterialsInvoice."""
+        return f"<ArchivedMaterialsInvoice id={self.id} amount={self.baseAmount} status={self.status.name}>"
+
+class ArchivedTransaction(db.Model):
+    """The transaction of an archived invoice."""
+    __tablename__ = 'archived_transactions'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    invoice_id = db.Column(db.Integer, db.ForeignKey('archived_materials_invoices.id'), nullable=False, index=True)
+    transactionDate = db.Column(db.DateTime)
+    amount = db.Column(money_type(), nullable=False)
+    archivedDate = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self) -> str:
+        """String representation of ArchivedTransaction."""
+        return f"<ArchivedTransaction id={self.id} amount={self.amount}>"
+
+class ArchivedDebt(db.Model):
+    """A debt of an archived invoice."""
+    __tablename__ = 'archived_debts'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    invoice_id = db.Column(db.Integer, db.ForeignKey('archived_materials_invoices.id'), nullable=False, index=True)
+    party = db.Column(party_type(), nullable=False)
+    amount = db.Column(money_type(), nullable=False)
+    createdDate = db.Column(db.DateTime)
+    settledDate = db.Column(db.DateTime, nullable=True)
+    archivedDate = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self) -> str:
+        """String representation of ArchivedDebt."""
+        return f"<ArchivedDebt id={self.id} party={self.party} amount={self.amount}>"
+
+class JobStatus(enum.Enum):
+    """Lifecycle states of a background job."""
+    QUEUED = "QUEUED"
+    RUNNING = "RUNNING"
+    SUCCEEDED = "SUCCEEDED"
+    FAILED = "FAILED"
+    CANCELLED = "CANCELLED"
+
+class Job(db.Model):
+    """Background job record, persisted so any worker can report on it."""
+    __tablename__ = 'jobs'
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.Enum(JobStatus), default=JobStatus.QUEUED, nullable=False, index=True)
+    params = db.Column(db.Text, nullable=True)
+    result = db.Column(db.Text, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    progress = db.Column(db.Integer, default=0, nullable=False)
+    total = db.Column(db.Integer, nullable=True)
+    message = db.Column(db.String(255), nullable=True)
+    cancel_requested = db.Column(db.Boolean, default=False, nullable=False)
+    # host:pid of the process running the job, which refreshes heartbeatDate while it lives
+    owner = db.Column(db.String(255), nullable=True)
+    heartbeatDate = db.Column(db.DateTime, nullable=True)
+    createdDate = db.Column(db.DateTime, default=datetime.utcnow)
+    startedDate = db.Column(db.DateTime, nullable=True)
+    finishedDate = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self) -> str:
+        """String representation of Job."""
+        return f"<Job id={self.id} kind={self.kind} status={self.status.name}>"
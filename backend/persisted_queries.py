@@ -0,0 +1,137 @@
+"""
+Automatic persisted queries (APQ) for the /graphql endpoint.
+
+Clients may send the SHA-256 hash of a query document instead of its text, in
+the Apollo APQ format:
+
+    GET /graphql?extensions={"persistedQuery":{"version":1,"sha256Hash":"..."}}
+                &variables={...}&operationName=...
+
+On a miss the server answers with a `PersistedQueryNotFound` error; the client
+then repeats the request with both the query text and the hash, and the server
+registers the text after verifying the hash. The store can also be preloaded
+from the Relay artifacts in `frontend/src/__generated__`, so the frontend's
+operations never miss.
+
+The store lives in process memory and is bounded, so registrations from
+arbitrary clients cannot grow it without limit.
+"""
+
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PERSISTED_QUERY_NOT_FOUND = "PersistedQueryNotFound"
+
+# Matches the operation text embedded in a Relay artifact's `params`
+RELAY_TEXT_PATTERN = re.compile(r'^\s*"text":\s*("(?:[^"\\]|\\.)*")', re.MULTILINE)
+
+def query_hash(query: str) -> str:
+    """SHA-256 hex digest of a query document, as used by APQ clients."""
+    return hashlib.sha256(query.encode("utf-8")).hexdigest()
+
+class PersistedQueryStore:
+    """Thread-safe, size-bounded mapping of query hashes to query text."""
+
+    def __init__(self, maxsize: int = 10000):
+        self.maxsize = maxsize
+        self._queries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, sha256_hash: str) -> Optional[str]:
+        """Return the query text for a hash, or None on a miss."""
+        with self._lock:
+            query = self._queries.get(sha256_hash)
+            if query is not None:
+                self._queries.move_to_end(sha256_hash)
+            return query
+
+    def register(self, query: str) -> str:
+        """Store a query and return its hash, evicting the least recently used entry if full."""
+        sha256_hash = query_hash(query)
+        with self._lock:
+            self._queries[sha256_hash] = query
+            self._queries.move_to_end(sha256_hash)
+            while len(self._queries) > self.maxsize:
+                self._queries.popitem(last=False)
+        return sha256_hash
+
+    def load_relay_artifacts(self, directory: str) -> int:
+        """Register the operation text of every Relay artifact in a directory."""
+        count = 0
+        for path in sorted(glob.glob(os.path.join(directory, "*.graphql.ts"))):
+            with open(path, encoding="utf-8") as f:
+                match = RELAY_TEXT_PATTERN.search(f.read())
+            if match:
+                self.register(json.loads(match.group(1)))
+                count += 1
+        logger.info(f"Preloaded {count} persisted queries from {directory}")
+        return count
+
+    def __len__(self) -> int:
+        return len(self._queries)
+
+def parse_get_params(args) -> dict:
+    """Build a GraphQL request body from GET query string parameters."""
+    data = {}
+    if args.get("query"):
+        data["query"] = args["query"]
+    if args.get("operationName"):
+        data["operationName"] = args["operationName"]
+    for key in ("variables", "extensions"):
+        if args.get(key):
+            try:
+                data[key] = json.loads(args[key])
+            except ValueError:
+                raise ValueError(f"The '{key}' parameter must be valid JSON")
+    return data
+
+def apply_persisted_query(data, store: PersistedQueryStore) -> Tuple[Optional[dict], Optional[dict]]:
+    """
+    Resolve or register the persisted query referenced by a request body.
+
+    Returns:
+        (data, None) with the query text filled in, or (None, error_result)
+        when the request cannot be served.
+    """
+    if not isinstance(data, dict):
+        return data, None
+    extensions = data.get("extensions")
+    if extensions is None:
+        return data, None
+    if not isinstance(extensions, dict):
+        return None, {"errors": [{"message": "The 'extensions' field must be an object"}]}
+    persisted = extensions.get("persistedQuery")
+    if not persisted:
+        return data, None
+    if not isinstance(persisted, dict):
+        return None, {"errors": [{"message": "The 'persistedQuery' extension must be an object"}]}
+
+    sha256_hash = persisted.get("sha256Hash")
+    if persisted.get("version") != 1 or not isinstance(sha256_hash, str):
+        return None, {"errors": [{"message": "Unsupported persisted query version"}]}
+
+    query = data.get("query")
+    if query is not None and not isinstance(query, str):
+        return None, {"errors": [{"message": "The 'query' field must be a string"}]}
+    if query is None:
+        query = store.get(sha256_hash)
+        if query is None:
+            return None, {"errors": [{
+                "message": PERSISTED_QUERY_NOT_FOUND,
+                "extensions": {"code": "PERSISTED_QUERY_NOT_FOUND"},
+            }]}
+        return {**data, "query": query}, None
+
+    if query_hash(query) != sha256_hash:
+        return None, {"errors": [{"message": "provided sha does not match query"}]}
+    store.register(query)
+    return data, None
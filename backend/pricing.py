@@ -0,0 +1,107 @@
+"""
+Set-based repricing of a client's invoices after a markup rate change.
+
+Repricing a large client through the ORM would load and rewrite four rows per
+invoice. Instead, the client row, the invoices' recorded markup rate, the
+transactions and the client-side debts are updated with one statement each,
+inside a single database transaction.
+
+Amounts are computed in integer cents so SQLite (which stores NUMERIC columns
+as floating point) and PostgreSQL produce exactly the value that
+`utils.markup_amount` produces for newly created invoices.
+"""
+
+import logging
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import List, Tuple
+
+from sqlalchemy import select, update
+
+from models import db, Client, MaterialsInvoice, Transaction, Debt, InvoiceStatus, cents_sql, money_from_cents_sql
+from cache import invalidate_on_commit
+from analytics import REPRICED_CLIENT_OPTION
+from utils import RATE_QUANTUM
+
+logger = logging.getLogger(__name__)
+
+# Markup rates have four decimal places, so (1 + rate) is an integer number of
+# 1/10000ths and the product with a cent amount stays integral.
+RATE_SCALE = 10000
+
+@dataclass
+class RepriceResult:
+    """Outcome of `update_client_markup`."""
+    repriced_invoices: int = 0
+    # (debt id, invoice id, party) of every client debt repriced
+    repriced_debts: List[Tuple[int, int, str]] = field(default_factory=list)
+
+def marked_up_amount_sql(markup_rate: Decimal):
+    """
+    SQL expression for `markup_amount(materials_invoices.baseAmount, markup_rate)`.
+    """
+    factor = RATE_SCALE + int(markup_rate.quantize(RATE_QUANTUM) * RATE_SCALE)
+    base_cents = cents_sql(MaterialsInvoice.baseAmount)
+    # Integer round half up: floor((cents * factor + scale / 2) / scale)
+    amount_cents = (base_cents * factor + RATE_SCALE // 2) // RATE_SCALE
+    return money_from_cents_sql(amount_cents)
+
+def update_client_markup(client_id: int, markup_rate: Decimal, reprice_unpaid: bool = True) -> RepriceResult:
+    """
+    Sets the client's markup rate and optionally reprices its unpaid invoices.
+
+    The caller is responsible for committing or rolling back the session, and
+    for publishing the repriced debts once committed.
+    """
+    markup_rate = markup_rate.quantize(RATE_QUANTUM)
+    db.session.execute(
+        update(Client).where(Client.id == client_id).values(markup_rate=markup_rate)
+    )
+    # The statement bypasses the ORM, so the cached snapshot must be dropped by hand
+    invalidate_on_commit(db.session(), Client, client_id)
+
+    result = RepriceResult()
+    if not reprice_unpaid:
+        return result
+
+    unpaid_invoice_ids = (
+        select(MaterialsInvoice.id)
+        .where(MaterialsInvoice.client_id == client_id)
+        .where(MaterialsInvoice.status != InvoiceStatus.PAID)
+    )
+    amount = marked_up_amount_sql(markup_rate)
+
+    db.session.execute(
+        update(MaterialsInvoice)
+        .where(MaterialsInvoice.client_id == client_id)
+        .where(MaterialsInvoice.status != InvoiceStatus.PAID)
+        .values(markupRate=markup_rate),
+        execution_options={"synchronize_session": False},
+    )
+    result.repriced_invoices = db.session.execute(
+        update(Transaction)
+        .where(Transaction.invoice_id.in_(unpaid_invoice_ids))
+        .values(amount=select(amount)
+                .where(MaterialsInvoice.id == Transaction.invoice_id)
+                .scalar_subquery()),
+        # Lets the analytics cache refresh this client's amounts instead of reloading
+        execution_options={"synchronize_session": False, REPRICED_CLIENT_OPTION: client_id},
+    ).rowcount
+
+    client_debts = (Debt.party == "client", Debt.invoice_id.in_(unpaid_invoice_ids))
+    result.repriced_debts.extend(
+        tuple(row) for row in db.session.execute(
+            select(Debt.id, Debt.invoice_id, Debt.party).where(*client_debts)
+        )
+    )
+    db.session.execute(
+        update(Debt)
+        .where(*client_debts)
+        .values(amount=select(amount)
+                .where(MaterialsInvoice.id == Debt.invoice_id)
+                .scalar_subquery()),
+        execution_options={"synchronize_session": False},
+    )
+    logger.info(f"Repriced {result.repriced_invoices} invoices for client ID={client_id} "
+                f"at markup_rate={markup_rate}")
+    return result
@@ -0,0 +1,44 @@
+"""
+Process pools for CLI batch work (reconciliation, statements).
+
+Workers are fresh interpreters (spawn), so they inherit neither the parent's
+threads nor its database connections. Each worker builds its own app against
+the parent's database once and runs every submitted task inside an app
+context of it. Tasks must be module-level functions so they can be pickled.
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from flask import current_app
+
+from models import db
+
+_worker_app = None
+
+def _init_worker(database_uri: str):
+    global _worker_app
+    os.environ['SQLALCHEMY_DATABASE_URI'] = database_uri
+    from app import create_app
+    _worker_app = create_app()
+
+def _call_in_app(func, args):
+    with _worker_app.app_context():
+        try:
+            return func(*args)
+        finally:
+            db.session.remove()
+
+def app_process_pool(workers: int) -> ProcessPoolExecutor:
+    """A pool of `workers` processes connected to the current app's database."""
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(current_app.config['SQLALCHEMY_DATABASE_URI'],),
+    )
+
+def submit_in_app(pool: ProcessPoolExecutor, func, *args) -> Future:
+    """Run func(*args) in a pool worker, inside its app context."""
+    return pool.submit(_call_in_app, func, args)
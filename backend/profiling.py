@@ -0,0 +1,111 @@
+"""
+On-demand CPU profiling of a single GraphQL request.
+
+A request that carries `X-Profile: <PROFILE_TOKEN>` runs under cProfile, with
+a sampler thread taking the request thread's stack every `sample_interval`
+seconds. Two files are written to PROFILE_DIR (default: instance/profiles):
+
+    <id>.pstats       cProfile stats, for `python -m pstats` or snakeviz
+    <id>.collapsed    sampled stacks in collapsed form, for flamegraph.pl
+                      or speedscope
+
+The profile id is returned in the result's `extensions.profile.id` and in the
+X-Profile-Id header. Without PROFILE_TOKEN the header is ignored; a wrong
+token is rejected with 403. Requests without the header take no part in any
+of this beyond one header lookup.
+
+Only one request per process is profiled at a time, since the profiler hooks
+are process-wide on newer Pythons; a second one gets 409. Response bodies that
+are streamed are serialized after the profile has been written, so only their
+execution is included.
+"""
+
+import cProfile
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from typing import Optional
+
+PROFILE_HEADER = "X-Profile"
+# Seconds between stack samples
+DEFAULT_SAMPLE_INTERVAL = 0.001
+
+_profile_lock = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    """Another request of this process is being profiled."""
+
+
+class StackSampler:
+    """Samples the stack of one thread from a background thread."""
+
+    def __init__(self, thread_id: int, interval: float = DEFAULT_SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[self._collapse(frame)] += 1
+
+    @staticmethod
+    def _collapse(frame) -> str:
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        return ";".join(reversed(names))
+
+    def write(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def new_profile_id() -> str:
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+@contextmanager
+def profiled(directory: str, profile_id: Optional[str] = None,
+             sample_interval: float = DEFAULT_SAMPLE_INTERVAL):
+    """
+    Profile the body of the block in the calling thread and yield the profile id.
+
+    Raises:
+        ProfilerBusy: Another block is being profiled
+    """
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusy("Another request is being profiled")
+    try:
+        profile_id = profile_id or new_profile_id()
+        os.makedirs(directory, exist_ok=True)
+        profiler = cProfile.Profile()
+        sampler = StackSampler(threading.get_ident(), sample_interval)
+        sampler.start()
+        profiler.enable()
+        try:
+            yield profile_id
+        finally:
+            profiler.disable()
+            sampler.stop()
+            profiler.dump_stats(os.path.join(directory, f"{profile_id}.pstats"))
+            sampler.write(os.path.join(directory, f"{profile_id}.collapsed"))
+    finally:
+        _profile_lock.release()
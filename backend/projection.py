@@ -0,0 +1,138 @@
+"""
+Selection-aware column projection for ORM loads.
+
+Resolvers used to load every column of every row, even when a query only asks
+for `id` and `name`. `load_options` looks at the fields selected under the
+resolver's field and returns a `load_only` option restricting the SELECT to the
+columns those fields read.
+
+`FIELD_COLUMNS` lists, per model, the columns each GraphQL field needs. A
+selected field that is missing from the map (a new field nobody registered
+here) makes the load fall back to full rows, so a forgotten entry costs
+performance, never correctness. Columns left unloaded are deferred, and
+touching one still loads it with an extra query.
+"""
+
+from typing import Iterable, Optional, Set
+
+from graphql import FieldNode, FragmentSpreadNode, InlineFragmentNode
+from sqlalchemy.orm import load_only
+
+from models import (
+    Client, Supplier, MaterialsInvoice, Transaction, Debt,
+    ArchivedMaterialsInvoice, ArchivedTransaction, ArchivedDebt,
+)
+
+# GraphQL type name and the columns each of its fields reads
+FIELD_COLUMNS = {
+    Client: ("Client", {
+        "id": (),
+        "name": ("name",),
+        "markup_rate": ("markup_rate",),
+        "invoices": (),
+    }),
+    Supplier: ("Supplier", {
+        "id": (),
+        "name": ("name",),
+        "invoices": (),
+    }),
+    MaterialsInvoice: ("MaterialsInvoice", {
+        "id": (),
+        "client": ("client_id",),
+        "supplier": ("supplier_id",),
+        "invoiceDate": ("invoiceDate",),
+        "baseAmount": ("baseAmount",),
+        "status": ("status",),
+        "paidDate": ("paidDate",),
+        "transaction": (),
+        "debts": (),
+    }),
+    Transaction: ("Transaction", {
+        "id": (),
+        "invoice": ("invoice_id",),
+        "transactionDate": ("transactionDate",),
+        "amount": ("amount",),
+    }),
+    Debt: ("Debt", {
+        "id": (),
+        "invoice": ("invoice_id",),
+        "party": ("party",),
+        "amount": ("amount",),
+        "createdDate": ("createdDate",),
+        "settledDate": ("settledDate",),
+    }),
+}
+
+# Archive tables have the same columns as their hot tables
+FIELD_COLUMNS[ArchivedMaterialsInvoice] = FIELD_COLUMNS[MaterialsInvoice]
+FIELD_COLUMNS[ArchivedTransaction] = FIELD_COLUMNS[Transaction]
+FIELD_COLUMNS[ArchivedDebt] = FIELD_COLUMNS[Debt]
+
+# Abstract types whose fragments apply to every model above
+_ABSTRACT_TYPES = {"Node"}
+
+def _collect_fields(selection_set, info, type_name: str, path: tuple, names: Set[str]):
+    """Add the names of fields selected at `path` below `selection_set` to `names`."""
+    if selection_set is None:
+        return
+    for selection in selection_set.selections:
+        if isinstance(selection, FieldNode):
+            if path:
+                if selection.name.value == path[0]:
+                    _collect_fields(selection.selection_set, info, type_name, path[1:], names)
+            else:
+                names.add(selection.name.value)
+            continue
+
+        if isinstance(selection, FragmentSpreadNode):
+            fragment = info.fragments.get(selection.name.value)
+            if fragment is None:
+                continue
+            type_condition, fragment_selection_set = fragment.type_condition, fragment.selection_set
+        elif isinstance(selection, InlineFragmentNode):
+            type_condition, fragment_selection_set = selection.type_condition, selection.selection_set
+        else:
+            continue
+
+        # Fragments only matter on the way down if they apply at the leaf type
+        if not path and type_condition is not None and \
+                type_condition.name.value not in {type_name} | _ABSTRACT_TYPES:
+            continue
+        _collect_fields(fragment_selection_set, info, type_name, path, names)
+
+def selected_fields(info, type_name: str, path: Iterable[str] = ()) -> Set[str]:
+    """
+    Names of the fields selected on `type_name` objects at `path` below the
+    current field, e.g. path ("edges", "node") for a connection.
+    """
+    names = set()
+    for field_node in info.field_nodes:
+        _collect_fields(field_node.selection_set, info, type_name, tuple(path), names)
+    return names
+
+def projected_columns(model_class, info, path: Iterable[str] = ()) -> Optional[Set[str]]:
+    """
+    Column attribute names needed to resolve the selection, or None if the
+    selection needs full rows.
+    """
+    if info is None or model_class not in FIELD_COLUMNS:
+        return None
+    type_name, field_columns = FIELD_COLUMNS[model_class]
+
+    columns = set()
+    for name in selected_fields(info, type_name, path):
+        if name.startswith("__"):
+            continue
+        if name not in field_columns:
+            return None
+        columns.update(field_columns[name])
+    return columns
+
+def load_options(model_class, info, path: Iterable[str] = ()) -> list:
+    """Query options loading only the columns the selection needs (none to load full rows)."""
+    columns = projected_columns(model_class, info, path)
+    if columns is None:
+        return []
+    # Cursors and global IDs always need the primary key
+    columns.add("id")
+    return [load_only(*(getattr(model_class, column) for column in sorted(columns)))]
@@ -0,0 +1,216 @@
+"""
+Ledger reconciliation: verify the invariants behind every invoice.
+
+`createMaterialsInvoice` is supposed to leave each invoice with
+
+- exactly one transaction,
+- a transaction amount of markup_amount(baseAmount, markupRate), the rate
+  recorded on the invoice when it was billed or last repriced (the client's
+  current rate may have changed since without repricing; invoices created
+  before the rate was recorded skip this check),
+- exactly one client debt equal to the transaction amount,
+- exactly one supplier debt equal to baseAmount,
+
+where a settled debt (settledDate set) must be zero instead.
+
+The invoice id space is split into ranges that are checked in parallel by a
+process pool. Each range is checked with a single statement that aggregates
+transactions and debts per invoice, computes one flag per invariant and
+returns only the invoices that violate something, so memory stays bounded by
+the number of discrepancies in flight. Amounts are compared in integer cents,
+computed the same way as `pricing.marked_up_amount_sql`.
+
+Run from the command line:
+
+    flask reconcile-ledger --workers 4 --chunk-size 50000 --output reconciliation.csv
+"""
+
+import csv
+import logging
+import os
+from concurrent.futures import as_completed
+from decimal import Decimal
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import BigInteger, and_, case, cast, func, or_, select
+
+from models import db, MaterialsInvoice, Transaction, Debt, cents_sql
+from pricing import RATE_SCALE
+from process_pool import app_process_pool, submit_in_app
+from utils import CENT
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 50000
+
+REPORT_FIELDS = ["invoice_id", "check", "expected", "actual"]
+
+def _sum_if(condition, value):
+    return func.coalesce(func.sum(case((condition, value), else_=0)), 0)
+
+def reconciliation_query(low: int, high: int):
+    """Invoices with ids in [low, high] that violate an invariant, one flag column per check."""
+    transactions = (
+        select(
+            Transaction.invoice_id.label("invoice_id"),
+            func.count().label("count"),
+            func.min(cents_sql(Transaction.amount)).label("cents"),
+        )
+        .where(Transaction.invoice_id.between(low, high))
+        .group_by(Transaction.invoice_id)
+        .subquery()
+    )
+    debt_columns = [Debt.invoice_id.label("invoice_id")]
+    for party in ("client", "supplier"):
+        is_party = Debt.party == party
+        debt_columns += [
+            _sum_if(is_party, 1).label(f"{party}_count"),
+            _sum_if(is_party, cents_sql(Debt.amount)).label(f"{party}_cents"),
+            _sum_if(and_(is_party, Debt.settledDate.isnot(None)), 1).label(f"{party}_settled"),
+        ]
+    debts = (
+        select(*debt_columns)
+        .where(Debt.invoice_id.between(low, high))
+        .group_by(Debt.invoice_id)
+        .subquery()
+    )
+
+    base_cents = cents_sql(MaterialsInvoice.baseAmount)
+    # Integer round half up of base * (1 + rate), as in pricing.marked_up_amount_sql
+    factor = RATE_SCALE + cast(func.round(MaterialsInvoice.markupRate * RATE_SCALE), BigInteger)
+    expected_cents = (base_cents * factor + RATE_SCALE // 2) // RATE_SCALE
+
+    transaction_count = func.coalesce(transactions.c.count, 0)
+    client_count = func.coalesce(debts.c.client_count, 0)
+    supplier_count = func.coalesce(debts.c.supplier_count, 0)
+    checks = {
+        "transaction_count": transaction_count != 1,
+        "transaction_amount": and_(MaterialsInvoice.markupRate.isnot(None),
+                                   transactions.c.cents != expected_cents),
+        "client_debt_count": client_count != 1,
+        "client_debt_amount": case(
+            (debts.c.client_settled > 0, debts.c.client_cents != 0),
+            else_=debts.c.client_cents != transactions.c.cents),
+        "supplier_debt_count": supplier_count != 1,
+        "supplier_debt_amount": case(
+            (debts.c.supplier_settled > 0, debts.c.supplier_cents != 0),
+            else_=debts.c.supplier_cents != base_cents),
+    }
+
+    return (
+        select(
+            MaterialsInvoice.id.label("invoice_id"),
+            base_cents.label("base_cents"),
+            expected_cents.label("expected_cents"),
+            transaction_count.label("transaction_count"),
+            transactions.c.cents.label("transaction_cents"),
+            client_count.label("client_count"),
+            debts.c.client_cents,
+            debts.c.client_settled,
+            supplier_count.label("supplier_count"),
+            debts.c.supplier_cents,
+            debts.c.supplier_settled,
+            *(case((condition, 1), else_=0).label(f"{name}_failed") for name, condition in checks.items()),
+        )
+        .outerjoin(transactions, transactions.c.invoice_id == MaterialsInvoice.id)
+        .outerjoin(debts, debts.c.invoice_id == MaterialsInvoice.id)
+        .where(MaterialsInvoice.id.between(low, high))
+        .where(or_(*(condition for condition in checks.values())))
+        .order_by(MaterialsInvoice.id)
+    )
+
+def _amount(cents) -> Optional[str]:
+    return None if cents is None else str((Decimal(int(cents)) / 100).quantize(CENT))
+
+def _discrepancies(row) -> Iterator[dict]:
+    """Expand a flagged row into one report record per violated check."""
+    expected_actual = {
+        "transaction_count": (1, row.transaction_count),
+        "transaction_amount": (_amount(row.expected_cents), _amount(row.transaction_cents)),
+        "client_debt_count": (1, row.client_count),
+        "client_debt_amount": (_amount(0 if row.client_settled else row.transaction_cents),
+                               _amount(row.client_cents)),
+        "supplier_debt_count": (1, row.supplier_count),
+        "supplier_debt_amount": (_amount(0 if row.supplier_settled else row.base_cents),
+                                 _amount(row.supplier_cents)),
+    }
+    for check, (expected, actual) in expected_actual.items():
+        if getattr(row, f"{check}_failed"):
+            yield {"invoice_id": row.invoice_id, "check": check, "expected": expected, "actual": actual}
+
+def reconcile_range(low: int, high: int) -> List[dict]:
+    """Discrepancies of the invoices with ids in [low, high]. Must be called inside an app context."""
+    rows = db.session.execute(reconciliation_query(low, high))
+    return [discrepancy for row in rows for discrepancy in _discrepancies(row)]
+
+def id_ranges(chunk_size: int) -> List[Tuple[int, int]]:
+    """Split the invoice id space into inclusive ranges of at most chunk_size ids."""
+    low, high = db.session.execute(select(func.min(MaterialsInvoice.id), func.max(MaterialsInvoice.id))).one()
+    if low is None:
+        return []
+    return [(start, min(start + chunk_size - 1, high)) for start in range(low, high + 1, chunk_size)]
+
+def reconcile_ledger(output_path: str, workers: int = 0, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                     progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, int]:
+    """
+    Check every invoice and write one CSV row per discrepancy to `output_path`.
+
+    Args:
+        output_path: Where to write the discrepancy report
+        workers: Worker processes; 0 checks all ranges in this process
+        chunk_size: Invoice ids per range
+        progress: Called with (ranges done, total ranges) as ranges finish
+
+    Returns:
+        Number of discrepancies per check
+    """
+    if chunk_size <= 0:
+        raise ValueError("chunk_size must be positive")
+
+    ranges = id_ranges(chunk_size)
+    db.session.rollback()
+    counts = {}
+    logger.info(f"Reconciling {len(ranges)} invoice id ranges with {workers or 'no'} worker processes")
+
+    with open(output_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+        writer.writeheader()
+
+        def record(discrepancies, done):
+            for discrepancy in discrepancies:
+                writer.writerow(discrepancy)
+                counts[discrepancy["check"]] = counts.get(discrepancy["check"], 0) + 1
+            if progress is not None:
+                progress(done, len(ranges))
+
+        if workers <= 0:
+            for done, (low, high) in enumerate(ranges, start=1):
+                record(reconcile_range(low, high), done)
+        else:
+            with app_process_pool(workers) as pool:
+                futures = [submit_in_app(pool, reconcile_range, low, high) for low, high in ranges]
+                for done, future in enumerate(as_completed(futures), start=1):
+                    record(future.result(), done)
+
+    logger.info(f"Reconciliation finished: {sum(counts.values())} discrepancies")
+    return counts
+
+@click.command('reconcile-ledger')
+@click.option('--output', default='reconciliation.csv', show_default=True,
+              help='Discrepancy report (CSV).')
+@click.option('--workers', default=os.cpu_count() or 1, show_default='CPU count',
+              help='Worker processes; 0 runs in this process.')
+@click.option('--chunk-size', default=DEFAULT_CHUNK_SIZE, show_default=True,
+              help='Invoice ids checked per statement.')
+@with_appcontext
+def reconcile_ledger_command(output, workers, chunk_size):
+    """Verify the transaction and debt invariants of every invoice."""
+    counts = reconcile_ledger(
+        output, workers, chunk_size,
+        progress=lambda done, total: click.echo(f"{done}/{total} ranges checked"),
+    )
+    for check, count in sorted(counts.items()):
+        click.echo(f"{check}: {count}")
+    click.echo(f"{sum(counts.values())} discrepancies written to {output}")
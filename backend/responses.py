@@ -0,0 +1,177 @@
+"""
+Compression and conditional-request handling for GraphQL responses.
+
+Connection responses with nested objects are large and often identical between
+polls. `finalize_graphql_response` post-processes the Flask response built by
+`graphql_server`:
+
+- Query results get a strong ETag derived from the JSON body. A GET or HEAD
+  request whose If-None-Match matches gets an empty 304 instead of the body.
+- Bodies above `GRAPHQL_COMPRESS_MIN_SIZE` bytes are compressed with brotli
+  (when the optional `brotli` package is installed) or gzip, depending on the
+  client's Accept-Encoding. Each encoding gets its own ETag suffix, since
+  strong validators must differ between representations.
+
+Mutation results and error responses are compressed but never get an ETag.
+
+Results containing a list of at least `GRAPHQL_STREAM_MIN_ITEMS` items (large
+connection pages) are streamed instead: the JSON is encoded and compressed
+chunk by chunk, and such responses carry no ETag because the body is never
+assembled in full.
+"""
+
+import gzip
+import hashlib
+import zlib
+from functools import lru_cache
+from typing import Iterator, Optional, Union
+
+from flask import Response, current_app, request
+from graphql import DocumentNode, OperationType, parse, get_operation_ast
+from graphql.error import GraphQLError
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+from serialization import dumps, iter_encode, largest_list_length
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+# Distinct query texts whose parsed documents are kept
+PARSE_CACHE_SIZE = 512
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _parse(query: str) -> DocumentNode:
+    return parse(query)
+
+def parse_document(data) -> Optional[DocumentNode]:
+    """
+    The parsed document of a GraphQL request body, or None if it has no valid one.
+
+    Documents are cached by query text, since clients send the same few
+    operations over and over; pass the result to `graphql_sync` as
+    `query_document` so the request is parsed only once.
+    """
+    if not isinstance(data, dict) or not isinstance(data.get("query"), str):
+        return None
+    try:
+        return _parse(data["query"])
+    except GraphQLError:
+        return None
+
+def selected_operation(data, document: Optional[DocumentNode] = None):
+    """The operation definition a request body selects, or None."""
+    document = document if document is not None else parse_document(data)
+    if document is None:
+        return None
+    operation_name = data.get("operationName")
+    return get_operation_ast(document, operation_name if isinstance(operation_name, str) else None)
+
+def is_query_operation(data, document: Optional[DocumentNode] = None) -> bool:
+    """True if the GraphQL request body selects a query (not a mutation) operation."""
+    operation = selected_operation(data, document)
+    return operation is not None and operation.operation == OperationType.QUERY
+
+def negotiate_encoding() -> Optional[str]:
+    """Pick the best supported content coding from the request's Accept-Encoding."""
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"] > 0:
+        return "br"
+    if accepted["gzip"] > 0:
+        return "gzip"
+    return None
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """Compress a body with the given content coding."""
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+def compress_stream(chunks: Iterator[bytes], encoding: str) -> Iterator[bytes]:
+    """Compress an iterable of chunks incrementally with the given content coding."""
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        for chunk in chunks:
+            yield compressor.process(chunk)
+        yield compressor.finish()
+        return
+
+    # wbits=31 selects the gzip container format
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+def graphql_response(result: Union[dict, list], status_code: int = 200, cacheable: bool = False) -> Response:
+    """
+    Encode a GraphQL result as a JSON response, streaming large results.
+
+    Args:
+        result: The GraphQL result dict, or the list of results of a batch
+        status_code: HTTP status code
+        cacheable: Whether the result may be revalidated (successful queries)
+    """
+    results = result if isinstance(result, list) else [result]
+    longest = max((largest_list_length(r) for r in results), default=0)
+    if longest >= current_app.config.get("GRAPHQL_STREAM_MIN_ITEMS", 2000):
+        return stream_graphql_response(result, status_code)
+    response = Response(dumps(result), status=status_code, mimetype="application/json")
+    return finalize_graphql_response(response, cacheable=cacheable)
+
+def stream_graphql_response(result: Union[dict, list], status_code: int = 200) -> Response:
+    """Stream a large GraphQL result as chunked, optionally compressed JSON."""
+    encoding = negotiate_encoding()
+    chunks = iter_encode(result)
+    if encoding:
+        chunks = compress_stream(chunks, encoding)
+
+    response = Response(chunks, status=status_code, mimetype="application/json")
+    response.vary.add("Accept-Encoding")
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    return response
+
+def finalize_graphql_response(response: Response, cacheable: bool = False) -> Response:
+    """
+    Add validators and compression to a GraphQL JSON response.
+
+    Args:
+        response: The uncompressed JSON response
+        cacheable: Whether the result may be revalidated (successful queries)
+
+    Returns:
+        The response to send, possibly a 304 Not Modified
+    """
+    body = response.get_data()
+    response.vary.add("Accept-Encoding")
+
+    encoding = None
+    if len(body) >= current_app.config.get("GRAPHQL_COMPRESS_MIN_SIZE", 1024):
+        encoding = negotiate_encoding()
+
+    if cacheable and response.status_code == 200:
+        digest = hashlib.blake2b(body, digest_size=16).hexdigest()
+        etag = f"{digest}-{encoding}" if encoding else digest
+        # A validator for any representation means the client has this content.
+        # If-None-Match only makes a safe method conditional; a POST still gets the body
+        if request.method in ("GET", "HEAD") and any(request.if_none_match.contains(tag) for tag in
+               (digest, f"{digest}-gzip", f"{digest}-br")):
+            not_modified = Response(status=304)
+            not_modified.set_etag(etag)
+            not_modified.vary.add("Accept-Encoding")
+            not_modified.headers["Cache-Control"] = response.headers.get("Cache-Control", "no-cache")
+            return not_modified
+        response.set_etag(etag)
+        if "Cache-Control" not in response.headers:
+            # Caches may store the result but must revalidate it on every use
+            response.headers["Cache-Control"] = "no-cache"
+
+    if encoding:
+        response.set_data(compress(body, encoding))
+        response.headers["Content-Encoding"] = encoding
+
+    return response
@@ -1,15 +1,33 @@
 import ariadne
-from ariadne import ObjectType, QueryType, MutationType, InterfaceType, make_executable_schema
+from ariadne import (
+    ObjectType, QueryType, MutationType, SubscriptionType, InterfaceType, UnionType, make_executable_schema
+)
 from ariadne.asgi import GraphQL
 from graphql import GraphQLError
 from datetime import datetime
+from sqlalchemy import select
 from sqlalchemy.exc import SQLAlchemyError
+import json
 import logging
 from decimal import Decimal
 import os
+from flask import current_app
 
-from models import db, Client, Supplier, MaterialsInvoice, Transaction, Debt, InvoiceStatus
-from utils import to_global_id, from_global_id
+from models import (
+    db, Client, Supplier, MaterialsInvoice, Transaction, Debt, InvoiceStatus, Job,
+    ArchivedMaterialsInvoice, ArchivedTransaction, ArchivedDebt,
+)
+from utils import to_global_id, from_global_id, markup_amount
+from pricing import update_client_markup
+from cache import entity_cache, ClientSnapshot, SupplierSnapshot
+from projection import load_options
+from archive import ARCHIVE_MODELS
+from filters import filter_predicates
+from search import search_counterparties
+from aging import aging_report, parse_as_of, BUCKET_FIELDS
+from analytics import analytics_cache, parse_day
+from settlement import settle_invoices
+from events import event_bus, INVOICE_CREATED, DEBT_CHANGED
 
 # Get logger
 logger = logging.getLogger(__name__)
@@ -31,14 +49,33 @@ type_defs = """
         node(id: ID!): Node
         clients(first: Int, after: String): ClientConnection!
         suppliers(first: Int, after: String): SupplierConnection!
-        invoices(first: Int, after: String): MaterialsInvoiceConnection!
-        transactions(first: Int, after: String): TransactionConnection!
-        debts(first: Int, after: String): DebtConnection!
+        invoices(
+            first: Int
+            after: String
+            includeArchived: Boolean = false
+            filter: InvoiceFilter
+        ): MaterialsInvoiceConnection!
+        transactions(
+            first: Int
+            after: String
+            includeArchived: Boolean = false
+            filter: TransactionFilter
+        ): TransactionConnection!
+        debts(
+            first: Int
+            after: String
+            includeArchived: Boolean = false
+            filter: DebtFilter
+        ): DebtConnection!
         client(id: ID!): Client
         supplier(id: ID!): Supplier
         invoice(id: ID!): MaterialsInvoice
         transaction(id: ID!): Transaction
         debt(id: ID!): Debt
+        job(id: ID!): Job
+        search(term: String!, first: Int = 10): [Counterparty!]!
+        agingReport(asOf: String!, party: String!, includeRows: Boolean = false): AgingReport!
+        invoiceAnalytics(dateFrom: String, dateTo: String): InvoiceAnalytics!
     }
     
     type Mutation {
@@ -49,12 +86,75 @@ type_defs = """
             baseAmount: Float!
             status: String
         ): MaterialsInvoicePayload!
+        updateClientMarkup(
+            clientId: ID!
+            rate: Float!
+            repriceUnpaid: Boolean = true
+        ): UpdateClientMarkupPayload!
+        startJob(kind: String!, params: String): JobPayload!
+        cancelJob(id: ID!): JobPayload!
+        settleInvoices(ids: [ID!]!, paidDate: String): SettleInvoicesPayload!
+    }
+
+    type Subscription {
+        invoiceCreated(clientId: ID, supplierId: ID): MaterialsInvoice!
+        debtChanged(invoiceId: ID, party: String): Debt!
     }
     
+    input InvoiceFilter {
+        clientId: ID
+        supplierId: ID
+        status: [String!]
+        dateFrom: String
+        dateTo: String
+        minAmount: Float
+        maxAmount: Float
+    }
+
+    input TransactionFilter {
+        invoiceId: ID
+        dateFrom: String
+        dateTo: String
+        minAmount: Float
+        maxAmount: Float
+    }
+
+    input DebtFilter {
+        invoiceId: ID
+        party: String
+        dateFrom: String
+        dateTo: String
+        minAmount: Float
+        maxAmount: Float
+    }
+
     type MaterialsInvoicePayload {
         invoice: MaterialsInvoice
         errors: [String]
     }
+
+    type UpdateClientMarkupPayload {
+        client: Client
+        repricedInvoices: Int!
+        errors: [String]
+    }
+
+    type JobPayload {
+        job: Job
+        errors: [String]
+    }
+
+    type SettlementFailure {
+        id: ID!
+        message: String!
+    }
+
+    type SettleInvoicesPayload {
+        settledInvoices: Int!
+        closedDebts: Int!
+        failures: [SettlementFailure!]!
+        errors: [String]
+    }
     
     type ClientEdge {
         node: Client!
@@ -70,7 +170,12 @@ type_defs = """
         id: ID!
         name: String!
         markup_rate: Float!
-        invoices(first: Int, after: String): MaterialsInvoiceConnection!
+        invoices(
+            first: Int
+            after: String
+            includeArchived: Boolean = false
+            filter: InvoiceFilter
+        ): MaterialsInvoiceConnection!
     }
     
     type SupplierEdge {
@@ -86,9 +191,58 @@ type_defs = """
     type Supplier implements Node {
         id: ID!
         name: String!
-        invoices(first: Int, after: String): MaterialsInvoiceConnection!
+        invoices(
+            first: Int
+            after: String
+            includeArchived: Boolean = false
+            filter: InvoiceFilter
+        ): MaterialsInvoiceConnection!
     }
     
+    union Counterparty = Client | Supplier
+
+    type AgingBuckets {
+        days0To30: Float!
+        days31To60: Float!
+        days61To90: Float!
+        over90: Float!
+        total: Float!
+    }
+
+    type AgingRow {
+        counterparty: Counterparty!
+        buckets: AgingBuckets!
+    }
+
+    type AgingReport {
+        asOf: String!
+        party: String!
+        totals: AgingBuckets!
+        rows: [AgingRow!]
+    }
+
+    type AnalyticsGroup {
+        key: String!
+        counterparty: Counterparty
+        count: Int!
+        total: Float!
+    }
+
+    type HistogramBin {
+        low: Float!
+        high: Float!
+        count: Int!
+    }
+
+    type InvoiceAnalytics {
+        invoiceCount: Int!
+        baseAmount: Float!
+        amount: Float!
+        markup: Float!
+        groups(by: String!, measure: String = "amount", first: Int): [AnalyticsGroup!]!
+        markupHistogram(bins: Int = 10): [HistogramBin!]!
+    }
+
     type MaterialsInvoiceEdge {
         node: MaterialsInvoice!
         cursor: String!
@@ -106,8 +260,9 @@ type_defs = """
         invoiceDate: String!
         baseAmount: Float!
         status: String!
+        paidDate: String
         transaction: Transaction
-        debts(first: Int, after: String): DebtConnection!
+        debts(first: Int, after: String, filter: DebtFilter): DebtConnection!
     }
     
     type TransactionEdge {
@@ -143,50 +298,123 @@ type_defs = """
         party: String!
         amount: Float!
         createdDate: String!
+        settledDate: String
+    }
+
+    type Job implements Node {
+        id: ID!
+        kind: String!
+        status: String!
+        progress: Int!
+        total: Int
+        message: String
+        result: String
+        error: String
+        createdDate: String!
+        startedDate: String
+        finishedDate: String
     }
 """
 
 # Add mutation fields
 mutation = MutationType()
 
+# Subscription fields, served over WebSockets by asgi.py
+subscription = SubscriptionType()
+
 # Setup resolvers
 query = QueryType()
 
+def request_cached(info, key, load):
+    """
+    Memoize a lookup in the request's loader cache, shared by every operation
+    of a batched request. Without a loader cache (subscriptions) it just loads.
+    """
+    loaders = info.context.get("loaders") if isinstance(info.context, dict) else None
+    if loaders is None:
+        return load()
+    if key not in loaders:
+        loaders[key] = load()
+    return loaders[key]
+
+def get_projected(model_class, info, db_id):
+    """
+    Load one row by primary key, fetching only the columns the selection needs.
+    Archived rows keep their ids, so a miss falls back to the archive table.
+    """
+    def load():
+        row = db.session.get(model_class, db_id, options=load_options(model_class, info))
+        if row is None and model_class in ARCHIVE_MODELS:
+            archive_class = ARCHIVE_MODELS[model_class]
+            row = db.session.get(archive_class, db_id, options=load_options(archive_class, info))
+        return row
+    return request_cached(info, ("get", model_class, db_id), load)
+
 # Query resolvers
 @query.field("client")
 def resolve_client(_, info, id):
     type_name, db_id = from_global_id(id)
     if type_name != "Client":
         return None
-    return Client.query.get(db_id)
+    return get_projected(Client, info, db_id)
 
 @query.field("supplier")
 def resolve_supplier(_, info, id):
     type_name, db_id = from_global_id(id)
     if type_name != "Supplier":
         return None
-    return Supplier.query.get(db_id)
+    return get_projected(Supplier, info, db_id)
 
 @query.field("invoice")
 def resolve_invoice(_, info, id):
     type_name, db_id = from_global_id(id)
     if type_name != "MaterialsInvoice":
         return None
-    return MaterialsInvoice.query.get(db_id)
+    return get_projected(MaterialsInvoice, info, db_id)
 
 @query.field("transaction")
 def resolve_transaction(_, info, id):
     type_name, db_id = from_global_id(id)
     if type_name != "Transaction":
         return None
-    return Transaction.query.get(db_id)
+    return get_projected(Transaction, info, db_id)
 
 @query.field("debt")
 def resolve_debt(_, info, id):
     type_name, db_id = from_global_id(id)
     if type_name != "Debt":
         return None
-    return Debt.query.get(db_id)
+    return get_projected(Debt, info, db_id)
+
+@query.field("job")
+def resolve_job(_, info, id):
+    type_name, db_id = from_global_id(id)
+    if type_name != "Job":
+        return None
+    return Job.query.get(db_id)
+
+@query.field("search")
+def resolve_search(_, info, term, first=10):
+    # Ranked name matches, served from the full-text index and the entity cache
+    return search_counterparties(term, first)
+
+@query.field("agingReport")
+def resolve_aging_report(_, info, asOf, party, includeRows=False):
+    """Open debts bucketed by invoice age, computed in one SQL statement."""
+    try:
+        return aging_report(parse_as_of(asOf), party, include_rows=includeRows)
+    except ValueError as e:
+        raise GraphQLError(str(e))
+
+@query.field("invoiceAnalytics")
+def resolve_invoice_analytics(_, info, dateFrom=None, dateTo=None):
+    """Dashboard aggregates, computed from the in-process columnar cache."""
+    if not analytics_cache.available:
+        raise GraphQLError("Invoice analytics are not available: NumPy is not installed or ANALYTICS_CACHE is off")
+    try:
+        return analytics_cache.view(parse_day(dateFrom), parse_day(dateTo))
+    except ValueError as e:
+        raise GraphQLError(str(e))
 
 # Type resolvers
 client = ObjectType("Client")
@@ -194,26 +422,35 @@ supplier = ObjectType("Supplier")
 materials_invoice = ObjectType("MaterialsInvoice")
 transaction = ObjectType("Transaction")
 debt = ObjectType("Debt")
+job = ObjectType("Job")
 
+# Clients and suppliers are served from the process-level entity cache
 @materials_invoice.field("client")
 def resolve_invoice_client(obj, *_):
-    return Client.query.get(obj.client_id)
+    return entity_cache.get_client(obj.client_id)
 
 @materials_invoice.field("supplier")
 def resolve_invoice_supplier(obj, *_):
-    return Supplier.query.get(obj.supplier_id)
+    return entity_cache.get_supplier(obj.supplier_id)
 
+# The children of an archived invoice are archived with it
 @materials_invoice.field("transaction")
-def resolve_invoice_transaction(obj, *_):
-    return Transaction.query.filter_by(invoice_id=obj.id).first()
+def resolve_invoice_transaction(obj, info):
+    model_class = ArchivedTransaction if isinstance(obj, ArchivedMaterialsInvoice) else Transaction
+    return request_cached(
+        info, ("transaction", model_class, obj.id),
+        lambda: model_class.query.options(*load_options(model_class, info)).filter_by(invoice_id=obj.id).first(),
+    )
 
 @transaction.field("invoice")
-def resolve_transaction_invoice(obj, *_):
-    return MaterialsInvoice.query.get(obj.invoice_id)
+def resolve_transaction_invoice(obj, info):
+    model_class = ArchivedMaterialsInvoice if isinstance(obj, ArchivedTransaction) else MaterialsInvoice
+    return get_projected(model_class, info, obj.invoice_id)
 
 @debt.field("invoice")
-def resolve_debt_invoice(obj, *_):
-    return MaterialsInvoice.query.get(obj.invoice_id)
+def resolve_debt_invoice(obj, info):
+    model_class = ArchivedMaterialsInvoice if isinstance(obj, ArchivedDebt) else MaterialsInvoice
+    return get_projected(model_class, info, obj.invoice_id)
 
 # ID field resolvers for each type
 @client.field("id")
@@ -236,7 +473,54 @@ def resolve_transaction_id(obj, info):
 def resolve_debt_id(obj, info):
     return to_global_id("Debt", obj.id)
 
+@job.field("id")
+def resolve_job_id(obj, info):
+    return to_global_id("Job", obj.id)
+
 # Numeric field resolvers to format decimal values consistently
+aging_buckets = ObjectType("AgingBuckets")
+
+def _make_bucket_resolver(name):
+    def resolve_bucket(obj, *_):
+        return float(obj[name])
+    return resolve_bucket
+
+for _bucket in BUCKET_FIELDS:
+    aging_buckets.set_field(_bucket, _make_bucket_resolver(_bucket))
+
+invoice_analytics = ObjectType("InvoiceAnalytics")
+analytics_group = ObjectType("AnalyticsGroup")
+
+@invoice_analytics.field("invoiceCount")
+def resolve_analytics_invoice_count(obj, *_):
+    return obj.count
+
+def _make_analytics_total_resolver(measure):
+    def resolve_total(obj, *_):
+        return float(obj.total(measure))
+    return resolve_total
+
+for _measure in ("baseAmount", "amount", "markup"):
+    invoice_analytics.set_field(_measure, _make_analytics_total_resolver(_measure))
+
+@invoice_analytics.field("groups")
+def resolve_analytics_groups(obj, info, by, measure="amount", first=None):
+    try:
+        return obj.groups(by, measure, first)
+    except ValueError as e:
+        raise GraphQLError(str(e))
+
+@invoice_analytics.field("markupHistogram")
+def resolve_analytics_markup_histogram(obj, info, bins=10):
+    try:
+        return obj.markup_histogram(bins)
+    except ValueError as e:
+        raise GraphQLError(str(e))
+
+@analytics_group.field("total")
+def resolve_analytics_group_total(obj, *_):
+    return float(obj["total"])
+
 @materials_invoice.field("invoiceDate")
 def resolve_materials_invoice_date(obj, *_):
     # Format invoiceDate as 'YYYY-MM-DD' without time component
@@ -247,6 +531,10 @@ def resolve_materials_invoice_status(obj, *_):
     # Return just the status name without the enum class prefix
     return obj.status.name
 
+@materials_invoice.field("paidDate")
+def resolve_materials_invoice_paid_date(obj, *_):
+    return obj.paidDate.strftime('%Y-%m-%d') if obj.paidDate else None
+
 @materials_invoice.field("baseAmount")
 def resolve_materials_invoice_base_amount(obj, *_):
     return float(obj.baseAmount)
@@ -263,6 +551,46 @@ def resolve_transaction_amount(obj, *_):
 def resolve_debt_amount(obj, *_):
     return float(obj.amount)
 
+@debt.field("settledDate")
+def resolve_debt_settled_date(obj, *_):
+    return obj.settledDate.strftime('%Y-%m-%d') if obj.settledDate else None
+
+# Job fields prefer live in-process progress over the periodically persisted values
+def _live_job_context(obj):
+    runner = current_app.extensions.get('jobs')
+    return runner.live_progress(obj.id) if runner else None
+
+@job.field("status")
+def resolve_job_status(obj, *_):
+    return obj.status.name
+
+@job.field("progress")
+def resolve_job_progress(obj, *_):
+    context = _live_job_context(obj)
+    return context.progress if context else obj.progress
+
+@job.field("total")
+def resolve_job_total(obj, *_):
+    context = _live_job_context(obj)
+    return context.total if context else obj.total
+
+@job.field("message")
+def resolve_job_message(obj, *_):
+    context = _live_job_context(obj)
+    return context.message if context else obj.message
+
+@job.field("createdDate")
+def resolve_job_created_date(obj, *_):
+    return obj.createdDate.isoformat()
+
+@job.field("startedDate")
+def resolve_job_started_date(obj, *_):
+    return obj.startedDate.isoformat() if obj.startedDate else None
+
+@job.field("finishedDate")
+def resolve_job_finished_date(obj, *_):
+    return obj.finishedDate.isoformat() if obj.finishedDate else None
+
 # Mutation resolvers
 @mutation.field("createMaterialsInvoice")
 def resolve_create_materials_invoice(_, info, clientId, supplierId, invoiceDate, baseAmount, status=None):
@@ -284,38 +612,44 @@ def resolve_create_materials_invoice(_, info, clientId, supplierId, invoiceDate,
             logger.error(f"Invalid ID types: client_type={client_type}, supplier_type={supplier_type}")
             return {"invoice": None, "errors": ["Invalid ID types provided"]}
         
-        # Validate existence
-        client = Client.query.get(client_db_id)
-        if not client:
-            logger.error(f"Client not found for ID={clientId}")
-            return {"invoice": None, "errors": [f"Client not found for ID={clientId}"]}
-            
-        supplier = Supplier.query.get(supplier_db_id)
-        if not supplier:
-            logger.error(f"Supplier not found for ID={supplierId}")
-            return {"invoice": None, "errors": [f"Supplier not found for ID={supplierId}"]}
-            
         # Validate amounts
         if baseAmount <= 0:
             logger.error(f"Invalid baseAmount: {baseAmount}. Must be positive.")
             return {"invoice": None, "errors": ["Base amount must be a positive number."]}
-            
-        if client.markup_rate < 0:
-            logger.error(f"Invalid markup_rate: {client.markup_rate}. Must be >= 0.")
-            return {"invoice": None, "errors": [f"Invalid markup_rate: {client.markup_rate}. Must be >= 0."]}
-            
-        # Additional validation: prevent client and supplier from being the same
-        # This validation is causing test failures, so we're disabling it entirely
-        # if client_db_id == supplier_db_id:
-        #     logger.error(f"Client and supplier cannot be the same entity")
-        #     return {"invoice": None, "errors": ["Client and supplier cannot be the same entity."]}
 
         # Ensure we have a clean session
         try:
             db.session.rollback()  # Roll back any existing transaction
         except:
             logger.warning("Could not rollback session, continuing anyway")
-            
+
+        # The markup rate decides the amounts, so it is read inside the write
+        # transaction rather than from the entity cache, and the client row is
+        # locked so a concurrent updateClientMarkup cannot reprice in between
+        client_markup_rate = db.session.execute(
+            select(Client.markup_rate).where(Client.id == client_db_id).with_for_update()
+        ).scalar_one_or_none()
+        if client_markup_rate is None:
+            db.session.rollback()
+            logger.error(f"Client not found for ID={clientId}")
+            return {"invoice": None, "errors": [f"Client not found for ID={clientId}"]}
+
+        if db.session.get(Supplier, supplier_db_id) is None:
+            db.session.rollback()
+            logger.error(f"Supplier not found for ID={supplierId}")
+            return {"invoice": None, "errors": [f"Supplier not found for ID={supplierId}"]}
+
+        if client_markup_rate < 0:
+            db.session.rollback()
+            logger.error(f"Invalid markup_rate: {client_markup_rate}. Must be >= 0.")
+            return {"invoice": None, "errors": [f"Invalid markup_rate: {client_markup_rate}. Must be >= 0."]}
+
+        # Additional validation: prevent client and supplier from being the same
+        # This validation is causing test failures, so we're disabling it entirely
+        # if client_db_id == supplier_db_id:
+        #     logger.error(f"Client and supplier cannot be the same entity")
+        #     return {"invoice": None, "errors": ["Client and supplier cannot be the same entity."]}
+
         # Set default status to UNPAID if not provided
         invoice_status = InvoiceStatus.UNPAID
         if status:
@@ -332,13 +666,14 @@ def resolve_create_materials_invoice(_, info, clientId, supplierId, invoiceDate,
             supplier_id=supplier_db_id,
             invoiceDate=invoiceDate,
             baseAmount=baseAmount,
-            status=invoice_status
+            status=invoice_status,
+            markupRate=client_markup_rate
         )
         db.session.add(invoice)
         db.session.flush()  # to generate invoice ID
 
         # Transaction and Debt logic
-        transaction_amount = invoice.baseAmount * (1 + client.markup_rate)
+        transaction_amount = markup_amount(invoice.baseAmount, client_markup_rate)
         transaction = Transaction(
             invoice_id=invoice.id,
             transactionDate=datetime.utcnow(),
@@ -364,6 +699,13 @@ def resolve_create_materials_invoice(_, info, clientId, supplierId, invoiceDate,
         # Commit the changes
         db.session.commit()
         logger.info(f"Created invoice ID={invoice.id} with transaction amount={transaction_amount}")
+
+        # Notify subscribers only once the rows are visible to other sessions
+        event_bus.publish(INVOICE_CREATED, {
+            "id": invoice.id, "client_id": client_db_id, "supplier_id": supplier_db_id})
+        for created_debt in (client_debt, supplier_debt):
+            event_bus.publish(DEBT_CHANGED, {
+                "id": created_debt.id, "invoice_id": invoice.id, "party": created_debt.party})
         
         return {"invoice": invoice, "errors": None}
             
@@ -376,22 +718,180 @@ def resolve_create_materials_invoice(_, info, clientId, supplierId, invoiceDate,
         db.session.rollback()
         return {"invoice": None, "errors": [f"Error creating invoice: {str(e)}"]}
 
-# Node interface resolver
+@mutation.field("updateClientMarkup")
+def resolve_update_client_markup(_, info, clientId, rate, repriceUnpaid=True):
+    """Change a client's markup rate and reprice its non-PAID invoices in bulk."""
+    logger.info(f"Updating markup rate: client={clientId}, rate={rate}, repriceUnpaid={repriceUnpaid}")
+
+    try:
+        rate = Decimal(str(rate))
+
+        client_type, client_db_id = from_global_id(clientId)
+        if client_type != "Client":
+            logger.error(f"Invalid ID type: client_type={client_type}")
+            return {"client": None, "repricedInvoices": 0, "errors": ["Invalid ID types provided"]}
+
+        if rate < 0:
+            logger.error(f"Invalid markup_rate: {rate}. Must be >= 0.")
+            return {"client": None, "repricedInvoices": 0, "errors": [f"Invalid markup_rate: {rate}. Must be >= 0."]}
+
+        if not entity_cache.get_client(client_db_id):
+            logger.error(f"Client not found for ID={clientId}")
+            return {"client": None, "repricedInvoices": 0, "errors": [f"Client not found for ID={clientId}"]}
+
+        result = update_client_markup(client_db_id, rate, reprice_unpaid=repriceUnpaid)
+        db.session.commit()
+
+        # Notify subscribers only once the rows are visible to other sessions
+        for debt_id, invoice_id, party in result.repriced_debts:
+            event_bus.publish(DEBT_CHANGED, {"id": debt_id, "invoice_id": invoice_id, "party": party})
+
+        return {"client": entity_cache.get_client(client_db_id), "repricedInvoices": result.repriced_invoices,
+                "errors": None}
+
+    except SQLAlchemyError as e:
+        logger.error(f"Database error during markup update: {str(e)}")
+        db.session.rollback()
+        return {"client": None, "repricedInvoices": 0, "errors": [f"Database error during markup update: {str(e)}"]}
+    except Exception as e:
+        logger.error(f"Error updating markup rate: {str(e)}")
+        db.session.rollback()
+        return {"client": None, "repricedInvoices": 0, "errors": [f"Error updating markup rate: {str(e)}"]}
+
+@mutation.field("startJob")
+def resolve_start_job(_, info, kind, params=None):
+    """Queue a background job; params is a JSON object passed to the handler."""
+    logger.info(f"Starting job: kind={kind}")
+
+    try:
+        params = json.loads(params) if params else {}
+        if not isinstance(params, dict):
+            return {"job": None, "errors": ["Job params must be a JSON object"]}
+    except ValueError as e:
+        return {"job": None, "errors": [f"Invalid job params: {str(e)}"]}
+
+    try:
+        return {"job": current_app.extensions['jobs'].submit(kind, params), "errors": None}
+    except ValueError as e:
+        return {"job": None, "errors": [str(e)]}
+    except SQLAlchemyError as e:
+        logger.error(f"Database error while starting job: {str(e)}")
+        db.session.rollback()
+        return {"job": None, "errors": [f"Database error while starting job: {str(e)}"]}
+
+@mutation.field("cancelJob")
+def resolve_cancel_job(_, info, id):
+    """Request cancellation of a queued or running job."""
+    type_name, db_id = from_global_id(id)
+    if type_name != "Job":
+        return {"job": None, "errors": ["Invalid ID types provided"]}
+
+    try:
+        if not current_app.extensions['jobs'].cancel(db_id):
+            return {"job": Job.query.get(db_id), "errors": [f"Job not found or already finished for ID={id}"]}
+        return {"job": Job.query.get(db_id), "errors": None}
+    except SQLAlchemyError as e:
+        logger.error(f"Database error while cancelling job: {str(e)}")
+        db.session.rollback()
+        return {"job": None, "errors": [f"Database error while cancelling job: {str(e)}"]}
+
+@mutation.field("settleInvoices")
+def resolve_settle_invoices(_, info, ids, paidDate=None):
+    """Mark a batch of invoices PAID and close their debts with set-based updates."""
+    logger.info(f"Settling {len(ids)} invoices, paidDate={paidDate}")
+    empty = {"settledInvoices": 0, "closedDebts": 0, "failures": []}
+
+    try:
+        paid_date = datetime.fromisoformat(paidDate) if paidDate else datetime.utcnow()
+    except ValueError:
+        return {**empty, "errors": [f"Invalid paidDate: {paidDate}. Expected YYYY-MM-DD"]}
+
+    failures = []
+    global_ids = {}
+    for global_id in ids:
+        try:
+            type_name, db_id = from_global_id(global_id)
+        except Exception:
+            type_name, db_id = None, None
+        if type_name != "MaterialsInvoice":
+            failures.append({"id": global_id, "message": "Invalid ID types provided"})
+            continue
+        global_ids[db_id] = global_id
+
+    try:
+        result = settle_invoices(global_ids, paid_date)
+        db.session.commit()
+    except SQLAlchemyError as e:
+        logger.error(f"Database error during settlement: {str(e)}")
+        db.session.rollback()
+        return {**empty, "errors": [f"Database error during settlement: {str(e)}"]}
+
+    # Notify subscribers only once the rows are visible to other sessions
+    for debt_id, invoice_id, party in result.closed_debts:
+        event_bus.publish(DEBT_CHANGED, {"id": debt_id, "invoice_id": invoice_id, "party": party})
+
+    failures.extend({"id": global_ids[db_id], "message": message} for db_id, message in result.failures.items())
+    return {
+        "settledInvoices": result.settled_invoices,
+        "closedDebts": len(result.closed_debts),
+        "failures": failures,
+        "errors": None,
+    }
+
+# Subscription sources filter bus events; resolvers load the row for each event
+def _global_id_filter(global_id, type_name):
+    if global_id is None:
+        return None
+    id_type, db_id = from_global_id(global_id)
+    if id_type != type_name:
+        raise GraphQLError(f"Invalid ID type for {type_name}: {global_id}")
+    return db_id
+
+@subscription.source("invoiceCreated")
+def invoice_created_source(_, info, clientId=None, supplierId=None):
+    client_db_id = _global_id_filter(clientId, "Client")
+    supplier_db_id = _global_id_filter(supplierId, "Supplier")
+    return event_bus.subscribe(INVOICE_CREATED, lambda event: (
+        client_db_id in (None, event["client_id"])
+        and supplier_db_id in (None, event["supplier_id"])
+    ))
+
+@subscription.field("invoiceCreated")
+def resolve_invoice_created(event, info, **_):
+    return get_projected(MaterialsInvoice, info, event["id"])
+
+@subscription.source("debtChanged")
+def debt_changed_source(_, info, invoiceId=None, party=None):
+    invoice_db_id = _global_id_filter(invoiceId, "MaterialsInvoice")
+    return event_bus.subscribe(DEBT_CHANGED, lambda event: (
+        invoice_db_id in (None, event["invoice_id"])
+        and party in (None, event["party"])
+    ))
+
+@subscription.field("debtChanged")
+def resolve_debt_changed(event, info, **_):
+    return get_projected(Debt, info, event["id"])
+
+# Node interface and Counterparty union resolvers
 node = InterfaceType("Node")
+counterparty = UnionType("Counterparty")
 
 @node.type_resolver
+@counterparty.type_resolver
 def resolve_node_type(obj, *_):
     # Determine the GraphQL type based on the Python class
-    if isinstance(obj, Client):
+    if isinstance(obj, (Client, ClientSnapshot)):
         return "Client"
-    elif isinstance(obj, Supplier):
+    elif isinstance(obj, (Supplier, SupplierSnapshot)):
         return "Supplier"
-    elif isinstance(obj, MaterialsInvoice):
+    elif isinstance(obj, (MaterialsInvoice, ArchivedMaterialsInvoice)):
         return "MaterialsInvoice"
-    elif isinstance(obj, Transaction):
+    elif isinstance(obj, (Transaction, ArchivedTransaction)):
         return "Transaction"
-    elif isinstance(obj, Debt):
+    elif isinstance(obj, (Debt, ArchivedDebt)):
         return "Debt"
+    elif isinstance(obj, Job):
+        return "Job"
     return None
 
 @query.field("node")
@@ -401,15 +901,17 @@ def resolve_node(_, info, id):
         type_name, db_id = from_global_id(id)
         
         if type_name == "Client":
-            return Client.query.get(db_id)
+            return get_projected(Client, info, db_id)
         elif type_name == "Supplier":
-            return Supplier.query.get(db_id)
+            return get_projected(Supplier, info, db_id)
         elif type_name == "MaterialsInvoice":
-            return MaterialsInvoice.query.get(db_id)
+            return get_projected(MaterialsInvoice, info, db_id)
         elif type_name == "Transaction":
-            return Transaction.query.get(db_id)
+            return get_projected(Transaction, info, db_id)
         elif type_name == "Debt":
-            return Debt.query.get(db_id)
+            return get_projected(Debt, info, db_id)
+        elif type_name == "Job":
+            return Job.query.get(db_id)
     except Exception as e:
         # Log error if necessary and return None if ID cannot be decoded
         logger.error(f"Error resolving node: {str(e)}")
@@ -417,41 +919,60 @@ def resolve_node(_, info, id):
     return None
 
 # Refactored resolve_connection function to consolidate pagination logic
-def resolve_connection(model_class, obj=None, info=None, first=None, after=None, **kwargs):
+def resolve_connection(model_class, obj=None, info=None, first=None, after=None, include_archived=False,
+                       filters=None, **kwargs):
     """
     Generic function to resolve GraphQL connections with pagination logic.
     
     Args:
         model_class: SQLAlchemy model class to query
         obj: Parent object for relationships (optional)
-        info: GraphQL resolver info (optional)
+        info: GraphQL resolver info (optional); when given, only the columns
+            selected under edges.node are loaded
         first: Number of items to fetch
         after: Cursor to fetch items after
+        include_archived: Also return rows moved to the model's archive table
+        filters: A filter input object (InvoiceFilter, TransactionFilter, DebtFilter)
         **kwargs: Additional filter parameters
     
     Returns:
         A connection object with edges and pageInfo
     """
-    # Determine the base query
-    if obj is not None:
-        # For relationship fields like client.invoices
-        # Determine the foreign key name based on the related table name
-        foreign_key = f"{obj.__class__.__name__.lower()}_id"
-        query = model_class.query.filter_by(**{foreign_key: obj.id})
-    else:
-        # For root queries
-        query = model_class.query
-    
-    # Apply additional filters if provided
-    if kwargs:
-        query = query.filter_by(**kwargs)
-    
-    # Apply cursor-based pagination if 'after' is provided
-    if after:
-        query = query.filter(model_class.id > after)
-    
-    # Apply limit with one extra to check for next page
-    items = query.limit(first + 1 if first else None).all()
+    model_classes = [model_class]
+    if include_archived and model_class in ARCHIVE_MODELS:
+        model_classes.append(ARCHIVE_MODELS[model_class])
+
+    # One extra item tells whether there is a next page
+    limit = first + 1 if first else None
+    items = []
+    for current_class in model_classes:
+        # Determine the base query
+        if obj is not None:
+            # For relationship fields like client.invoices
+            # Determine the foreign key name based on the related table name
+            foreign_key = f"{obj.__class__.__name__.lower()}_id"
+            query = current_class.query.filter_by(**{foreign_key: obj.id})
+        else:
+            # For root queries
+            query = current_class.query
+
+        # Load only the columns the selection under edges.node needs
+        query = query.options(*load_options(current_class, info, ("edges", "node")))
+
+        # Apply additional filters if provided
+        if kwargs:
+            query = query.filter_by(**kwargs)
+        query = query.filter(*filter_predicates(current_class, filters))
+
+        # Apply cursor-based pagination if 'after' is provided
+        if after:
+            query = query.filter(current_class.id > after)
+
+        items.extend(query.order_by(current_class.id).limit(limit).all())
+
+    if len(model_classes) > 1:
+        # Archived rows keep their ids, so the two tables merge into one id order
+        items = sorted(items, key=lambda item: item.id)[:limit]
     
     # Determine if there is a next page
     has_next_page = first is not None and len(items) > first
@@ -486,45 +1007,62 @@ def resolve_connection(model_class, obj=None, info=None, first=None, after=None,
 # Replace individual connection resolvers with the generic function
 @query.field("clients")
 def resolve_clients(_, info, first=None, after=None):
-    return resolve_connection(Client, first=first, after=after)
+    return resolve_connection(Client, info=info, first=first, after=after)
 
 @query.field("suppliers")
 def resolve_suppliers(_, info, first=None, after=None):
-    return resolve_connection(Supplier, first=first, after=after)
+    return resolve_connection(Supplier, info=info, first=first, after=after)
 
 @query.field("invoices")
-def resolve_invoices(_, info, first=None, after=None):
-    return resolve_connection(MaterialsInvoice, first=first, after=after)
+def resolve_invoices(_, info, first=None, after=None, includeArchived=False, filter=None):
+    return resolve_connection(MaterialsInvoice, info=info, first=first, after=after,
+                              include_archived=includeArchived, filters=filter)
 
 @query.field("transactions")
-def resolve_transactions(_, info, first=None, after=None):
-    return resolve_connection(Transaction, first=first, after=after)
+def resolve_transactions(_, info, first=None, after=None, includeArchived=False, filter=None):
+    return resolve_connection(Transaction, info=info, first=first, after=after,
+                              include_archived=includeArchived, filters=filter)
 
 @query.field("debts")
-def resolve_debts(_, info, first=None, after=None):
-    return resolve_connection(Debt, first=first, after=after)
+def resolve_debts(_, info, first=None, after=None, includeArchived=False, filter=None):
+    return resolve_connection(Debt, info=info, first=first, after=after,
+                              include_archived=includeArchived, filters=filter)
 
+# Relationship connections filter on the foreign key explicitly, since the parent
+# may be an ORM row or a cached snapshot
 @client.field("invoices")
-def resolve_client_invoices(obj, info, first=None, after=None):
-    return resolve_connection(MaterialsInvoice, obj=obj, first=first, after=after)
+def resolve_client_invoices(obj, info, first=None, after=None, includeArchived=False, filter=None):
+    return resolve_connection(MaterialsInvoice, info=info, first=first, after=after,
+                              include_archived=includeArchived, filters=filter, client_id=obj.id)
 
 @supplier.field("invoices")
-def resolve_supplier_invoices(obj, info, first=None, after=None):
-    return resolve_connection(MaterialsInvoice, obj=obj, first=first, after=after)
+def resolve_supplier_invoices(obj, info, first=None, after=None, includeArchived=False, filter=None):
+    return resolve_connection(MaterialsInvoice, info=info, first=first, after=after,
+                              include_archived=includeArchived, filters=filter, supplier_id=obj.id)
 
 @materials_invoice.field("debts")
-def resolve_invoice_debts(obj, info, first=None, after=None):
-    return resolve_connection(Debt, obj=obj, first=first, after=after)
+def resolve_invoice_debts(obj, info, first=None, after=None, filter=None):
+    model_class = ArchivedDebt if isinstance(obj, ArchivedMaterialsInvoice) else Debt
+    return resolve_connection(model_class, info=info, first=first, after=after, filters=filter,
+                              invoice_id=obj.id)
 
-# Create executable schema
-schema = make_executable_schema(
-    type_defs, 
-    query, 
+# Bindables are kept in a list so asgi.py can build its own schema from them
+bindables = [
+    query,
     mutation,
+    subscription,
     client,
     supplier,
     materials_invoice,
     transaction,
     debt,
-    node
-) 
\ No newline at end of file
+    job,
+    node,
+    counterparty,
+    aging_buckets,
+    invoice_analytics,
+    analytics_group,
+]
+
+# Create executable schema
+schema = make_executable_schema(type_defs, *bindables) 
\ No newline at end of file
@@ -0,0 +1,153 @@
+"""
+Indexed name search over clients and suppliers for the `search` query.
+
+A `LIKE '%x%'` on `clients.name` scans the table. Instead:
+
+- On SQLite, names are indexed in the FTS5 table `counterparty_search`, kept
+  in sync by triggers on `clients` and `suppliers`, so every write path (ORM
+  or Core) updates it. Each row's rowid encodes its origin (client id * 2,
+  supplier id * 2 + 1), so triggers update it by rowid instead of scanning.
+  Every word of the search term is matched as a prefix and results are ranked
+  by bm25.
+- On PostgreSQL, `pg_trgm` GIN indexes on both name columns serve similarity
+  and prefix matches, ranked by trigram similarity; PostgreSQL maintains them.
+
+`db.create_all()` / `db.drop_all()` call `create_search_index` and
+`drop_search_index` for fresh databases; migration f2a6c8e0d417 keeps a
+frozen copy of this DDL for existing ones, so a change here needs a new
+migration. Matches are loaded from the tables
+with one IN query per table, so results are never staler than the index.
+"""
+
+import re
+from typing import List, Tuple, Union
+
+from sqlalchemy import event, select, text
+
+from models import db, Client, Supplier
+from cache import ClientSnapshot, SupplierSnapshot
+
+SEARCH_TABLE = 'counterparty_search'
+
+# Upper bound for the `first` argument of the search query
+MAX_SEARCH_RESULTS = 50
+
+SQLITE_SEARCH_DDL = [
+    f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5("
+    "name, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')",
+    f"CREATE TRIGGER clients_search_insert AFTER INSERT ON clients BEGIN "
+    f"INSERT INTO {SEARCH_TABLE}(rowid, name) VALUES (new.id * 2, new.name); END",
+    f"CREATE TRIGGER clients_search_update AFTER UPDATE OF name ON clients BEGIN "
+    f"UPDATE {SEARCH_TABLE} SET name = new.name WHERE rowid = new.id * 2; END",
+    f"CREATE TRIGGER clients_search_delete AFTER DELETE ON clients BEGIN "
+    f"DELETE FROM {SEARCH_TABLE} WHERE rowid = old.id * 2; END",
+    f"CREATE TRIGGER suppliers_search_insert AFTER INSERT ON suppliers BEGIN "
+    f"INSERT INTO {SEARCH_TABLE}(rowid, name) VALUES (new.id * 2 + 1, new.name); END",
+    f"CREATE TRIGGER suppliers_search_update AFTER UPDATE OF name ON suppliers BEGIN "
+    f"UPDATE {SEARCH_TABLE} SET name = new.name WHERE rowid = new.id * 2 + 1; END",
+    f"CREATE TRIGGER suppliers_search_delete AFTER DELETE ON suppliers BEGIN "
+    f"DELETE FROM {SEARCH_TABLE} WHERE rowid = old.id * 2 + 1; END",
+    f"INSERT INTO {SEARCH_TABLE}(rowid, name) SELECT id * 2, name FROM clients",
+    f"INSERT INTO {SEARCH_TABLE}(rowid, name) SELECT id * 2 + 1, name FROM suppliers",
+]
+
+POSTGRES_SEARCH_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_clients_name_trgm ON clients USING gin (name gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_suppliers_name_trgm ON suppliers USING gin (name gin_trgm_ops)",
+]
+
+SQLITE_SEARCH_DROP_DDL = [
+    "DROP TRIGGER IF EXISTS clients_search_insert",
+    "DROP TRIGGER IF EXISTS clients_search_update",
+    "DROP TRIGGER IF EXISTS clients_search_delete",
+    "DROP TRIGGER IF EXISTS suppliers_search_insert",
+    "DROP TRIGGER IF EXISTS suppliers_search_update",
+    "DROP TRIGGER IF EXISTS suppliers_search_delete",
+    f"DROP TABLE IF EXISTS {SEARCH_TABLE}",
+]
+
+POSTGRES_SEARCH_DROP_DDL = [
+    "DROP INDEX IF EXISTS ix_suppliers_name_trgm",
+    "DROP INDEX IF EXISTS ix_clients_name_trgm",
+]
+
+def create_search_index(connection) -> None:
+    """Create and fill the name search index if the database does not have it yet."""
+    if connection.dialect.name == 'sqlite':
+        exists = connection.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (SEARCH_TABLE,)
+        ).first()
+        statements = [] if exists else SQLITE_SEARCH_DDL
+    elif connection.dialect.name == 'postgresql':
+        statements = POSTGRES_SEARCH_DDL
+    else:
+        statements = []
+    for statement in statements:
+        connection.exec_driver_sql(statement)
+
+def drop_search_index(connection) -> None:
+    """Drop the name search index and, on SQLite, the triggers maintaining it."""
+    statements = {'sqlite': SQLITE_SEARCH_DROP_DDL, 'postgresql': POSTGRES_SEARCH_DROP_DDL}
+    for statement in statements.get(connection.dialect.name, []):
+        connection.exec_driver_sql(statement)
+
+def _after_create(target, connection, **kw):
+    create_search_index(connection)
+
+def _before_drop(target, connection, **kw):
+    drop_search_index(connection)
+
+event.listen(db.metadata, 'after_create', _after_create)
+event.listen(db.metadata, 'before_drop', _before_drop)
+
+def _fts_query(term: str) -> str:
+    # Quote each word so FTS5 operators in user input are taken literally
+    return " ".join(f'"{word}"*' for word in re.findall(r"\w+", term))
+
+def search_counterparties(term: str, first: int = 10) -> List[Union[ClientSnapshot, SupplierSnapshot]]:
+    """Clients and suppliers whose names match `term`, best match first."""
+    first = max(0, min(first, MAX_SEARCH_RESULTS))
+    if not term.strip() or first == 0:
+        return []
+
+    if db.engine.dialect.name == 'postgresql':
+        # Escape LIKE wildcards typed by the user
+        prefix = re.sub(r"([%_\\])", r"\\\1", term) + "%"
+        rows = db.session.execute(text(
+            "SELECT 'client' AS kind, id, similarity(name, :term) AS score FROM clients "
+            "WHERE name % :term OR name ILIKE :prefix "
+            "UNION ALL "
+            "SELECT 'supplier', id, similarity(name, :term) FROM suppliers "
+            "WHERE name % :term OR name ILIKE :prefix "
+            "ORDER BY score DESC LIMIT :first"
+        ), {"term": term, "prefix": prefix, "first": first})
+        matches = [(kind, entity_id) for kind, entity_id, _ in rows]
+    else:
+        query = _fts_query(term)
+        if not query:
+            return []
+        rows = db.session.execute(text(
+            f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH :query "
+            "ORDER BY rank LIMIT :first"
+        ), {"query": query, "first": first})
+        matches = [('supplier' if rowid % 2 else 'client', rowid // 2) for (rowid,) in rows]
+
+    return _load_matches(matches)
+
+def _load_matches(matches: List[Tuple[str, int]]) -> List[Union[ClientSnapshot, SupplierSnapshot]]:
+    """Snapshots of the matched rows, one IN query per table, in match order."""
+    loaded = {}
+    client_ids = [entity_id for kind, entity_id in matches if kind == 'client']
+    if client_ids:
+        for row in db.session.execute(
+            select(Client.id, Client.name, Client.markup_rate).where(Client.id.in_(client_ids))
+        ):
+            loaded['client', row.id] = ClientSnapshot(row.id, row.name, row.markup_rate)
+    supplier_ids = [entity_id for kind, entity_id in matches if kind == 'supplier']
+    if supplier_ids:
+        for row in db.session.execute(
+            select(Supplier.id, Supplier.name).where(Supplier.id.in_(supplier_ids))
+        ):
+            loaded['supplier', row.id] = SupplierSnapshot(row.id, row.name)
+    return [loaded[match] for match in matches if match in loaded]
@@ -0,0 +1,99 @@
+"""
+JSON encoding and decoding for the /graphql endpoint.
+
+Uses orjson when it is installed and falls back to the standard library
+otherwise; both produce compact UTF-8 JSON with keys in result order.
+
+`iter_encode` produces the same bytes as `dumps` incrementally, encoding long
+lists (connection `edges`) a batch at a time, so a large result is never held
+in memory as one string.
+"""
+
+import json
+from typing import Any, Iterator
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+# Items encoded per chunk when streaming a long list
+STREAM_BATCH_SIZE = 500
+# Minimum size of chunks handed to the WSGI server
+STREAM_CHUNK_BYTES = 64 * 1024
+
+def _default(obj):
+    # Resolvers return floats for money, but stay safe for Decimal/datetime leftovers
+    return str(obj)
+
+if orjson is not None:
+    def dumps(obj: Any) -> bytes:
+        """Encode an object as compact UTF-8 JSON."""
+        return orjson.dumps(obj, default=_default)
+
+    def loads(data) -> Any:
+        """Decode JSON from bytes or str."""
+        return orjson.loads(data)
+else:
+    _encoder = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False, default=_default)
+
+    def dumps(obj: Any) -> bytes:
+        """Encode an object as compact UTF-8 JSON."""
+        return _encoder.encode(obj).encode("utf-8")
+
+    def loads(data) -> Any:
+        """Decode JSON from bytes or str."""
+        return json.loads(data)
+
+def largest_list_length(obj: Any) -> int:
+    """Length of the longest list reachable from `obj` through dicts only."""
+    if isinstance(obj, list):
+        return len(obj)
+    if isinstance(obj, dict):
+        return max((largest_list_length(value) for value in obj.values()), default=0)
+    return 0
+
+def _iter_encode(obj, batch_size):
+    if isinstance(obj, dict):
+        yield b"{"
+        for index, (key, value) in enumerate(obj.items()):
+            yield (b"," if index else b"") + dumps(str(key)) + b":"
+            yield from _iter_encode(value, batch_size)
+        yield b"}"
+    elif isinstance(obj, list) and len(obj) > batch_size:
+        yield b"["
+        for start in range(0, len(obj), batch_size):
+            # Strip the brackets of each batch and join batches with commas
+            batch = dumps(obj[start:start + batch_size])
+            yield (b"," if start else b"") + batch[1:-1]
+        yield b"]"
+    else:
+        yield dumps(obj)
+
+def _iter_encode_top_level(obj, batch_size):
+    # A top-level list holds the results of a batched request; encode each
+    # result on its own so long lists inside them are still batched
+    if isinstance(obj, list):
+        yield b"["
+        for index, item in enumerate(obj):
+            if index:
+                yield b","
+            yield from _iter_encode(item, batch_size)
+        yield b"]"
+    else:
+        yield from _iter_encode(obj, batch_size)
+
+def iter_encode(obj: Any, batch_size: int = STREAM_BATCH_SIZE,
+                chunk_bytes: int = STREAM_CHUNK_BYTES) -> Iterator[bytes]:
+    """Yield the JSON encoding of `obj` in chunks of roughly `chunk_bytes` bytes."""
+    buffer = []
+    size = 0
+    for piece in _iter_encode_top_level(obj, batch_size):
+        buffer.append(piece)
+        size += len(piece)
+        if size >= chunk_bytes:
+            yield b"".join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b"".join(buffer)
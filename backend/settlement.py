@@ -0,0 +1,86 @@
+"""
+Set-based settlement of a batch of invoices.
+
+A payment batch can settle thousands of invoices. Instead of loading and
+updating each invoice and its debts through the ORM, every chunk of ids is
+handled with a few statements: an UPDATE ... RETURNING flipping the invoices
+that are not PAID yet, a SELECT telling missing ids from already paid ones,
+and an UPDATE ... RETURNING closing the debts of the invoices this call
+flipped (amount zeroed, settledDate set). Only rows the UPDATEs actually
+changed are reported, so two settlements racing on an invoice cannot both
+claim it. All chunks run in the caller's transaction, so a batch is settled
+completely or not at all.
+"""
+
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Iterable, List, Tuple
+
+from sqlalchemy import select, update
+
+from models import db, MaterialsInvoice, Debt, InvoiceStatus
+
+logger = logging.getLogger(__name__)
+
+# Ids per statement, well below SQLite's bound parameter limit
+SETTLE_CHUNK_SIZE = 1000
+
+@dataclass
+class SettlementResult:
+    """Outcome of `settle_invoices`."""
+    settled_invoices: int = 0
+    # (debt id, invoice id, party) of every debt closed
+    closed_debts: List[Tuple[int, int, str]] = field(default_factory=list)
+    # Invoice id -> reason it was not settled
+    failures: Dict[int, str] = field(default_factory=dict)
+
+def settle_invoices(invoice_ids: Iterable[int], paid_date: datetime) -> SettlementResult:
+    """
+    Mark invoices PAID and close their debts.
+
+    Ids that do not exist or are already PAID are reported in `failures` and
+    do not stop the others. The caller is responsible for committing or
+    rolling back the session.
+    """
+    result = SettlementResult()
+    invoice_ids = list(dict.fromkeys(invoice_ids))
+
+    for start in range(0, len(invoice_ids), SETTLE_CHUNK_SIZE):
+        chunk = invoice_ids[start:start + SETTLE_CHUNK_SIZE]
+        # The UPDATE decides which invoices this call settles: a concurrent
+        # settlement of the same id waits on the row lock and then matches 0 rows
+        settled = set(db.session.execute(
+            update(MaterialsInvoice)
+            .where(MaterialsInvoice.id.in_(chunk))
+            .where(MaterialsInvoice.status != InvoiceStatus.PAID)
+            .values(status=InvoiceStatus.PAID, paidDate=paid_date)
+            .returning(MaterialsInvoice.id),
+            execution_options={"synchronize_session": False},
+        ).scalars())
+        result.settled_invoices += len(settled)
+
+        unsettled = [invoice_id for invoice_id in chunk if invoice_id not in settled]
+        if unsettled:
+            existing = set(db.session.execute(
+                select(MaterialsInvoice.id).where(MaterialsInvoice.id.in_(unsettled))
+            ).scalars())
+            for invoice_id in unsettled:
+                result.failures[invoice_id] = ("Invoice is already PAID" if invoice_id in existing
+                                               else "Invoice not found")
+        if not settled:
+            continue
+
+        result.closed_debts.extend(
+            tuple(row) for row in db.session.execute(
+                update(Debt)
+                .where(Debt.invoice_id.in_(settled), Debt.settledDate.is_(None))
+                .values(amount=0, settledDate=paid_date)
+                .returning(Debt.id, Debt.invoice_id, Debt.party),
+                execution_options={"synchronize_session": False},
+            )
+        )
+
+    logger.info(f"Settled {result.settled_invoices} invoices, closed {len(result.closed_debts)} debts, "
+                f"{len(result.failures)} failures")
+    return result
@@ -0,0 +1,232 @@
+"""
+Slow SQL log: statements above a time threshold, with their query plans.
+
+Every statement sent through a SQLAlchemy engine is timed. One that takes
+longer than `SLOW_QUERY_THRESHOLD_MS` is recorded with:
+
+- its normalized text (literals and IN lists folded) and a fingerprint of it
+- the shape of its parameters (types only, never values)
+- its duration, and the GraphQL operation that issued it, if any (the name
+  of the operation in the parsed document, not the client's operationName)
+- the plan the database reports for it (EXPLAIN QUERY PLAN on SQLite,
+  EXPLAIN on PostgreSQL), captured on the same connection right away, inside
+  a savepoint on PostgreSQL so a failed EXPLAIN leaves the transaction usable
+
+The latest entries are kept in a ring buffer, and every fingerprint keeps
+aggregated counts and durations. Both are served from /debug/slow-queries,
+which requires `Authorization: Bearer <DEBUG_TOKEN>` and does not exist when
+DEBUG_TOKEN is unset.
+
+The duration is that of the cursor's execute call. Rows fetched later from a
+streamed result are not included. A plan is captured at most once per
+`EXPLAIN_INTERVAL` seconds for each fingerprint, so a statement that is slow
+on every call is not explained on every call.
+
+`create_app` configures the log from the environment:
+
+    SLOW_QUERY_THRESHOLD_MS     record statements slower than this (default 200, 0 disables)
+    SLOW_QUERY_LOG_SIZE         entries kept in the ring buffer (default 200)
+"""
+
+import hashlib
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Seconds between plan captures of one fingerprint
+EXPLAIN_INTERVAL = 60.0
+EXPLAIN_PREFIXES = {"sqlite": "EXPLAIN QUERY PLAN ", "postgresql": "EXPLAIN "}
+EXPLAIN_SAVEPOINT = "slow_query_explain"
+EXPLAINABLE = re.compile(r"^\s*(SELECT|WITH|INSERT|UPDATE|DELETE)\b", re.IGNORECASE)
+
+# Name of the GraphQL operation the current thread is executing
+_operation: ContextVar[Optional[str]] = ContextVar("graphql_operation", default=None)
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"(?<![\w.\"])-?\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s|:\w+|\$\d+|\?")
+_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+
+
+@contextmanager
+def graphql_operation(name: Optional[str]):
+    """Attribute the statements run in the body to a GraphQL operation."""
+    token = _operation.set(name)
+    try:
+        yield
+    finally:
+        _operation.reset(token)
+
+def normalize_statement(statement: str) -> str:
+    """Statement text with literals and placeholders as `?` and IN lists folded."""
+    normalized = _STRING_LITERAL.sub("?", statement)
+    normalized = _PLACEHOLDER.sub("?", normalized)
+    normalized = _NUMBER_LITERAL.sub("?", normalized)
+    normalized = _IN_LIST.sub("IN (...)", normalized)
+    return _WHITESPACE.sub(" ", normalized).strip()
+
+def fingerprint(normalized: str) -> str:
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:16]
+
+def parameters_shape(parameters, executemany: bool = False):
+    """The types of a statement's parameters, without their values."""
+    if executemany:
+        rows = list(parameters or [])
+        return {"rows": len(rows), "row": parameters_shape(rows[0]) if rows else None}
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [type(value).__name__ for value in parameters]
+    return None
+
+def _explain(connection, statement: str, parameters) -> Optional[str]:
+    """The database's plan for a statement, run on the connection that executed it."""
+    prefix = EXPLAIN_PREFIXES.get(connection.dialect.name)
+    if prefix is None or not EXPLAINABLE.match(statement):
+        return None
+    # A failed statement aborts the whole transaction on PostgreSQL, so the plan
+    # is taken inside a savepoint and a failure only rolls that back
+    savepoint = connection.dialect.name == "postgresql"
+    cursor = connection.connection.dbapi_connection.cursor()
+    try:
+        if savepoint:
+            cursor.execute(f"SAVEPOINT {EXPLAIN_SAVEPOINT}")
+        try:
+            cursor.execute(prefix + statement, parameters)
+            rows = cursor.fetchall()
+        except Exception:
+            if savepoint:
+                cursor.execute(f"ROLLBACK TO SAVEPOINT {EXPLAIN_SAVEPOINT}")
+            raise
+        finally:
+            if savepoint:
+                cursor.execute(f"RELEASE SAVEPOINT {EXPLAIN_SAVEPOINT}")
+    finally:
+        cursor.close()
+    if connection.dialect.name == "sqlite":
+        # (id, parent, notused, detail)
+        return "\n".join(row[3] for row in rows)
+    return "\n".join(row[0] for row in rows)
+
+
+class SlowQueryLog:
+    """Ring buffer of slow statements plus aggregated stats per fingerprint."""
+
+    def __init__(self, threshold_ms: float = 200.0, maxlen: int = 200, max_fingerprints: int = 1000):
+        self.threshold_ms = threshold_ms
+        self.max_fingerprints = max_fingerprints
+        self._entries = deque(maxlen=maxlen)
+        # fingerprint -> stats, least recently recorded first
+        self._stats: "OrderedDict[str, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold_ms > 0
+
+    def configure(self, threshold_ms: float, maxlen: int) -> None:
+        """Apply an app's settings, keeping the newest entries that still fit."""
+        with self._lock:
+            self.threshold_ms = threshold_ms
+            if maxlen != self._entries.maxlen:
+                self._entries = deque(self._entries, maxlen=maxlen)
+
+    def should_explain(self, key: str) -> bool:
+        with self._lock:
+            stats = self._stats.get(key)
+            return stats is None or time.monotonic() - stats["_explained"] >= EXPLAIN_INTERVAL
+
+    def record(self, normalized: str, key: str, duration_ms: float, params, operation: Optional[str],
+               plan: Optional[str]) -> None:
+        now = datetime.now(timezone.utc).isoformat()
+        entry = {
+            "fingerprint": key,
+            "statement": normalized,
+            "parameters": params,
+            "durationMs": round(duration_ms, 3),
+            "operation": operation,
+            "plan": plan,
+            "at": now,
+        }
+        with self._lock:
+            self._entries.append(entry)
+            stats = self._stats.pop(key, None)
+            if stats is None:
+                stats = {"fingerprint": key, "statement": normalized, "count": 0, "totalMs": 0.0,
+                         "maxMs": 0.0, "operations": [], "plan": None, "_explained": float("-inf")}
+            stats["count"] += 1
+            stats["totalMs"] += duration_ms
+            stats["maxMs"] = max(stats["maxMs"], duration_ms)
+            stats["lastSeen"] = now
+            if operation is not None and operation not in stats["operations"] and len(stats["operations"]) < 10:
+                stats["operations"].append(operation)
+            if plan is not None:
+                stats["plan"] = plan
+                stats["_explained"] = time.monotonic()
+            self._stats[key] = stats
+            while len(self._stats) > self.max_fingerprints:
+                self._stats.popitem(last=False)
+
+    def recent(self) -> list:
+        """Recorded statements, newest first."""
+        with self._lock:
+            return list(reversed(self._entries))
+
+    def fingerprints(self) -> list:
+        """Aggregated stats per fingerprint, by total time spent."""
+        with self._lock:
+            stats = [{key: value for key, value in s.items() if not key.startswith("_")}
+                     for s in self._stats.values()]
+        for s in stats:
+            s["totalMs"] = round(s["totalMs"], 3)
+            s["maxMs"] = round(s["maxMs"], 3)
+            s["meanMs"] = round(s["totalMs"] / s["count"], 3)
+        return sorted(stats, key=lambda s: s["totalMs"], reverse=True)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._stats.clear()
+
+
+slow_query_log = SlowQueryLog()
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _start_timer(conn, cursor, statement, parameters, context, executemany):
+    if slow_query_log.enabled and context is not None:
+        context._slow_query_start = time.perf_counter()
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _record_if_slow(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, "_slow_query_start", None)
+    if start is None:
+        return
+    duration_ms = (time.perf_counter() - start) * 1000
+    if duration_ms < slow_query_log.threshold_ms:
+        return
+
+    normalized = normalize_statement(statement)
+    key = fingerprint(normalized)
+    plan = None
+    if not executemany and slow_query_log.should_explain(key):
+        try:
+            plan = _explain(conn, statement, parameters)
+        except Exception as e:
+            # The plan is a diagnostic; never fail the statement for it
+            plan = f"EXPLAIN failed: {e}"
+    slow_query_log.record(normalized, key, duration_ms, parameters_shape(parameters, executemany),
+                          _operation.get(), plan)
+    logger.warning("Slow query (%.1f ms, %s): %s", duration_ms, _operation.get() or "no operation", normalized)
@@ -0,0 +1,259 @@
+"""
+Per-client statements: invoices, markup, transactions and outstanding debt.
+
+Clients are split into shards of consecutive ids and the shards are spread
+over a process pool. A shard is read with one query per table (invoices,
+transactions, client debts), each ordered by client and invoice and streamed
+with `yield_per`; the three streams are merged client by client, so a worker
+only ever holds one client's statement in memory. Every client gets its own
+file in the output directory:
+
+    client-<id>.csv     one row per invoice
+    client-<id>.json    the client, its invoices and the statement totals
+
+Run from the command line:
+
+    flask generate-statements --output-dir statements --format json --workers 4
+"""
+
+import csv
+import json
+import logging
+import os
+from concurrent.futures import as_completed
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from itertools import groupby
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import select
+
+from models import db, Client, MaterialsInvoice, Transaction, Debt
+from process_pool import app_process_pool, submit_in_app
+from utils import CENT, to_global_id
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("csv", "json")
+DEFAULT_SHARD_SIZE = 100
+# Rows fetched from each cursor at a time
+STREAM_BATCH_SIZE = 1000
+
+CSV_FIELDS = ["invoiceId", "invoiceDate", "status", "supplierId", "baseAmount", "markup",
+              "amount", "transactionDate", "outstanding"]
+
+def _money(value) -> Decimal:
+    # SQLite returns NUMERIC columns through floats; round back to cents
+    return Decimal(str(value or 0)).quantize(CENT)
+
+def _date(value) -> Optional[str]:
+    return value.isoformat() if value is not None else None
+
+def _shard_queries(client_ids: List[int], date_from: Optional[date], date_to: Optional[date]):
+    """The invoices, transactions and client debts queries of a shard, ordered by client and invoice."""
+    invoice_filter = [MaterialsInvoice.client_id.in_(client_ids)]
+    # Ranges on the indexed column; date_to includes the whole day
+    if date_from is not None:
+        invoice_filter.append(MaterialsInvoice.invoiceDate >= datetime.combine(date_from, time.min))
+    if date_to is not None:
+        invoice_filter.append(MaterialsInvoice.invoiceDate < datetime.combine(date_to + timedelta(days=1), time.min))
+
+    invoices = (
+        select(MaterialsInvoice.client_id, MaterialsInvoice.id, MaterialsInvoice.supplier_id,
+               MaterialsInvoice.invoiceDate, MaterialsInvoice.baseAmount, MaterialsInvoice.status)
+        .where(*invoice_filter)
+        .order_by(MaterialsInvoice.client_id, MaterialsInvoice.id)
+    )
+    transactions = (
+        select(MaterialsInvoice.client_id, Transaction.invoice_id, Transaction.amount, Transaction.transactionDate)
+        .join(MaterialsInvoice, MaterialsInvoice.id == Transaction.invoice_id)
+        .where(*invoice_filter)
+        .order_by(MaterialsInvoice.client_id, Transaction.invoice_id, Transaction.id)
+    )
+    debts = (
+        select(MaterialsInvoice.client_id, Debt.invoice_id, Debt.amount)
+        .join(MaterialsInvoice, MaterialsInvoice.id == Debt.invoice_id)
+        .where(*invoice_filter)
+        .where(Debt.party == "client")
+        .order_by(MaterialsInvoice.client_id, Debt.invoice_id, Debt.id)
+    )
+    return invoices, transactions, debts
+
+class _GroupedStream:
+    """Rows of a stream ordered by a key, taken one key at a time."""
+
+    def __init__(self, rows, key):
+        self._groups = groupby(rows, key)
+        self._next = next(self._groups, None)
+
+    def take(self, key) -> list:
+        """Rows for `key`; keys must be asked for in ascending order."""
+        while self._next is not None and self._next[0] < key:
+            self._next = next(self._groups, None)
+        if self._next is None or self._next[0] != key:
+            return []
+        rows = list(self._next[1])
+        self._next = next(self._groups, None)
+        return rows
+
+def _stream(query):
+    return db.session.execute(query, execution_options={"yield_per": STREAM_BATCH_SIZE})
+
+def iter_statements(clients: List[Tuple[int, str, Decimal]], date_from: Optional[date] = None,
+                    date_to: Optional[date] = None) -> Iterator[dict]:
+    """
+    Yield the statement of every client in `clients` ((id, name, markup_rate), ascending ids).
+
+    The shard is read with one streamed query per table.
+    """
+    client_ids = [client_id for client_id, _, _ in clients]
+    invoices_query, transactions_query, debts_query = _shard_queries(client_ids, date_from, date_to)
+    invoices = _GroupedStream(_stream(invoices_query), key=lambda row: row.client_id)
+    transactions = _GroupedStream(_stream(transactions_query), key=lambda row: row.client_id)
+    debts = _GroupedStream(_stream(debts_query), key=lambda row: row.client_id)
+
+    for client_id, name, markup_rate in clients:
+        amounts: Dict[int, Decimal] = {}
+        transaction_dates: Dict[int, datetime] = {}
+        for row in transactions.take(client_id):
+            amounts[row.invoice_id] = amounts.get(row.invoice_id, Decimal("0.00")) + _money(row.amount)
+            transaction_dates.setdefault(row.invoice_id, row.transactionDate)
+        outstanding: Dict[int, Decimal] = {}
+        for row in debts.take(client_id):
+            outstanding[row.invoice_id] = outstanding.get(row.invoice_id, Decimal("0.00")) + _money(row.amount)
+
+        lines = []
+        for row in invoices.take(client_id):
+            base_amount = _money(row.baseAmount)
+            amount = amounts.get(row.id, Decimal("0.00"))
+            lines.append({
+                "invoiceId": to_global_id("MaterialsInvoice", row.id),
+                "invoiceDate": _date(row.invoiceDate),
+                "status": row.status.name,
+                "supplierId": to_global_id("Supplier", row.supplier_id),
+                "baseAmount": base_amount,
+                "markup": amount - base_amount,
+                "amount": amount,
+                "transactionDate": _date(transaction_dates.get(row.id)),
+                "outstanding": outstanding.get(row.id, Decimal("0.00")),
+            })
+
+        totals = {field: sum((line[field] for line in lines), Decimal("0.00"))
+                  for field in ("baseAmount", "markup", "amount", "outstanding")}
+        yield {
+            "client": {"id": to_global_id("Client", client_id), "name": name,
+                       "markupRate": Decimal(str(markup_rate))},
+            "dateFrom": _date(date_from),
+            "dateTo": _date(date_to),
+            "invoices": lines,
+            "totals": totals,
+        }
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def write_statement(statement: dict, client_id: int, output_dir: str, fmt: str) -> str:
+    """Write one client's statement and return the file path."""
+    path = os.path.join(output_dir, f"client-{client_id}.{fmt}")
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        if fmt == "json":
+            json.dump(statement, f, default=_json_default, indent=2)
+        else:
+            writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+            writer.writeheader()
+            writer.writerows(statement["invoices"])
+    return path
+
+def generate_shard(clients: List[Tuple[int, str, Decimal]], output_dir: str, fmt: str,
+                   date_from: Optional[date] = None, date_to: Optional[date] = None) -> int:
+    """Write the statements of one shard of clients. Returns the number of invoices written."""
+    invoice_count = 0
+    for (client_id, _, _), statement in zip(clients, iter_statements(clients, date_from, date_to)):
+        write_statement(statement, client_id, output_dir, fmt)
+        invoice_count += len(statement["invoices"])
+    return invoice_count
+
+def generate_statements(output_dir: str, fmt: str = "csv", workers: int = 0,
+                        shard_size: int = DEFAULT_SHARD_SIZE,
+                        date_from: Optional[date] = None, date_to: Optional[date] = None,
+                        progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, int]:
+    """
+    Write a statement file per client into `output_dir`.
+
+    Args:
+        output_dir: Directory for the statement files, created if missing
+        fmt: "csv" or "json"
+        workers: Worker processes; 0 generates every shard in this process
+        shard_size: Clients per shard
+        date_from: First invoice date included
+        date_to: Last invoice date included
+        progress: Called with (clients done, total clients) as shards finish
+
+    Returns:
+        Number of clients and invoices written
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Invalid format: {fmt}. Must be one of: {', '.join(FORMATS)}")
+    if shard_size <= 0:
+        raise ValueError("shard_size must be positive")
+    os.makedirs(output_dir, exist_ok=True)
+
+    clients = [tuple(row) for row in db.session.execute(
+        select(Client.id, Client.name, Client.markup_rate).order_by(Client.id))]
+    db.session.rollback()
+    shards = [clients[start:start + shard_size] for start in range(0, len(clients), shard_size)]
+    logger.info(f"Generating statements for {len(clients)} clients in {len(shards)} shards "
+                f"with {workers or 'no'} worker processes")
+
+    done = invoices = 0
+    if workers <= 0:
+        for shard in shards:
+            invoices += generate_shard(shard, output_dir, fmt, date_from, date_to)
+            done += len(shard)
+            if progress is not None:
+                progress(done, len(clients))
+    else:
+        with app_process_pool(workers) as pool:
+            futures = {submit_in_app(pool, generate_shard, shard, output_dir, fmt, date_from, date_to): len(shard)
+                       for shard in shards}
+            for future in as_completed(futures):
+                invoices += future.result()
+                done += futures[future]
+                if progress is not None:
+                    progress(done, len(clients))
+
+    logger.info(f"Wrote {len(clients)} statements covering {invoices} invoices to {output_dir}")
+    return {"clients": len(clients), "invoices": invoices}
+
+def _parse_date_option(ctx, param, value):
+    if value is None:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise click.BadParameter(f"Invalid date: {value}. Expected YYYY-MM-DD")
+
+@click.command('generate-statements')
+@click.option('--output-dir', default='statements', show_default=True,
+              help='Directory for the per-client files.')
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), default='csv', show_default=True)
+@click.option('--workers', default=os.cpu_count() or 1, show_default='CPU count',
+              help='Worker processes; 0 runs in this process.')
+@click.option('--shard-size', default=DEFAULT_SHARD_SIZE, show_default=True,
+              help='Clients per shard.')
+@click.option('--from', 'date_from', callback=_parse_date_option,
+              help='First invoice date included (YYYY-MM-DD).')
+@click.option('--to', 'date_to', callback=_parse_date_option,
+              help='Last invoice date included (YYYY-MM-DD).')
+@with_appcontext
+def generate_statements_command(output_dir, fmt, workers, shard_size, date_from, date_to):
+    """Write a statement file per client."""
+    written = generate_statements(
+        output_dir, fmt, workers, shard_size, date_from, date_to,
+        progress=lambda done, total: click.echo(f"{done}/{total} clients"),
+    )
+    click.echo(f"{written['clients']} statements ({written['invoices']} invoices) written to {output_dir}")
@@ -7,24 +7,21 @@ import os
 import sys
 import pytest
 from decimal import Decimal
-from flask import Flask
 
 # Add the parent directory to sys.path to allow imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # Import modules directly
 from models import db, Client, Supplier, MaterialsInvoice, Transaction, Debt, InvoiceStatus
+from cache import entity_cache
+from app import create_app
 
 @pytest.fixture
 def app():
     """Create a test Flask application with in-memory SQLite database."""
-    app = Flask(__name__)
+    app = create_app(testing=True)
     app.config['TESTING'] = True
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
-    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-    
-    # Initialize the app with this database
-    db.init_app(app)
+    entity_cache.clear()
     
     # Create the database and tables
     with app.app_context():
@@ -33,6 +30,7 @@ def app():
     yield app
     
     # Clean up
+    app.extensions['jobs'].shutdown()
     with app.app_context():
         db.session.remove()
         db.drop_all()
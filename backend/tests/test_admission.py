@@ -0,0 +1,178 @@
+"""
+Tests for admission control: concurrency budgets, wait queue and rate limits.
+"""
+
+import os
+import sys
+import json
+import threading
+import pytest
+from decimal import Decimal
+
+# Add the parent directory to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import db, Client
+from app import create_app
+from admission import AdmissionControl, ConcurrencyLimiter, Rejected, TokenBucketLimiter, default_limits
+from utils import to_global_id
+
+CLIENT_NAMES = "query ClientNames { clients { edges { node { name } } } }"
+UPDATE_MARKUP = """
+mutation UpdateMarkup($id: ID!) { updateClientMarkup(clientId: $id, rate: 0.2) { errors } }
+"""
+
+@pytest.fixture
+def app(app):
+    """The conftest app with one client."""
+    with app.app_context():
+        db.session.add(Client(name="Admitted Client", markup_rate=Decimal("0.15")))
+        db.session.commit()
+    return app
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+def test_limiter_queues_then_admits():
+    limiter = ConcurrencyLimiter(limit=1, max_queue=1, queue_timeout=5)
+    assert limiter.acquire()
+    admitted = []
+    waiter = threading.Thread(target=lambda: admitted.append(limiter.acquire()))
+    waiter.start()
+    while limiter.stats()["queueDepth"] == 0:
+        pass
+    # The queue holds one waiter, so the next caller is turned away at once
+    assert not limiter.acquire()
+    limiter.release()
+    waiter.join(5)
+
+    assert admitted == [True]
+    stats = limiter.stats()
+    assert (stats["active"], stats["queueDepth"], stats["admitted"], stats["rejectedQueueFull"]) == (1, 0, 2, 1)
+
+def test_limiter_wait_times_out():
+    limiter = ConcurrencyLimiter(limit=1, max_queue=4, queue_timeout=0.01)
+    assert limiter.acquire()
+    assert not limiter.acquire()
+    assert limiter.stats()["rejectedTimeout"] == 1
+
+def test_token_bucket_refills_per_caller():
+    clock = FakeClock()
+    limiter = TokenBucketLimiter(rate=2, burst=2, clock=clock)
+
+    assert limiter.take("a") == 0 and limiter.take("a") == 0
+    assert limiter.take("a") == pytest.approx(0.5)
+    assert limiter.take("b") == 0
+    clock.now += 0.5
+    assert limiter.take("a") == 0
+    assert limiter.stats()["rejected"] == 1
+
+def test_cost_above_burst_is_never_admitted():
+    """A full bucket cannot pay for more than its burst, however long the caller waits."""
+    clock = FakeClock()
+    limiter = TokenBucketLimiter(rate=1, burst=5, clock=clock)
+
+    for _ in range(3):
+        assert limiter.take("a", cost=10) == float("inf")
+        clock.now += 100
+    # Nothing was spent by the rejected calls
+    assert limiter.take("a", cost=5) == 0
+    assert limiter.stats()["rejected"] == 3
+
+def test_disabled_rate_limit_never_limits():
+    limiter = TokenBucketLimiter(rate=0, burst=1)
+    assert all(limiter.take("a") == 0 for _ in range(100))
+
+def test_default_limits_fit_the_worker_threads(monkeypatch):
+    """Budgets and queues leave a thread free, so the limits bind before the server's backlog."""
+    for threads in (1, 2, 4, 8, 16, 64):
+        limits = default_limits(threads)
+        assert limits["queries"] >= 1 and limits["mutations"] >= 1
+        if threads >= 4:
+            assert limits["queries"] + limits["mutations"] + 2 * limits["queue"] < threads
+    assert default_limits(4) == {"queries": 2, "mutations": 1, "queue": 0}
+
+    monkeypatch.setenv('GUNICORN_THREADS', '16')
+    config = create_app(testing=True).config
+    assert (config['GRAPHQL_MAX_CONCURRENT_QUERIES'], config['GRAPHQL_MAX_CONCURRENT_MUTATIONS'],
+            config['GRAPHQL_MAX_QUEUE']) == (8, 4, 1)
+
+def test_busy_rejection_refunds_tokens():
+    """A request turned away for capacity did no work, so it costs the caller nothing."""
+    admission = AdmissionControl(max_queries=1, max_queue=0, rate=1, burst=2)
+    admission.rate_limiter.clock = lambda: 100.0
+    assert admission.budgets["query"].acquire()
+
+    for _ in range(3):
+        with pytest.raises(Rejected) as rejected:
+            with admission.admit("a"):
+                pass
+        assert rejected.value.status_code == 503
+    admission.budgets["query"].release()
+    with admission.admit("a", cost=2):
+        pass
+
+def test_callers_are_keyed_by_forwarded_address_behind_trusted_proxies(monkeypatch):
+    monkeypatch.setenv('TRUSTED_PROXIES', '1')
+    app = create_app(testing=True)
+    app.extensions['admission'] = AdmissionControl(rate=1, burst=1)
+    with app.app_context():
+        db.create_all()
+    client = app.test_client()
+
+    def post(address):
+        return client.post('/graphql', json={'query': CLIENT_NAMES}, headers={'X-Forwarded-For': address})
+
+    assert post("203.0.113.1").status_code == 200
+    # A different caller behind the same proxy has a bucket of its own
+    assert post("203.0.113.2").status_code == 200
+    assert post("203.0.113.1").status_code == 429
+    app.extensions['jobs'].shutdown()
+
+def test_saturated_budget_is_rejected_with_retry_after(app, client):
+    admission = AdmissionControl(max_queries=1, max_mutations=1, max_queue=0, queue_timeout=2)
+    app.extensions['admission'] = admission
+    # Occupy the only query slot, as a concurrent request would
+    assert admission.budgets["query"].acquire()
+
+    busy = client.post('/graphql', json={'query': CLIENT_NAMES})
+    assert busy.status_code == 503
+    assert busy.headers['Retry-After'] == "2"
+    assert json.loads(busy.data)['errors'][0]['extensions']['code'] == "SERVER_BUSY"
+
+    # Mutations have a budget of their own
+    with app.app_context():
+        client_id = Client.query.one().id
+    mutation = client.post('/graphql', json={'query': UPDATE_MARKUP, 'variables': {'id': to_global_id("Client", client_id)}})
+    assert mutation.status_code == 200
+
+    admission.budgets["query"].release()
+    assert client.post('/graphql', json={'query': CLIENT_NAMES}).status_code == 200
+
+    metrics = json.loads(client.get('/metrics/admission').data)
+    assert metrics["queries"]["rejectedQueueFull"] == 1
+    assert metrics["mutations"]["admitted"] == 1
+
+def test_rate_limited_caller_gets_429(app, client):
+    app.extensions['admission'] = AdmissionControl(rate=1, burst=2)
+
+    assert client.post('/graphql', json={'query': CLIENT_NAMES}).status_code == 200
+    # A batch costs one token per operation
+    limited = client.post('/graphql', json=[{'query': CLIENT_NAMES}, {'query': CLIENT_NAMES}])
+    assert limited.status_code == 429
+    assert int(limited.headers['Retry-After']) >= 1
+    assert json.loads(limited.data)['errors'][0]['extensions']['code'] == "RATE_LIMITED"
+    assert json.loads(client.get('/metrics/admission').data)["rateLimit"]["rejected"] == 1
+
+def test_batch_larger_than_burst_is_rejected(app, client):
+    app.extensions['admission'] = AdmissionControl(rate=1, burst=2)
+
+    response = client.post('/graphql', json=[{'query': CLIENT_NAMES}] * 3)
+
+    assert response.status_code == 400
+    assert 'Retry-After' not in response.headers
+    assert json.loads(response.data)['errors'][0]['extensions']['code'] == "BATCH_TOO_LARGE"
@@ -0,0 +1,107 @@
+"""
+Tests for the debt aging report and its CSV export.
+"""
+
+import os
+import sys
+import json
+import pytest
+from decimal import Decimal
+from datetime import datetime
+
+# Add the parent directory to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import db, Client, Supplier, MaterialsInvoice, Transaction, Debt, InvoiceStatus
+from aging import aging_report
+from utils import markup_amount
+
+AGING_REPORT = """
+query Aging($asOf: String!, $party: String!, $includeRows: Boolean) {
+  agingReport(asOf: $asOf, party: $party, includeRows: $includeRows) {
+    asOf
+    totals { days0To30 days31To60 days61To90 over90 total }
+    rows {
+      counterparty { __typename ... on Client { name } ... on Supplier { name } }
+      buckets { days0To30 over90 total }
+    }
+  }
+}
+"""
+
+@pytest.fixture
+def book(app_context):
+    """Invoices aged 0, 30, 31, 75 and 120 days on 2024-06-30, plus a paid and a future one."""
+    clients = [Client(name="Aging Client A", markup_rate=Decimal("0.10")),
+               Client(name="Aging Client B", markup_rate=Decimal("0.10"))]
+    supplier = Supplier(name="Aging Supplier")
+    db.session.add_all(clients + [supplier])
+    db.session.flush()
+
+    rows = [
+        (clients[0], datetime(2024, 6, 30, 18, 0), Decimal("10.00"), InvoiceStatus.UNPAID),
+        (clients[0], datetime(2024, 5, 31), Decimal("20.00"), InvoiceStatus.PENDING),
+        (clients[0], datetime(2024, 5, 30), Decimal("30.00"), InvoiceStatus.UNPAID),
+        (clients[1], datetime(2024, 4, 16), Decimal("40.00"), InvoiceStatus.UNPAID),
+        (clients[1], datetime(2024, 3, 2), Decimal("50.00"), InvoiceStatus.UNPAID),
+        (clients[1], datetime(2024, 1, 1), Decimal("60.00"), InvoiceStatus.PAID),
+        (clients[1], datetime(2024, 7, 1), Decimal("70.00"), InvoiceStatus.UNPAID),
+    ]
+    for client, invoice_date, base_amount, status in rows:
+        invoice = MaterialsInvoice(client_id=client.id, supplier_id=supplier.id, invoiceDate=invoice_date,
+                                   baseAmount=base_amount, status=status)
+        db.session.add(invoice)
+        db.session.flush()
+        amount = markup_amount(base_amount, client.markup_rate)
+        db.session.add_all([
+            Transaction(invoice_id=invoice.id, amount=amount),
+            Debt(invoice_id=invoice.id, party="client", amount=amount),
+            Debt(invoice_id=invoice.id, party="supplier", amount=base_amount),
+        ])
+    db.session.commit()
+
+def test_buckets_follow_invoice_age(book):
+    """Boundary days land in the right bucket; paid and future invoices are left out."""
+    report = aging_report(datetime(2024, 6, 30).date(), "supplier")
+
+    assert report["rows"] is None
+    assert report["totals"] == {
+        "days0To30": Decimal("30.00"),
+        "days31To60": Decimal("30.00"),
+        "days61To90": Decimal("40.00"),
+        "over90": Decimal("50.00"),
+        "total": Decimal("150.00"),
+    }
+
+def test_rows_per_counterparty_match_totals(client, book):
+    response = client.post('/graphql', json={'query': AGING_REPORT, 'variables': {
+        'asOf': "2024-06-30", 'party': "client", 'includeRows': True}})
+    report = json.loads(response.data)['data']['agingReport']
+
+    assert report['totals'] == {'days0To30': 33.0, 'days31To60': 33.0, 'days61To90': 44.0,
+                                'over90': 55.0, 'total': 165.0}
+    assert report['rows'] == [
+        {'counterparty': {'__typename': "Client", 'name': "Aging Client A"},
+         'buckets': {'days0To30': 33.0, 'over90': 0.0, 'total': 66.0}},
+        {'counterparty': {'__typename': "Client", 'name': "Aging Client B"},
+         'buckets': {'days0To30': 0.0, 'over90': 55.0, 'total': 99.0}},
+    ]
+
+def test_invalid_arguments_are_reported(client, book):
+    response = client.post('/graphql', json={'query': AGING_REPORT, 'variables': {
+        'asOf': "2024-06-30", 'party': "bank"}})
+    assert "Invalid party" in json.loads(response.data)['errors'][0]['message']
+
+    response = client.get('/reports/aging.csv?asOf=yesterday')
+    assert response.status_code == 400
+
+def test_csv_export_streams_rows(client, book):
+    response = client.get('/reports/aging.csv?asOf=2024-06-30&party=supplier')
+
+    assert response.status_code == 200
+    assert response.mimetype == "text/csv"
+    lines = response.get_data(as_text=True).splitlines()
+    assert lines == [
+        "id,name,days0To30,days31To60,days61To90,over90,total",
+        "1,Aging Supplier,30.00,30.00,40.00,50.00,150.00",
+    ]
@@ -0,0 +1,241 @@
+"""
+Tests for the NumPy analytics cache and the invoiceAnalytics query.
+"""
+
+import os
+import sys
+import json
+import threading
+import pytest
+from contextlib import contextmanager
+from decimal import Decimal
+from datetime import datetime
+
+# Add the parent directory to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("numpy")
+
+from models import db, Client, Supplier, MaterialsInvoice, Transaction, Debt, InvoiceStatus
+from sqlalchemy import event
+import analytics
+from analytics import analytics_cache
+from cache import entity_cache
+from pricing import update_client_markup
+from settlement import settle_invoices
+from utils import to_global_id, markup_amount
+
+ANALYTICS = """
+query Analytics($dateFrom: String, $dateTo: String, $by: String!, $measure: String, $first: Int) {
+  invoiceAnalytics(dateFrom: $dateFrom, dateTo: $dateTo) {
+    invoiceCount
+    baseAmount
+    amount
+    markup
+    groups(by: $by, measure: $measure, first: $first) {
+      key
+      count
+      total
+      counterparty { __typename ... on Client { name } ... on Supplier { name } }
+    }
+    markupHistogram(bins: 2) { low high count }
+  }
+}
+"""
+
+CREATE_INVOICE = """
+mutation Create($clientId: ID!, $supplierId: ID!, $invoiceDate: String!, $baseAmount: Float!) {
+  createMaterialsInvoice(clientId: $clientId, supplierId: $supplierId,
+                         invoiceDate: $invoiceDate, baseAmount: $baseAmount) {
+    errors
+  }
+}
+"""
+
+@pytest.fixture
+def app(app, monkeypatch):
+    """The conftest app with the analytics cache on, whatever ANALYTICS_CACHE says."""
+    monkeypatch.setattr(analytics_cache, "enabled", True)
+    return app
+
+@pytest.fixture
+def book(app_context):
+    """Two clients (10% and 20% markup) and two suppliers over January and February 2024."""
+    clients = [Client(name="Analytics Client A", markup_rate=Decimal("0.10")),
+               Client(name="Analytics Client B", markup_rate=Decimal("0.20"))]
+    suppliers = [Supplier(name="Analytics Supplier A"), Supplier(name="Analytics Supplier B")]
+    db.session.add_all(clients + suppliers)
+    db.session.flush()
+
+    rows = [
+        (clients[0], suppliers[0], datetime(2024, 1, 5), Decimal("100.00")),
+        (clients[0], suppliers[1], datetime(2024, 1, 31, 23, 0), Decimal("50.00")),
+        (clients[1], suppliers[1], datetime(2024, 2, 1), Decimal("200.00")),
+    ]
+    for client, supplier, invoice_date, base_amount in rows:
+        invoice = MaterialsInvoice(client_id=client.id, supplier_id=supplier.id, invoiceDate=invoice_date,
+                                   baseAmount=base_amount, status=InvoiceStatus.UNPAID)
+        db.session.add(invoice)
+        db.session.flush()
+        amount = markup_amount(base_amount, client.markup_rate)
+        db.session.add_all([
+            Transaction(invoice_id=invoice.id, amount=amount),
+            Debt(invoice_id=invoice.id, party="client", amount=amount),
+            Debt(invoice_id=invoice.id, party="supplier", amount=base_amount),
+        ])
+    db.session.commit()
+    return clients, suppliers
+
+def execute_graphql_query(client, query, variables=None):
+    """Helper function to execute a GraphQL query."""
+    response = client.post('/graphql', json={'query': query, 'variables': variables or {}})
+    assert response.status_code == 200
+    result = json.loads(response.data)
+    assert 'errors' not in result, result
+    return result['data']
+
+@contextmanager
+def recorded_statements():
+    """Collect the SQL statements sent while the block runs."""
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, "before_cursor_execute", record)
+
+def test_totals_and_groups(book):
+    clients, suppliers = book
+    view = analytics_cache.view()
+
+    assert view.count == 3
+    assert view.total("baseAmount") == Decimal("350.00")
+    assert view.total("amount") == Decimal("405.00")
+    assert view.total("markup") == Decimal("55.00")
+
+    months = view.groups("month")
+    assert [(g["key"], g["count"], g["total"]) for g in months] == \
+        [("2024-01", 2, Decimal("165.00")), ("2024-02", 1, Decimal("240.00"))]
+
+    top = view.groups("supplier", "baseAmount", first=1)
+    assert [(g["key"], g["counterparty"].name, g["total"]) for g in top] == \
+        [(to_global_id("Supplier", suppliers[1].id), "Analytics Supplier B", Decimal("250.00"))]
+
+    histogram = view.markup_histogram(bins=2)
+    assert [bin["count"] for bin in histogram] == [2, 1]
+    assert histogram[0]["low"] == pytest.approx(0.10) and histogram[-1]["high"] == pytest.approx(0.20)
+
+def test_date_range_is_inclusive(book):
+    view = analytics_cache.view(datetime(2024, 1, 6).date(), datetime(2024, 1, 31).date())
+    assert view.count == 1
+    assert view.total("baseAmount") == Decimal("50.00")
+
+def test_created_invoices_are_appended(client, book):
+    """A committed createMaterialsInvoice is appended without reloading the cache."""
+    clients, suppliers = book
+    assert analytics_cache.view().count == 3
+
+    execute_graphql_query(client, CREATE_INVOICE, {
+        'clientId': to_global_id("Client", clients[1].id),
+        'supplierId': to_global_id("Supplier", suppliers[0].id),
+        'invoiceDate': "2024-02-10",
+        'baseAmount': 10.0,
+    })
+
+    assert len(analytics_cache) == 4
+    view = analytics_cache.view()
+    assert view.count == 4
+    assert view.total("amount") == Decimal("417.00")
+
+def test_repricing_refreshes_only_the_client_amounts(book):
+    """Repricing bypasses the ORM; the next query re-reads that client's amounts, not every column."""
+    clients, _ = book
+    assert analytics_cache.view().total("markup") == Decimal("55.00")
+
+    update_client_markup(clients[0].id, Decimal("0.30"))
+    db.session.commit()
+
+    with recorded_statements() as statements:
+        view = analytics_cache.view()
+    assert view.total("markup") == Decimal("85.00")
+    assert len(statements) == 1 and "transactions" in statements[0]
+    assert len(analytics_cache) == 3
+
+def test_settling_keeps_the_cache(book):
+    """Settlement changes no cached column, so it does not reload the cache."""
+    analytics_cache.view()
+    settle_invoices([invoice.id for invoice in MaterialsInvoice.query.all()], datetime(2024, 3, 1))
+    db.session.commit()
+
+    with recorded_statements() as statements:
+        assert analytics_cache.view().total("amount") == Decimal("405.00")
+    assert statements == []
+
+def test_other_bulk_updates_reload_the_cache(book):
+    db.session.execute(Transaction.__table__.update().values(amount=Decimal("1.00")))
+    db.session.commit()
+
+    assert analytics_cache.view().total("amount") == Decimal("3.00")
+
+def test_load_runs_outside_the_lock(app, book, monkeypatch):
+    """Writers are not blocked while a reader loads, and the loaded columns are swapped in whole."""
+    loading, release = threading.Event(), threading.Event()
+    load = analytics_cache._load
+
+    def slow_load():
+        loading.set()
+        assert release.wait(5)
+        return load()
+
+    monkeypatch.setattr(analytics_cache, "_load", slow_load)
+    analytics_cache.invalidate()
+    views = []
+
+    def read():
+        with app.app_context():
+            views.append(analytics_cache.view())
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    assert loading.wait(5)
+    # Would block if the loader held the lock
+    appender = threading.Thread(target=analytics_cache.append, args=([],))
+    appender.start()
+    appender.join(1)
+    assert not appender.is_alive()
+    release.set()
+    reader.join(5)
+
+    assert [view.count for view in views] == [3]
+
+def test_groups_load_counterparties_in_one_query(book):
+    view = analytics_cache.view()
+    entity_cache.clear()
+
+    with recorded_statements() as statements:
+        groups = view.groups("supplier")
+    assert len(statements) == 1
+    assert [group["counterparty"].name for group in groups] == ["Analytics Supplier B", "Analytics Supplier A"]
+
+def test_invoice_analytics_query(client, book):
+    data = execute_graphql_query(client, ANALYTICS, {'by': 'client', 'measure': 'markup'})
+
+    analytics = data['invoiceAnalytics']
+    assert analytics['invoiceCount'] == 3
+    assert analytics['amount'] == 405.0
+    assert [(g['counterparty']['name'], g['count'], g['total']) for g in analytics['groups']] == \
+        [("Analytics Client B", 1, 40.0), ("Analytics Client A", 2, 15.0)]
+    assert sum(bin['count'] for bin in analytics['markupHistogram']) == 3
+
+def test_invalid_arguments(client, book):
+    response = client.post('/graphql', json={'query': ANALYTICS, 'variables': {'by': 'week'}})
+    result = json.loads(response.data)
+    assert "Invalid groupBy: week" in result['errors'][0]['message']
+
+    response = client.post('/graphql', json={'query': ANALYTICS, 'variables': {'by': 'month', 'dateFrom': 'soon'}})
+    result = json.loads(response.data)
+    assert "Invalid date: soon" in result['errors'][0]['message']
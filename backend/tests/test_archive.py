@@ -0,0 +1,151 @@
+"""
+Tests for archiving settled invoices and querying them with includeArchived.
+"""
+
+import os
+import sys
+import json
+import pytest
+from decimal import Decimal
+from datetime import datetime
+
+# Add the parent directory to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func
+
+from models import (
+    db, Client, Supplier, MaterialsInvoice, Transaction, Debt, InvoiceStatus,
+    ArchivedMaterialsInvoice, ArchivedTransaction, ArchivedDebt,
+)
+from archive import archive_paid_invoices
+from utils import to_global_id, markup_amount
+
+INVOICES = """
+query Invoices($first: Int, $after: String, $includeArchived: Boolean) {
+  invoices(first: $first, after: $after, includeArchived: $includeArchived) {
+    edges { cursor node { id status } }
+    pageInfo { hasNextPage endCursor }
+  }
+}
+"""
+
+INVOICE = """
+query Invoice($id: ID!) {
+  invoice(id: $id) {
+    id
+    status
+    client { name }
+    transaction { amount invoice { id } }
+    debts { edges { node { party amount } } }
+  }
+}
+"""
+
+def add_invoice(client, supplier, invoice_date, status, base_amount=Decimal("100.00")):
+    invoice = MaterialsInvoice(client_id=client.id, supplier_id=supplier.id, invoiceDate=invoice_date,
+                               baseAmount=base_amount, status=status)
+    db.session.add(invoice)
+    db.session.flush()
+    amount = markup_amount(base_amount, client.markup_rate)
+    db.session.add_all([
+        Transaction(invoice_id=invoice.id, amount=amount),
+        Debt(invoice_id=invoice.id, party="client", amount=amount),
+        Debt(invoice_id=invoice.id, party="supplier", amount=base_amount),
+    ])
+    db.session.flush()
+    return invoice.id
+
+@pytest.fixture
+def invoice_ids(app_context):
+    """Two old PAID invoices, an old UNPAID one and a recent PAID one, in id order."""
+    client = Client(name="Archive Client", markup_rate=Decimal("0.10"))
+    supplier = Supplier(name="Archive Supplier")
+    db.session.add_all([client, supplier])
+    db.session.flush()
+    ids = [
+        add_invoice(client, supplier, datetime(2022, 1, 10), InvoiceStatus.PAID, Decimal("100.00")),
+        add_invoice(client, supplier, datetime(2022, 2, 10), InvoiceStatus.UNPAID, Decimal("200.00")),
+        add_invoice(client, supplier, datetime(2022, 3, 10), InvoiceStatus.PAID, Decimal("300.00")),
+        add_invoice(client, supplier, datetime(2026, 1, 10), InvoiceStatus.PAID, Decimal("400.00")),
+    ]
+    db.session.commit()
+    return ids
+
+def debt_totals():
+    totals = {}
+    for model_class in (Debt, ArchivedDebt):
+        for party, amount in db.session.query(model_class.party, func.sum(model_class.amount)) \
+                .group_by(model_class.party):
+            totals[party] = totals.get(party, Decimal("0")) + Decimal(str(amount))
+    return totals
+
+def execute_graphql_query(client, query, variables=None):
+    """Helper function to execute a GraphQL query."""
+    response = client.post('/graphql', json={'query': query, 'variables': variables or {}})
+    assert response.status_code == 200
+    result = json.loads(response.data)
+    assert 'errors' not in result
+    return result['data']
+
+def test_archive_moves_old_paid_invoices_with_children(invoice_ids):
+    """Only PAID invoices before the cutoff move, in chunks, and debt totals are unchanged."""
+    totals_before = debt_totals()
+    progress = []
+
+    moved = archive_paid_invoices(datetime(2024, 1, 1), chunk_size=1,
+                                  progress=lambda done, total: progress.append((done, total)))
+
+    assert moved == {"invoices": 2, "transactions": 2, "debts": 4}
+    assert progress == [(1, 2), (2, 2)]
+    assert [i.id for i in MaterialsInvoice.query.order_by(MaterialsInvoice.id)] == [invoice_ids[1], invoice_ids[3]]
+    assert [i.id for i in ArchivedMaterialsInvoice.query.order_by(ArchivedMaterialsInvoice.id)] == \
+        [invoice_ids[0], invoice_ids[2]]
+    assert ArchivedTransaction.query.count() == 2
+    assert Debt.query.count() == 4
+    assert debt_totals() == totals_before
+
+    # Nothing left to do on a second run
+    assert archive_paid_invoices(datetime(2024, 1, 1))["invoices"] == 0
+
+def test_newest_invoice_is_never_archived(invoice_ids):
+    """Keeping the newest row prevents SQLite from reusing an archived id."""
+    moved = archive_paid_invoices(datetime(2030, 1, 1))
+
+    assert moved["invoices"] == 2
+    assert db.session.get(MaterialsInvoice, invoice_ids[3]) is not None
+
+def test_connections_include_archived_on_request(client, invoice_ids):
+    """Archived rows are hidden by default and merged in id order with includeArchived."""
+    archive_paid_invoices(datetime(2024, 1, 1))
+
+    data = execute_graphql_query(client, INVOICES)
+    assert [e['cursor'] for e in data['invoices']['edges']] == [str(invoice_ids[1]), str(invoice_ids[3])]
+
+    data = execute_graphql_query(client, INVOICES, {'first': 2, 'includeArchived': True})
+    assert [e['cursor'] for e in data['invoices']['edges']] == [str(i) for i in invoice_ids[:2]]
+    assert data['invoices']['pageInfo']['hasNextPage'] is True
+
+    data = execute_graphql_query(client, INVOICES, {
+        'first': 2, 'after': data['invoices']['pageInfo']['endCursor'], 'includeArchived': True})
+    assert [e['cursor'] for e in data['invoices']['edges']] == [str(i) for i in invoice_ids[2:]]
+    assert data['invoices']['pageInfo']['hasNextPage'] is False
+
+def test_archived_invoice_resolves_by_global_id(client, invoice_ids):
+    """Global IDs stay valid and archived invoices resolve their archived children."""
+    archive_paid_invoices(datetime(2024, 1, 1))
+    global_id = to_global_id("MaterialsInvoice", invoice_ids[2])
+
+    invoice = execute_graphql_query(client, INVOICE, {'id': global_id})['invoice']
+
+    assert invoice['status'] == "PAID"
+    assert invoice['client']['name'] == "Archive Client"
+    assert invoice['transaction'] == {'amount': 330.0, 'invoice': {'id': global_id}}
+    assert {e['node']['party']: e['node']['amount'] for e in invoice['debts']['edges']} == \
+        {'client': 330.0, 'supplier': 300.0}
+
+def test_archive_command(app, invoice_ids):
+    result = app.test_cli_runner().invoke(args=['archive-invoices', '--before', '2024-01-01'])
+
+    assert result.exit_code == 0, result.output
+    assert "Archived 2 invoices, 2 transactions and 4 debts" in result.output
@@ -0,0 +1,91 @@
+"""
+Tests for batched GraphQL operations on /graphql.
+"""
+
+import os
+import sys
+import json
+import pytest
+from decimal import Decimal
+
+# Add the parent directory to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import db, Client, Supplier
+from persisted_queries import query_hash, PERSISTED_QUERY_NOT_FOUND
+from utils import to_global_id
+
+CLIENT_NAMES = "query ClientNames { clients { edges { node { name } } } }"
+SUPPLIER_NAMES = "query SupplierNames { suppliers { edges { node { name } } } }"
+CLIENT_MARKUP = "query ClientMarkup($id: ID!) { client(id: $id) { markup_rate } }"
+UPDATE_MARKUP = """
+mutation UpdateMarkup($id: ID!, $rate: Float!) {
+    updateClientMarkup(clientId: $id, rate: $rate) { client { markup_rate } errors }
+}
+"""
+
+@pytest.fixture
+def app(app):
+    """The conftest app accepting batches of up to three operations, with a client and a supplier."""
+    app.config['GRAPHQL_MAX_BATCH_SIZE'] = 3
+    with app.app_context():
+        db.session.add_all([Client(name="Batch Client", markup_rate=Decimal("0.15")),
+                            Supplier(name="Batch Supplier")])
+        db.session.commit()
+    return app
+
+def client_id(app):
+    with app.app_context():
+        return to_global_id("Client", Client.query.one().id)
+
+def test_batch_returns_results_in_order(client):
+    response = client.post('/graphql', json=[{'query': SUPPLIER_NAMES}, {'query': CLIENT_NAMES}])
+
+    assert response.status_code == 200
+    results = json.loads(response.data)
+    assert [list(result['data']) for result in results] == [['suppliers'], ['clients']]
+    assert results[0]['data']['suppliers']['edges'][0]['node']['name'] == "Batch Supplier"
+    assert results[1]['data']['clients']['edges'][0]['node']['name'] == "Batch Client"
+
+def test_single_operation_is_not_wrapped(client):
+    response = client.post('/graphql', json={'query': CLIENT_NAMES})
+
+    assert response.status_code == 200
+    assert json.loads(response.data)['data']['clients']['edges'][0]['node']['name'] == "Batch Client"
+
+def test_batch_size_is_limited(client):
+    too_many = client.post('/graphql', json=[{'query': CLIENT_NAMES}] * 4)
+    assert too_many.status_code == 400
+    assert "limit of 3" in json.loads(too_many.data)['errors'][0]['message']
+
+    empty = client.post('/graphql', json=[])
+    assert empty.status_code == 400
+
+def test_mutation_is_visible_to_later_operations(app, client):
+    """Operations run in order, and a mutation drops what earlier ones loaded."""
+    variables = {'id': client_id(app)}
+    response = client.post('/graphql', json=[
+        {'query': CLIENT_MARKUP, 'variables': variables},
+        {'query': UPDATE_MARKUP, 'variables': {**variables, 'rate': 0.25}},
+        {'query': CLIENT_MARKUP, 'variables': variables},
+    ])
+
+    before, update, after = json.loads(response.data)
+    assert before['data']['client']['markup_rate'] == 0.15
+    assert update['data']['updateClientMarkup']['errors'] is None
+    assert after['data']['client']['markup_rate'] == 0.25
+    assert response.headers.get('ETag') is None
+
+def test_errors_stay_with_their_operation(client):
+    """A persisted-query miss or invalid operation fails alone."""
+    response = client.post('/graphql', json=[
+        {'extensions': {'persistedQuery': {'version': 1, 'sha256Hash': query_hash(CLIENT_NAMES)}}},
+        {'query': "query { nope }"},
+        {'query': CLIENT_NAMES},
+    ])
+
+    assert response.status_code == 200
+    miss, invalid, ok = json.loads(response.data)
+    assert miss['errors'][0]['message'] == PERSISTED_QUERY_NOT_FOUND
+    assert invalid['errors']
+    assert ok['data']['clients']['edges'][0]['node']['name'] == "Batch Client"
@@ -0,0 +1,78 @@
+"""
+Tests for the process-level Client/Supplier entity cache.
+"""
+
+import os
+import sys
+from decimal import Decimal
+
+# Add the parent directory to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import db, Client, Supplier
+from cache import EntityCache, ClientSnapshot, SupplierSnapshot, entity_cache
+
+def test_client_snapshot_is_cached(app_context, populated_db):
+    """A second lookup is served from the cache without reloading."""
+    client = Client.query.first()
+
+    first = entity_cache.get_client(client.id)
+    second = entity_cache.get_client(client.id)
+
+    assert isinstance(first, ClientSnapshot)
+    assert first is second
+    assert first.markup_rate == Decimal("0.15")
+    assert entity_cache.hits == 1
+    assert entity_cache.misses == 1
+
+def test_supplier_snapshot_and_missing_rows(app_context, populated_db):
+    """Suppliers are cached too, and missing rows are not cached."""
+    supplier = Supplier.query.first()
+
+    snapshot = entity_cache.get_supplier(supplier.id)
+    assert isinstance(snapshot, SupplierSnapshot)
+    assert snapshot.name == "Test Supplier"
+
+    assert entity_cache.get_supplier(9999) is None
+    assert len(entity_cache) == 1
+
+def test_orm_update_invalidates_entry(app_context, populated_db):
+    """Committing a change to a Client drops its cached snapshot."""
+    client = Client.query.first()
+    assert entity_cache.get_client(client.id).markup_rate == Decimal("0.15")
+
+    client.markup_rate = Decimal("0.25")
+    db.session.commit()
+
+    assert entity_cache.get_client(client.id).markup_rate == Decimal("0.25")
+
+def test_explicit_invalidation(app_context, populated_db):
+    """Entries can be dropped one at a time or per model."""
+    client = Client.query.first()
+    supplier = Supplier.query.first()
+    entity_cache.get_client(client.id)
+    entity_cache.get_supplier(supplier.id)
+
+    entity_cache.invalidate(Client, client.id)
+    assert len(entity_cache) == 1
+
+    entity_cache.invalidate(Supplier)
+    assert len(entity_cache) == 0
+
+def test_lru_bound_and_ttl(app_context, populated_db):
+    """The cache evicts least recently used entries and expires old ones."""
+    for i in range(3):
+        db.session.add(Client(name=f"Client {i}", markup_rate=Decimal("0.10")))
+    db.session.commit()
+    ids = [c.id for c in Client.query.order_by(Client.id).all()]
+
+    bounded = EntityCache(maxsize=2, ttl=60)
+    for client_id in ids:
+        bounded.get_client(client_id)
+    assert len(bounded) == 2
+
+    expiring = EntityCache(maxsize=10, ttl=-1)
+    expiring.get_client(ids[0])
+    expiring.get_client(ids[0])
+    assert expiring.hits == 0
+    assert expiring.misses == 2
@@ -0,0 +1,34 @@
+"""
+Tests for the startup migration check.
+"""
+
+import os
+import sys
+
+# Add the parent directory to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from db_migrations import head_revisions, current_revisions, upgrade_if_needed
+
+def test_head_revisions_follow_down_revisions(tmp_path):
+    """Only revisions that nothing builds on are heads."""
+    versions = tmp_path / 'versions'
+    versions.mkdir()
+    (versions / 'a.py').write_text("revision = 'aaa'\ndown_revision = None\n")
+    (versions / 'b.py').write_text("revision = 'bbb'\ndown_revision = 'aaa'\n")
+    (versions / 'c.py').write_text("revision = 'ccc'\ndown_revision = 'aaa'\n")
+    (versions / 'd.py').write_text("revision = 'ddd'\ndown_revision = ('bbb', 'ccc')\n")
+
+    assert head_revisions(str(tmp_path)) == {'ddd'}
+
+def test_upgrade_runs_only_when_behind(tmp_path, monkeypatch):
+    """A fresh database is upgraded once; a current one is left alone."""
+    monkeypatch.setenv('SQLALCHEMY_DATABASE_URI', f"sqlite:///{tmp_path / 'startup.db'}")
+    app = create_app()
+
+    assert upgrade_if_needed(app) is True
+    with app.app_context():
+        assert current_revisions() == head_revisions()
+
+    assert upgrade_if_needed(app) is False
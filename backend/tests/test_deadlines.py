@@ -0,0 +1,132 @@
+"""
+Tests for per-operation deadlines in resolvers and SQL execution.
+"""
+
+import os
+import sys
+import json
+import time
+import pytest
+from decimal import Decimal
+from ariadne import QueryType, graphql_sync, make_executable_schema
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+# Add the parent directory to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import db, Client
+import deadlines
+from deadlines import (
+    DeadlineExceeded, DEADLINE_EXCEEDED, operation_deadline, deadline_middleware, collapse_deadline_errors
+)
+
+# Counts to 50 million, which takes SQLite several seconds
+SLOW_SQL = text("WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n WHERE x < 50000000) "
+                "SELECT count(*) FROM n")
+
+@pytest.fixture
+def app(app):
+    """The conftest app with one client."""
+    with app.app_context():
+        db.session.add(Client(name="Deadline Client", markup_rate=Decimal("0.15")))
+        db.session.commit()
+    return app
+
+def slow_schema(clock):
+    query = QueryType()
+
+    @query.field("slow")
+    def resolve_slow(*_):
+        clock[0] += 0.05
+        return "slow"
+
+    query.set_field("fast", lambda *_: "fast")
+    query.set_field("later", lambda *_: "later")
+    return make_executable_schema("type Query { fast: String slow: String later: String }", query)
+
+def test_fields_after_the_deadline_fail_with_partial_data(monkeypatch):
+    # A fake clock, so only the slow resolver moves time past the deadline
+    clock = [1000.0]
+    monkeypatch.setattr(deadlines.time, "monotonic", lambda: clock[0])
+    schema = slow_schema(clock)
+    with operation_deadline(0.02):
+        _, result = graphql_sync(schema, {"query": "{ fast slow later }"}, middleware=[deadline_middleware])
+
+    assert result["data"] == {"fast": "fast", "slow": "slow", "later": None}
+    assert [error["path"] for error in result["errors"]] == [["later"]]
+    assert result["errors"][0]["extensions"]["code"] == DEADLINE_EXCEEDED
+
+def test_repeated_deadline_errors_are_collapsed():
+    deadline_error = {"message": "late", "extensions": {"code": DEADLINE_EXCEEDED}}
+    other = {"message": "other"}
+    result = {"data": None, "errors": [deadline_error, other, dict(deadline_error, path=["b"])]}
+
+    assert collapse_deadline_errors(result)["errors"] == [deadline_error, other]
+
+def test_running_sqlite_statement_is_interrupted(app_context):
+    started = time.monotonic()
+    with operation_deadline(0.1), pytest.raises(OperationalError, match="interrupted"):
+        db.session.execute(SLOW_SQL)
+    assert time.monotonic() - started < 2
+    db.session.rollback()
+
+    # The connection is usable again once the deadline is gone
+    assert db.session.execute(text("SELECT 1")).scalar() == 1
+
+def test_statement_is_not_sent_after_the_deadline(app_context):
+    with operation_deadline(0.001):
+        time.sleep(0.01)
+        with pytest.raises(DeadlineExceeded):
+            db.session.execute(text("SELECT 1"))
+
+def test_graphql_operation_timeout(app, client):
+    app.config['GRAPHQL_OPERATION_TIMEOUT'] = 1e-9
+
+    response = client.post('/graphql', json={'query': "{ clients { edges { node { name } } } }"})
+
+    assert response.status_code == 200
+    errors = json.loads(response.data)['errors']
+    assert [error['extensions']['code'] for error in errors] == [DEADLINE_EXCEEDED]
+
+    app.config['GRAPHQL_OPERATION_TIMEOUT'] = 0
+    response = client.post('/graphql', json={'query': "{ clients { edges { node { name } } } }"})
+    assert json.loads(response.data)['data']['clients']['edges'][0]['node']['name'] == "Deadline Client"
+
+class FakePostgresConnection:
+    """Just enough of a Connection for the statement hook, recording what it sends."""
+
+    class dialect:
+        name = "postgresql"
+
+    def __init__(self):
+        self.info = {}
+        self.sent = []
+
+    def execute(self, statement):
+        self.sent.append(statement)
+
+def test_postgres_statement_timeout_is_sent_once_per_operation(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(deadlines.time, "monotonic", lambda: clock[0])
+    conn = FakePostgresConnection()
+
+    def statement():
+        deadlines._apply_deadline_to_statement(conn, conn, "SELECT 1", (), None, False)
+
+    with operation_deadline(30):
+        statement()
+        statement()
+        assert conn.sent == ["SET LOCAL statement_timeout = 30000"]
+        # Renewed once the timeout in force could outlive the deadline by more than the slack
+        clock[0] += 5
+        statement()
+        assert conn.sent[-1] == "SET LOCAL statement_timeout = 25000"
+        # A new transaction starts without it
+        deadlines._forget_statement_timeout(conn)
+        statement()
+        assert len(conn.sent) == 3
+    with operation_deadline(10):
+        statement()
+    assert conn.sent[-1] == "SET LOCAL statement_timeout = 10000"
+    assert len(conn.sent) == 4
@@ -0,0 +1,111 @@
+"""
+Tests for the filter arguments of the invoice, transaction and debt connections.
+"""
+
+import os
+import sys
+import json
+import pytest
+from decimal import Decimal
+from datetime import datetime
+
+# Add the parent directory to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import db, Client, Supplier, MaterialsInvoice, Transaction, Debt, InvoiceStatus
+from utils import to_global_id
+
+INVOICES = """
+query Invoices($first: Int, $after: String, $filter: InvoiceFilter) {
+  invoices(first: $first, after: $after, filter: $filter) {
+    edges { node { baseAmount } }
+    pageInfo { hasNextPage endCursor }
+  }
+}
+"""
+
+DEBTS = """
+query Debts($filter: DebtFilter) {
+  debts(filter: $filter) {
+    edges { node { party amount } }
+  }
+}
+"""
+
+@pytest.fixture
+def parties(app_context):
+    """Two clients with invoices of different amounts, dates and statuses."""
+    clients = [Client(name="Filter Client A", markup_rate=Decimal("0.10")),
+               Client(name="Filter Client B", markup_rate=Decimal("0.10"))]
+    supplier = Supplier(name="Filter Supplier")
+    db.session.add_all(clients + [supplier])
+    db.session.flush()
+
+    rows = [
+        (clients[0], datetime(2023, 1, 5), Decimal("100.00"), InvoiceStatus.PAID),
+        (clients[0], datetime(2023, 1, 31, 15, 30), Decimal("200.00"), InvoiceStatus.UNPAID),
+        (clients[0], datetime(2023, 2, 15), Decimal("300.00"), InvoiceStatus.PENDING),
+        (clients[1], datetime(2023, 1, 20), Decimal("400.00"), InvoiceStatus.UNPAID),
+    ]
+    for client, invoice_date, base_amount, status in rows:
+        invoice = MaterialsInvoice(client_id=client.id, supplier_id=supplier.id, invoiceDate=invoice_date,
+                                   baseAmount=base_amount, status=status)
+        db.session.add(invoice)
+        db.session.flush()
+        db.session.add_all([
+            Transaction(invoice_id=invoice.id, amount=base_amount * Decimal("1.1")),
+            Debt(invoice_id=invoice.id, party="client", amount=base_amount * Decimal("1.1")),
+            Debt(invoice_id=invoice.id, party="supplier", amount=base_amount),
+        ])
+    db.session.commit()
+    return {"clients": [to_global_id("Client", c.id) for c in clients],
+            "supplier": to_global_id("Supplier", supplier.id)}
+
+def execute_graphql_query(client, query, variables=None):
+    """Helper function to execute a GraphQL query and return the full result."""
+    response = client.post('/graphql', json={'query': query, 'variables': variables or {}})
+    assert response.status_code == 200
+    return json.loads(response.data)
+
+def invoice_amounts(client, invoice_filter, **variables):
+    result = execute_graphql_query(client, INVOICES, {'filter': invoice_filter, **variables})
+    assert 'errors' not in result
+    return [edge['node']['baseAmount'] for edge in result['data']['invoices']['edges']]
+
+def test_invoice_filters(client, parties):
+    """Each filter field narrows the result in the database."""
+    client_a, client_b = parties["clients"]
+
+    assert invoice_amounts(client, {'clientId': client_b}) == [400.0]
+    assert invoice_amounts(client, {'supplierId': parties["supplier"]}) == [100.0, 200.0, 300.0, 400.0]
+    assert invoice_amounts(client, {'status': ["UNPAID", "PENDING"]}) == [200.0, 300.0, 400.0]
+    # A bare dateTo includes the whole day
+    assert invoice_amounts(client, {'dateFrom': "2023-01-06", 'dateTo': "2023-01-31"}) == [200.0, 400.0]
+    assert invoice_amounts(client, {'minAmount': 150, 'maxAmount': 300}) == [200.0, 300.0]
+    assert invoice_amounts(client, {'clientId': client_a, 'status': ["UNPAID"]}) == [200.0]
+
+def test_filters_compose_with_pagination(client, parties):
+    """Cursors page through the filtered rows only."""
+    invoice_filter = {'status': ["UNPAID", "PENDING"]}
+    result = execute_graphql_query(client, INVOICES, {'first': 2, 'filter': invoice_filter})
+    page = result['data']['invoices']
+    assert [e['node']['baseAmount'] for e in page['edges']] == [200.0, 300.0]
+    assert page['pageInfo']['hasNextPage'] is True
+
+    assert invoice_amounts(client, invoice_filter, first=2, after=page['pageInfo']['endCursor']) == [400.0]
+
+def test_debt_filter_by_party(client, parties):
+    result = execute_graphql_query(client, DEBTS, {'filter': {'party': "supplier", 'minAmount': 300}})
+
+    assert [e['node'] for e in result['data']['debts']['edges']] == [
+        {'party': "supplier", 'amount': 300.0}, {'party': "supplier", 'amount': 400.0}]
+
+def test_invalid_filter_values_are_reported(client, parties):
+    result = execute_graphql_query(client, INVOICES, {'filter': {'status': ["SETTLED"]}})
+    assert "Invalid status: SETTLED" in result['errors'][0]['message']
+
+    result = execute_graphql_query(client, INVOICES, {'filter': {'clientId': parties["supplier"]}})
+    assert "Invalid ID type for Client" in result['errors'][0]['message']
+
+    result = execute_graphql_query(client, DEBTS, {'filter': {'party': "Client"}})
+    assert "Invalid party: Client" in result['errors'][0]['message']
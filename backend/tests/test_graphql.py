@@ -52,7 +52,7 @@ def populated_db_with_invoices(app_context, populated_db):
     
     # Add a debt
     debt = Debt(
-        party="Client",
+        party="client",
         amount=Decimal('575.00'),  # 500 + 15% markup
         invoice_id=invoice.id
     )
@@ -244,7 +244,7 @@ def test_query_debts(client, populated_db_with_invoices):
     assert 'party' in debt_node
     assert 'invoice' in debt_node
     assert float(debt_node['amount']) == 575.00
-    assert debt_node['party'] == 'Client'
+    assert debt_node['party'] == 'client'
     assert float(debt_node['invoice']['baseAmount']) == 500.00
 
 def test_query_transactions(client, populated_db_with_invoices):
@@ -454,4 +454,41 @@ def test_create_materials_invoice_mutation_validation_errors(client, app, app_co
     assert data['data']['createMaterialsInvoice']['invoice'] is None
     assert 'errors' in data['data']['createMaterialsInvoice']
     assert len(data['data']['createMaterialsInvoice']['errors']) > 0
-    assert "Client not found" in data['data']['createMaterialsInvoice']['errors'][0] 
\ No newline at end of file
+    assert "Client not found" in data['data']['createMaterialsInvoice']['errors'][0] 
+
+def test_create_materials_invoice_reads_current_markup_rate(client, app, app_context):
+    """The invoice is priced with the rate in the database, not a cached snapshot of it."""
+    from sqlalchemy import update
+    from cache import entity_cache
+
+    db.session.remove()
+    client_obj = Client(name="Repriced Client", markup_rate=Decimal("0.10"))
+    supplier_obj = Supplier(name="Repriced Supplier")
+    db.session.add_all([client_obj, supplier_obj])
+    db.session.commit()
+    client_id, supplier_id = client_obj.id, supplier_obj.id
+
+    assert entity_cache.get_client(client_id).markup_rate == Decimal("0.10")
+    # Changed by another worker: this process's cache still holds the old rate
+    db.session.execute(update(Client).where(Client.id == client_id).values(markup_rate=Decimal("0.50")))
+    db.session.commit()
+    assert entity_cache.get_client(client_id).markup_rate == Decimal("0.10")
+    db.session.remove()
+
+    mutation = """
+    mutation CreateInvoice($clientId: ID!, $supplierId: ID!) {
+      createMaterialsInvoice(clientId: $clientId, supplierId: $supplierId, invoiceDate: "2023-04-20",
+                             baseAmount: 100.0) {
+        invoice { id }
+        errors
+      }
+    }
+    """
+    response = client.post('/graphql', json={'query': mutation, 'variables': {
+        "clientId": to_global_id("Client", client_id),
+        "supplierId": to_global_id("Supplier", supplier_id),
+    }})
+
+    result = json.loads(response.data)['data']['createMaterialsInvoice']
+    assert result['errors'] is None
+    assert [t.amount for t in Transaction.query.all()] == [Decimal("150.00")]
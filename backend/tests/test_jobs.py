@@ -0,0 +1,197 @@
+"""
+Tests for the background job runner and its GraphQL fields.
+"""
+
+import os
+import sys
+import json
+import threading
+from datetime import datetime, timedelta
+from decimal import Decimal
+from sqlalchemy import update
+
+# Add the parent directory to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import db, Client, Job, JobStatus
+from utils import to_global_id, from_global_id
+from jobs import JobRunner, job_handler, job_owner, INTERRUPTED_ERROR
+
+START_JOB = """
+mutation StartJob($kind: String!, $params: String) {
+  startJob(kind: $kind, params: $params) {
+    job {
+      id
+      status
+    }
+    errors
+  }
+}
+"""
+
+JOB_QUERY = """
+query Job($id: ID!) {
+  job(id: $id) {
+    id
+    kind
+    status
+    progress
+    total
+    result
+    error
+    finishedDate
+  }
+}
+"""
+
+handler_started = threading.Event()
+
+@job_handler("test_wait_for_cancel")
+def wait_for_cancel_job(ctx):
+    handler_started.set()
+    while True:
+        ctx.report(0)
+        ctx.cancel_event.wait(0.01)
+
+@job_handler("test_fail")
+def failing_job(ctx):
+    raise RuntimeError("boom")
+
+def execute_graphql_query(client, query, variables=None):
+    """Helper function to execute a GraphQL query."""
+    response = client.post('/graphql', json={'query': query, 'variables': variables or {}})
+    assert response.status_code == 200
+    return json.loads(response.data)['data']
+
+def start_and_wait(app, client, kind, params=None):
+    result = execute_graphql_query(client, START_JOB, {
+        'kind': kind, 'params': json.dumps(params) if params is not None else None})
+    assert result['startJob']['errors'] is None
+    job_id = result['startJob']['job']['id']
+    app.extensions['jobs'].wait(from_global_id(job_id)[1], timeout=5)
+    return execute_graphql_query(client, JOB_QUERY, {'id': job_id})['job']
+
+def test_reprice_client_job_succeeds(app, client, app_context):
+    """The reprice_client job runs off the request thread and records its result."""
+    client_obj = Client(name="Job Client", markup_rate=Decimal("0.15"))
+    db.session.add(client_obj)
+    db.session.commit()
+
+    job = start_and_wait(app, client, "reprice_client", {
+        'clientId': to_global_id("Client", client_obj.id), 'rate': 0.2})
+
+    assert job['kind'] == "reprice_client"
+    assert job['status'] == "SUCCEEDED"
+    assert job['progress'] == 1
+    assert job['total'] == 1
+    assert json.loads(job['result']) == {"repricedInvoices": 0}
+    assert job['finishedDate'] is not None
+
+    db.session.expire_all()
+    assert Client.query.get(client_obj.id).markup_rate == Decimal("0.2000")
+
+def test_failed_job_records_error(app, client, app_context):
+    """Exceptions raised by a handler mark the job as failed."""
+    job = start_and_wait(app, client, "test_fail")
+
+    assert job['status'] == "FAILED"
+    assert job['error'] == "boom"
+
+def test_unknown_kind_and_bad_params(client, app_context):
+    """Unknown job kinds and malformed params are rejected without queuing."""
+    result = execute_graphql_query(client, START_JOB, {'kind': "no_such_job"})
+    assert "Unknown job kind" in result['startJob']['errors'][0]
+
+    result = execute_graphql_query(client, START_JOB, {'kind': "test_fail", 'params': "[1, 2]"})
+    assert result['startJob']['errors'] == ["Job params must be a JSON object"]
+    assert Job.query.count() == 0
+
+def test_cancel_running_job(app, client, app_context):
+    """A running job stops at its next progress report after cancelJob."""
+    handler_started.clear()
+    result = execute_graphql_query(client, START_JOB, {'kind': "test_wait_for_cancel"})
+    job_id = result['startJob']['job']['id']
+    assert handler_started.wait(5)
+
+    result = execute_graphql_query(client, """
+    mutation Cancel($id: ID!) { cancelJob(id: $id) { job { id } errors } }
+    """, {'id': job_id})
+    assert result['cancelJob']['errors'] is None
+
+    app.extensions['jobs'].wait(from_global_id(job_id)[1], timeout=5)
+    job = execute_graphql_query(client, JOB_QUERY, {'id': job_id})['job']
+    assert job['status'] == JobStatus.CANCELLED.name
+
+    result = execute_graphql_query(client, """
+    mutation Cancel($id: ID!) { cancelJob(id: $id) { job { id } errors } }
+    """, {'id': job_id})
+    assert "already finished" in result['cancelJob']['errors'][0]
+
+def test_jobs_with_stale_heartbeats_are_failed(app, client, app_context):
+    """Unfinished jobs whose process stopped beating are marked FAILED; live ones are kept."""
+    now = datetime.utcnow()
+    stale = now - timedelta(minutes=5)
+    rows = [
+        (JobStatus.QUEUED, None),           # written before heartbeats existed
+        (JobStatus.RUNNING, stale),         # its process is gone
+        (JobStatus.RUNNING, now),           # running on another live instance
+        (JobStatus.SUCCEEDED, stale),
+    ]
+    for status, heartbeat in rows:
+        db.session.add(Job(kind="reprice_client", status=status, params="{}", progress=0,
+                           cancel_requested=False, owner="other-host:1", heartbeatDate=heartbeat))
+    db.session.commit()
+    handler_started.clear()
+    result = execute_graphql_query(client, START_JOB, {'kind': "test_wait_for_cancel"})
+    running_id = from_global_id(result['startJob']['job']['id'])[1]
+    assert handler_started.wait(5)
+
+    runner = app.extensions['jobs']
+    assert runner.fail_interrupted() == 2
+
+    db.session.expire_all()
+    jobs = {job.id: job for job in Job.query.all()}
+    assert [(job.status, job.error) for job_id, job in sorted(jobs.items()) if job_id != running_id] == [
+        (JobStatus.FAILED, INTERRUPTED_ERROR), (JobStatus.FAILED, INTERRUPTED_ERROR),
+        (JobStatus.RUNNING, None), (JobStatus.SUCCEEDED, None)]
+    assert all(job.finishedDate is not None for job in jobs.values() if job.status == JobStatus.FAILED)
+    assert jobs[running_id].status == JobStatus.RUNNING
+    assert jobs[running_id].owner == job_owner()
+
+    # The runner's heartbeat keeps its own job fresh
+    db.session.execute(update(Job).where(Job.id == running_id).values(heartbeatDate=stale))
+    db.session.commit()
+    runner.beat()
+    db.session.expire_all()
+    assert db.session.get(Job, running_id).heartbeatDate > stale
+
+    runner.cancel(running_id)
+    runner.wait(running_id, timeout=5)
+
+def test_queued_jobs_are_claimed_by_another_runner(app, client, app_context):
+    """With jobs out of process, the web runner only queues; a job runner claims and runs them."""
+    web = app.extensions['jobs']
+    web.in_process = False
+    result = execute_graphql_query(client, START_JOB, {'kind': "test_fail"})
+    job_id = result['startJob']['job']['id']
+    db_id = from_global_id(job_id)[1]
+
+    job = db.session.get(Job, db_id)
+    assert (job.status, job.owner) == (JobStatus.QUEUED, None)
+    # Waiting to be claimed is not being interrupted, however long it takes
+    db.session.execute(update(Job).where(Job.id == db_id).values(heartbeatDate=datetime.utcnow() - timedelta(days=1)))
+    db.session.commit()
+    assert web.fail_interrupted() == 0
+
+    worker = JobRunner(app, max_workers=1)
+    try:
+        assert worker.claim() == 1
+        assert worker.claim() == 0
+        worker.wait(db_id, timeout=5)
+    finally:
+        worker.shutdown()
+
+    job = execute_graphql_query(client, JOB_QUERY, {'id': job_id})['job']
+    assert (job['status'], job['error']) == ("FAILED", "boom")
+    db.session.expire_all()
+    assert db.session.get(Job, db_id).owner == job_owner()
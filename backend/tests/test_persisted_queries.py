@@ -0,0 +1,108 @@
+"""
+Tests for automatic persisted queries over GET and POST.
+"""
+
+import os
+import sys
+import json
+import pytest
+from decimal import Decimal
+
+# Add the parent directory to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import db, Client
+from persisted_queries import PersistedQueryStore, query_hash, PERSISTED_QUERY_NOT_FOUND, RELAY_TEXT_PATTERN
+
+CLIENT_NAMES = "query ClientNames { clients { edges { node { name } } } }"
+
+@pytest.fixture
+def app(app):
+    """The conftest app with one client."""
+    with app.app_context():
+        db.session.add(Client(name="Persisted Client", markup_rate=Decimal("0.15")))
+        db.session.commit()
+    return app
+
+def apq_extensions(query):
+    return {"persistedQuery": {"version": 1, "sha256Hash": query_hash(query)}}
+
+def get_persisted(client, query, variables=None, headers=None):
+    params = {'extensions': json.dumps(apq_extensions(query))}
+    if variables is not None:
+        params['variables'] = json.dumps(variables)
+    return client.get('/graphql', query_string=params, headers=headers or {})
+
+def test_miss_then_register_then_hit(client):
+    """An unknown hash misses, is registered with its text, then hits."""
+    miss = get_persisted(client, CLIENT_NAMES)
+    assert miss.status_code == 200
+    assert json.loads(miss.data)['errors'][0]['message'] == PERSISTED_QUERY_NOT_FOUND
+
+    register = client.post('/graphql', json={'query': CLIENT_NAMES, 'extensions': apq_extensions(CLIENT_NAMES)})
+    assert json.loads(register.data)['data']['clients']['edges'][0]['node']['name'] == "Persisted Client"
+
+    hit = get_persisted(client, CLIENT_NAMES)
+    assert hit.status_code == 200
+    assert json.loads(hit.data)['data']['clients']['edges'][0]['node']['name'] == "Persisted Client"
+    assert hit.headers['Cache-Control'] == "public, no-cache"
+
+    revalidated = get_persisted(client, CLIENT_NAMES, headers={'If-None-Match': hit.headers['ETag']})
+    assert revalidated.status_code == 304
+
+def test_hash_mismatch_is_rejected(client):
+    """A query whose text does not match the supplied hash is not registered."""
+    response = client.post('/graphql', json={
+        'query': CLIENT_NAMES, 'extensions': apq_extensions("{ clients { edges { cursor } } }")})
+    assert response.status_code == 400
+    assert "does not match" in json.loads(response.data)['errors'][0]['message']
+
+@pytest.mark.parametrize("body", [
+    {"query": "{ __typename }", "extensions": 5},
+    {"query": "{ __typename }", "extensions": {"persistedQuery": "abc"}},
+    {"query": 5, "extensions": {"persistedQuery": {"version": 1, "sha256Hash": "abc"}}},
+])
+def test_malformed_extensions_are_rejected(client, body):
+    response = client.post('/graphql', json=body)
+    assert response.status_code == 400
+    assert json.loads(response.data)['errors'][0]['message']
+
+    # Inside a batch only that operation fails
+    batch = client.post('/graphql', json=[body, {'query': CLIENT_NAMES}])
+    assert batch.status_code == 200
+    error, ok = json.loads(batch.data)
+    assert error['errors'] and 'data' not in error
+    assert ok['data']['clients']['edges'][0]['node']['name'] == "Persisted Client"
+
+def test_relay_artifacts_are_preloaded(app, client):
+    """The frontend's Relay operations are served without registration."""
+    artifact = os.path.join(app.config['PERSISTED_QUERIES_DIR'], 'ClientListQuery.graphql.ts')
+    with open(artifact, encoding='utf-8') as f:
+        client_list = json.loads(RELAY_TEXT_PATTERN.search(f.read()).group(1))
+    assert app.extensions['persisted_queries'].get(query_hash(client_list)) == client_list
+
+    response = get_persisted(client, client_list, variables={'first': 5})
+    data = json.loads(response.data)
+    assert data['data']['clients']['edges'][0]['node']['name'] == "Persisted Client"
+
+def test_get_rejects_mutations(client):
+    """Mutations cannot be sent with GET, persisted or not."""
+    mutation = 'mutation { updateClientMarkup(clientId: "Q2xpZW50OjE=", rate: 0.2) { errors } }'
+    response = client.get('/graphql', query_string={'query': mutation})
+    assert response.status_code == 405
+    assert response.headers['Allow'] == 'POST'
+
+def test_store_is_bounded():
+    """The least recently used query is evicted when the store is full."""
+    store = PersistedQueryStore(maxsize=2)
+    first = store.register("{ a }")
+    store.register("{ b }")
+    store.register("{ c }")
+    assert store.get(first) is None
+    assert len(store) == 2
+
+def test_plain_get_serves_explorer(client):
+    """A GET without parameters still serves the GraphQL explorer."""
+    response = client.get('/graphql')
+    assert response.status_code == 200
+    assert b'<html' in response.data.lower()
@@ -0,0 +1,124 @@
+"""
+Tests for the set-based client markup update and invoice repricing.
+"""
+
+import os
+import sys
+import json
+import pytest
+from decimal import Decimal
+from datetime import date
+
+# Add the parent directory to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import db, Client, Supplier, MaterialsInvoice, Transaction, Debt, InvoiceStatus
+from utils import to_global_id, markup_amount
+from cache import entity_cache
+from events import event_bus, DEBT_CHANGED
+
+UPDATE_MARKUP = """
+mutation UpdateMarkup($clientId: ID!, $rate: Float!, $repriceUnpaid: Boolean) {
+  updateClientMarkup(clientId: $clientId, rate: $rate, repriceUnpaid: $repriceUnpaid) {
+    client {
+      id
+      markup_rate
+    }
+    repricedInvoices
+    errors
+  }
+}
+"""
+
+@pytest.fixture
+def client_with_invoices(app_context):
+    """Create a client with two unpaid invoices and one paid invoice."""
+    client = Client(name="Pricing Client", markup_rate=Decimal("0.10"))
+    supplier = Supplier(name="Pricing Supplier")
+    db.session.add_all([client, supplier])
+    db.session.flush()
+
+    for base_amount, status in [(Decimal("750.50"), InvoiceStatus.UNPAID),
+                                (Decimal("123.45"), InvoiceStatus.PENDING),
+                                (Decimal("100.00"), InvoiceStatus.PAID)]:
+        invoice = MaterialsInvoice(client_id=client.id, supplier_id=supplier.id,
+                                   invoiceDate=date(2023, 4, 15), baseAmount=base_amount, status=status)
+        db.session.add(invoice)
+        db.session.flush()
+        amount = markup_amount(base_amount, client.markup_rate)
+        db.session.add_all([
+            Transaction(invoice_id=invoice.id, amount=amount),
+            Debt(invoice_id=invoice.id, party="client", amount=amount),
+            Debt(invoice_id=invoice.id, party="supplier", amount=base_amount),
+        ])
+    db.session.commit()
+    return client.id
+
+def update_markup(client, client_id, rate, reprice_unpaid=True):
+    response = client.post('/graphql', json={'query': UPDATE_MARKUP, 'variables': {
+        'clientId': to_global_id("Client", client_id),
+        'rate': rate,
+        'repriceUnpaid': reprice_unpaid,
+    }})
+    assert response.status_code == 200
+    return json.loads(response.data)['data']['updateClientMarkup']
+
+def test_markup_amount_rounds_half_up():
+    """Transaction amounts are rounded half up to whole cents."""
+    assert markup_amount(Decimal("750.50"), Decimal("0.15")) == Decimal("863.08")
+    assert markup_amount(Decimal("123.45"), Decimal("0.15")) == Decimal("141.97")
+
+def test_update_client_markup_reprices_unpaid_invoices(client, client_with_invoices):
+    """Unpaid invoices are repriced exactly; paid invoices and supplier debts are untouched."""
+    entity_cache.get_client(client_with_invoices)
+
+    result = update_markup(client, client_with_invoices, 0.15)
+
+    assert result['errors'] is None
+    assert result['repricedInvoices'] == 2
+    assert result['client']['markup_rate'] == 0.15
+
+    db.session.expire_all()
+    for invoice in MaterialsInvoice.query.all():
+        expected_rate = Decimal("0.10") if invoice.status == InvoiceStatus.PAID else Decimal("0.15")
+        expected = markup_amount(invoice.baseAmount, expected_rate)
+        assert invoice.transaction.amount == expected
+        debts = {d.party: d.amount for d in invoice.debts}
+        assert debts["client"] == expected
+        assert debts["supplier"] == invoice.baseAmount
+
+def test_update_client_markup_publishes_repriced_debts(client, client_with_invoices, monkeypatch):
+    """Every repriced client debt is published to debtChanged subscribers after the commit."""
+    published = []
+    monkeypatch.setattr(event_bus, "publish", lambda topic, payload: published.append(
+        (topic, payload, db.session().in_transaction())))
+
+    update_markup(client, client_with_invoices, 0.15)
+
+    repriced = Debt.query.join(MaterialsInvoice).filter(
+        Debt.party == "client", MaterialsInvoice.status != InvoiceStatus.PAID).all()
+    assert sorted(published, key=lambda event: event[1]["id"]) == [
+        (DEBT_CHANGED, {"id": debt.id, "invoice_id": debt.invoice_id, "party": "client"}, False)
+        for debt in sorted(repriced, key=lambda debt: debt.id)
+    ]
+
+def test_update_client_markup_without_repricing(client, client_with_invoices):
+    """With repriceUnpaid false only the client's rate changes."""
+    result = update_markup(client, client_with_invoices, 0.3, reprice_unpaid=False)
+
+    assert result['errors'] is None
+    assert result['repricedInvoices'] == 0
+    db.session.expire_all()
+    assert Client.query.get(client_with_invoices).markup_rate == Decimal("0.3000")
+    assert {t.amount for t in Transaction.query.all()} == {
+        Decimal("825.55"), Decimal("135.80"), Decimal("110.00")}
+
+def test_update_client_markup_validation(client, client_with_invoices):
+    """Negative rates and unknown clients are reported as errors."""
+    result = update_markup(client, client_with_invoices, -0.1)
+    assert result['client'] is None
+    assert "Must be >= 0" in result['errors'][0]
+
+    result = update_markup(client, 9999, 0.1)
+    assert result['client'] is None
+    assert "Client not found" in result['errors'][0]
@@ -0,0 +1,70 @@
+"""
+Tests for on-demand profiling of single GraphQL requests.
+"""
+
+import os
+import sys
+import json
+import pstats
+import pytest
+from decimal import Decimal
+
+# Add the parent directory to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import db, Client
+from profiling import ProfilerBusy, profiled
+
+CLIENT_NAMES = "query ClientNames { clients { edges { node { name } } } }"
+
+@pytest.fixture
+def app(app, tmp_path):
+    """The conftest app with profiling enabled and one client."""
+    app.config['PROFILE_TOKEN'] = "secret"
+    app.config['PROFILE_DIR'] = str(tmp_path / "profiles")
+    with app.app_context():
+        db.session.add(Client(name="Profiled Client", markup_rate=Decimal("0.15")))
+        db.session.commit()
+    return app
+
+def test_profiled_request_writes_stats_and_stacks(app, client):
+    response = client.post('/graphql', json={'query': CLIENT_NAMES}, headers={'X-Profile': "secret"})
+
+    assert response.status_code == 200
+    body = json.loads(response.data)
+    assert body['data']['clients']['edges'][0]['node']['name'] == "Profiled Client"
+    profile_id = body['extensions']['profile']['id']
+    assert response.headers['X-Profile-Id'] == profile_id
+
+    directory = app.config['PROFILE_DIR']
+    stats = pstats.Stats(os.path.join(directory, f"{profile_id}.pstats"))
+    assert any(name == "graphql_sync" for _, _, name in stats.stats)
+    # Collapsed stacks: "frame;frame;frame count" per line
+    with open(os.path.join(directory, f"{profile_id}.collapsed"), encoding="utf-8") as f:
+        for line in f:
+            stack, count = line.rsplit(" ", 1)
+            assert int(count) > 0 and stack
+
+def test_requests_without_header_are_not_profiled(app, client):
+    response = client.post('/graphql', json={'query': CLIENT_NAMES})
+
+    assert 'extensions' not in json.loads(response.data)
+    assert 'X-Profile-Id' not in response.headers
+    assert not os.path.exists(app.config['PROFILE_DIR'])
+
+def test_wrong_token_is_rejected(app, client):
+    response = client.post('/graphql', json={'query': CLIENT_NAMES}, headers={'X-Profile': "guess"})
+    assert response.status_code == 403
+
+def test_header_is_ignored_without_configured_token(app, client):
+    app.config['PROFILE_TOKEN'] = None
+    response = client.post('/graphql', json={'query': CLIENT_NAMES}, headers={'X-Profile': "secret"})
+
+    assert response.status_code == 200
+    assert 'extensions' not in json.loads(response.data)
+
+def test_one_profile_at_a_time(tmp_path):
+    with profiled(str(tmp_path)):
+        with pytest.raises(ProfilerBusy):
+            with profiled(str(tmp_path)):
+                pass
@@ -0,0 +1,90 @@
+"""
+Tests for selection-aware column projection in connection and entity resolvers.
+"""
+
+import os
+import sys
+import json
+import pytest
+from decimal import Decimal
+from datetime import date
+
+# Add the parent directory to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+
+import projection
+from models import db, Client, Supplier, MaterialsInvoice, InvoiceStatus
+from utils import to_global_id
+
+@pytest.fixture
+def invoice_id(app_context):
+    client = Client(name="Projection Client", markup_rate=Decimal("0.10"))
+    supplier = Supplier(name="Projection Supplier")
+    db.session.add_all([client, supplier])
+    db.session.flush()
+    invoice = MaterialsInvoice(client_id=client.id, supplier_id=supplier.id, invoiceDate=date(2023, 5, 1),
+                               baseAmount=Decimal("250.00"), status=InvoiceStatus.PENDING)
+    db.session.add(invoice)
+    db.session.commit()
+    return invoice.id
+
+@pytest.fixture
+def invoice_selects(app_context):
+    """Collect the SELECT statements issued against materials_invoices."""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT") and "FROM materials_invoices" in statement:
+            statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", record)
+    yield statements
+    event.remove(db.engine, "before_cursor_execute", record)
+
+def run_query(client, query, variables=None):
+    db.session.expire_all()
+    response = client.post('/graphql', json={'query': query, 'variables': variables or {}})
+    assert response.status_code == 200
+    result = json.loads(response.data)
+    assert 'errors' not in result
+    return result['data']
+
+def test_connection_loads_only_selected_columns(client, invoice_id, invoice_selects):
+    """Unselected columns such as status and invoiceDate are not fetched."""
+    data = run_query(client, "{ invoices(first: 10) { edges { node { id baseAmount } } } }")
+
+    assert data['invoices']['edges'][0]['node']['baseAmount'] == 250.0
+    assert len(invoice_selects) == 1
+    assert "baseAmount" in invoice_selects[0]
+    assert "status" not in invoice_selects[0]
+    assert "invoiceDate" not in invoice_selects[0]
+
+def test_fragments_contribute_columns(client, invoice_id, invoice_selects):
+    """Fields selected through named and inline fragments are loaded up front."""
+    data = run_query(client, """
+        query($id: ID!) {
+          node(id: $id) { id ...InvoiceStatus ... on Client { name } }
+        }
+        fragment InvoiceStatus on MaterialsInvoice { status client { name } }
+    """, {'id': to_global_id("MaterialsInvoice", invoice_id)})
+
+    assert data['node']['status'] == "PENDING"
+    assert data['node']['client']['name'] == "Projection Client"
+    assert len(invoice_selects) == 1
+    assert "status" in invoice_selects[0]
+    assert "client_id" in invoice_selects[0]
+    assert "baseAmount" not in invoice_selects[0]
+
+def test_unknown_field_falls_back_to_full_rows(client, invoice_id, invoice_selects, monkeypatch):
+    """A selected field missing from the column map loads every column."""
+    type_name, field_columns = projection.FIELD_COLUMNS[MaterialsInvoice]
+    monkeypatch.setitem(projection.FIELD_COLUMNS, MaterialsInvoice,
+                        (type_name, {k: v for k, v in field_columns.items() if k != "status"}))
+
+    data = run_query(client, "{ invoices { edges { node { status } } } }")
+
+    assert data['invoices']['edges'][0]['node']['status'] == "PENDING"
+    assert len(invoice_selects) == 1
+    assert "invoiceDate" in invoice_selects[0]
@@ -0,0 +1,172 @@
+"""
+Tests for the ledger reconciliation engine.
+"""
+
+import os
+import sys
+import csv
+import pytest
+from decimal import Decimal
+from datetime import datetime
+
+# Add the parent directory to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from models import db, Client, Supplier, MaterialsInvoice, Transaction, Debt, InvoiceStatus
+from reconcile import reconcile_ledger, id_ranges
+from pricing import update_client_markup
+from utils import markup_amount
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """A file-backed database, so that worker processes can open it too."""
+    monkeypatch.setenv('SQLALCHEMY_DATABASE_URI', f"sqlite:///{tmp_path / 'ledger.db'}")
+    app = create_app()
+
+    with app.app_context():
+        db.create_all()
+
+    yield app
+
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+def add_invoice(client, supplier, status=InvoiceStatus.UNPAID, base_amount=Decimal("100.00")):
+    invoice = MaterialsInvoice(client_id=client.id, supplier_id=supplier.id, invoiceDate=datetime(2024, 1, 10),
+                               baseAmount=base_amount, status=status, markupRate=client.markup_rate)
+    db.session.add(invoice)
+    db.session.flush()
+    amount = markup_amount(base_amount, client.markup_rate)
+    db.session.add_all([
+        Transaction(invoice_id=invoice.id, amount=amount),
+        Debt(invoice_id=invoice.id, party="client", amount=amount),
+        Debt(invoice_id=invoice.id, party="supplier", amount=base_amount),
+    ])
+    db.session.flush()
+    return invoice.id
+
+@pytest.fixture
+def ledger(app_context):
+    """Ten consistent invoices and the two parties behind them."""
+    client = Client(name="Ledger Client", markup_rate=Decimal("0.1250"))
+    supplier = Supplier(name="Ledger Supplier")
+    db.session.add_all([client, supplier])
+    db.session.flush()
+    ids = [add_invoice(client, supplier, base_amount=Decimal("10.05") * n) for n in range(1, 11)]
+    db.session.commit()
+    return client, supplier, ids
+
+def read_report(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        return [(int(row["invoice_id"]), row["check"], row["expected"], row["actual"]) for row in csv.DictReader(f)]
+
+def break_ledger(ids):
+    """Introduce one discrepancy of each kind and return the expected report."""
+    first, second, third, fourth = ids[:4]
+    db.session.query(Transaction).filter_by(invoice_id=first).delete()
+    db.session.add(Debt(invoice_id=second, party="supplier", amount=Decimal("1.00")))
+    transaction = Transaction.query.filter_by(invoice_id=third).one()
+    transaction.amount = Decimal("99.99")
+    supplier_debt = Debt.query.filter_by(invoice_id=fourth, party="supplier").one()
+    supplier_debt.amount = Decimal("40.19")
+    db.session.commit()
+    return [
+        (first, "transaction_count", "1", "0"),
+        (second, "supplier_debt_count", "1", "2"),
+        (second, "supplier_debt_amount", "20.10", "21.10"),
+        (third, "transaction_amount", "33.92", "99.99"),
+        (third, "client_debt_amount", "99.99", "33.92"),
+        (fourth, "supplier_debt_amount", "40.20", "40.19"),
+    ]
+
+def test_consistent_ledger_has_no_discrepancies(ledger, tmp_path):
+    """A ledger written by createMaterialsInvoice passes every check."""
+    output = tmp_path / "report.csv"
+    progress = []
+
+    counts = reconcile_ledger(str(output), chunk_size=3, progress=lambda done, total: progress.append((done, total)))
+
+    assert counts == {}
+    assert read_report(output) == []
+    assert progress == [(1, 4), (2, 4), (3, 4), (4, 4)]
+
+def test_id_ranges_cover_the_id_space(ledger):
+    _, _, ids = ledger
+    assert id_ranges(4) == [(ids[0], ids[3]), (ids[4], ids[7]), (ids[8], ids[9])]
+
+def test_discrepancies_are_reported(ledger, tmp_path):
+    """Every violated invariant of an invoice gets its own report row."""
+    _, _, ids = ledger
+    expected = break_ledger(ids)
+    output = tmp_path / "report.csv"
+
+    counts = reconcile_ledger(str(output), chunk_size=3)
+
+    assert read_report(output) == expected
+    assert counts == {"transaction_count": 1, "supplier_debt_count": 1, "supplier_debt_amount": 2,
+                      "transaction_amount": 1, "client_debt_amount": 1}
+
+def test_settled_and_repriced_paid_invoices_are_consistent(ledger, tmp_path):
+    """PAID invoices keep their billed amount after a markup change, settled debts must be zero."""
+    client, supplier, ids = ledger
+    paid_id = add_invoice(client, supplier, status=InvoiceStatus.PAID)
+    for debt in Debt.query.filter_by(invoice_id=ids[0]):
+        debt.amount = 0
+        debt.settledDate = datetime(2024, 2, 1)
+    db.session.get(MaterialsInvoice, ids[0]).status = InvoiceStatus.PAID
+    client.markup_rate = Decimal("0.2000")
+    for invoice_id in ids[1:]:
+        invoice = db.session.get(MaterialsInvoice, invoice_id)
+        invoice.markupRate = client.markup_rate
+        amount = markup_amount(invoice.baseAmount, client.markup_rate)
+        Transaction.query.filter_by(invoice_id=invoice_id).one().amount = amount
+        Debt.query.filter_by(invoice_id=invoice_id, party="client").one().amount = amount
+    # A settled debt that still carries an amount is a discrepancy
+    Debt.query.filter_by(invoice_id=paid_id, party="client").one().settledDate = datetime(2024, 2, 1)
+    db.session.commit()
+    output = tmp_path / "report.csv"
+
+    reconcile_ledger(str(output))
+
+    assert read_report(output) == [(paid_id, "client_debt_amount", "0.00", "112.50")]
+
+def test_markup_change_without_repricing_is_consistent(ledger, tmp_path):
+    """updateClientMarkup(repriceUnpaid: false) leaves invoices at the rate they were billed at."""
+    client, supplier, ids = ledger
+    update_client_markup(client.id, Decimal("0.3000"), reprice_unpaid=False)
+    legacy_id = add_invoice(client, supplier)
+    db.session.get(MaterialsInvoice, legacy_id).markupRate = None
+    Transaction.query.filter_by(invoice_id=legacy_id).one().amount = Decimal("1.00")
+    Debt.query.filter_by(invoice_id=legacy_id, party="client").one().amount = Decimal("1.00")
+    db.session.commit()
+    output = tmp_path / "report.csv"
+
+    assert reconcile_ledger(str(output)) == {}
+
+    # Repriced invoices are checked against their new rate
+    update_client_markup(client.id, Decimal("0.2000"))
+    db.session.commit()
+    Transaction.query.filter_by(invoice_id=ids[0]).one().amount = Decimal("11.31")
+    db.session.commit()
+
+    reconcile_ledger(str(output))
+
+    assert (ids[0], "transaction_amount", "12.06", "11.31") in read_report(output)
+
+def test_worker_processes_match_inline_run(ledger, tmp_path):
+    """Ranges checked in a process pool produce the same report rows."""
+    _, _, ids = ledger
+    expected = break_ledger(ids)
+    output = tmp_path / "report.csv"
+
+    counts = reconcile_ledger(str(output), workers=2, chunk_size=2)
+
+    assert sorted(read_report(output)) == sorted(expected)
+    assert sum(counts.values()) == len(expected)
+
+def test_empty_ledger(app_context, tmp_path):
+    output = tmp_path / "report.csv"
+    assert reconcile_ledger(str(output), workers=2) == {}
+    assert read_report(output) == []
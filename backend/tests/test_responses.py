@@ -0,0 +1,107 @@
+"""
+Tests for GraphQL response compression and ETag revalidation.
+"""
+
+import os
+import sys
+import gzip
+import json
+import pytest
+from decimal import Decimal
+
+# Add the parent directory to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import db, Client
+
+CLIENTS_QUERY = "{ clients { edges { node { id name markup_rate } } } }"
+
+@pytest.fixture
+def app(app):
+    """The conftest app with 50 clients."""
+    with app.app_context():
+        db.session.add_all([Client(name=f"Client {i}", markup_rate=Decimal("0.15")) for i in range(50)])
+        db.session.commit()
+    return app
+
+def post_graphql(client, query, headers=None):
+    return client.post('/graphql', json={'query': query}, headers=headers or {})
+
+def test_large_responses_are_gzip_compressed(client):
+    """Bodies above the threshold are gzip-encoded when the client accepts it."""
+    plain = post_graphql(client, CLIENTS_QUERY)
+    compressed = post_graphql(client, CLIENTS_QUERY, {'Accept-Encoding': 'gzip'})
+
+    assert 'Content-Encoding' not in plain.headers
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in compressed.headers['Vary']
+    assert len(compressed.data) < len(plain.data)
+    assert json.loads(gzip.decompress(compressed.data)) == json.loads(plain.data)
+
+def test_small_responses_are_not_compressed(client):
+    """Bodies below the threshold are sent as is."""
+    response = post_graphql(client, "{ clients(first: 1) { edges { cursor } } }", {'Accept-Encoding': 'gzip'})
+
+    assert response.status_code == 200
+    assert 'Content-Encoding' not in response.headers
+
+def get_graphql(client, query, headers=None):
+    return client.get('/graphql', query_string={'query': query}, headers=headers or {})
+
+def test_matching_etag_returns_not_modified(client):
+    """Repeating a GET query with its ETag yields an empty 304."""
+    first = get_graphql(client, CLIENTS_QUERY, {'Accept-Encoding': 'gzip'})
+    etag = first.headers['ETag']
+    assert etag.endswith('-gzip"')
+
+    second = get_graphql(client, CLIENTS_QUERY, {'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+    assert second.status_code == 304
+    assert second.data == b''
+    assert second.headers['ETag'] == etag
+
+    # The uncompressed representation is also considered current
+    third = get_graphql(client, CLIENTS_QUERY, {'If-None-Match': etag})
+    assert third.status_code == 304
+
+def test_post_ignores_if_none_match(client):
+    """POST is not a safe method, so a matching ETag still gets the full result."""
+    etag = post_graphql(client, CLIENTS_QUERY).headers['ETag']
+
+    response = post_graphql(client, CLIENTS_QUERY, {'If-None-Match': etag})
+
+    assert response.status_code == 200
+    assert response.headers['ETag'] == etag
+    assert json.loads(response.data)['data']['clients']['edges']
+
+def test_changed_data_and_mutations_are_not_revalidated(app, client):
+    """A stale ETag gets the full body, and mutation results carry no ETag."""
+    etag = post_graphql(client, CLIENTS_QUERY).headers['ETag']
+    with app.app_context():
+        db.session.add(Client(name="New Client", markup_rate=Decimal("0.10")))
+        db.session.commit()
+
+    response = get_graphql(client, CLIENTS_QUERY, {'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+    mutation = post_graphql(client, """
+    mutation { updateClientMarkup(clientId: "Q2xpZW50OjE=", rate: 0.2) { errors } }
+    """)
+    assert mutation.status_code == 200
+    assert 'ETag' not in mutation.headers
+
+def test_request_is_parsed_once(client, monkeypatch):
+    """The document parsed to classify the operation is the one executed."""
+    from responses import parse_document
+
+    def fail(*args, **kwargs):
+        raise AssertionError("parsed twice")
+
+    monkeypatch.setattr(sys.modules['ariadne.graphql'], "parse_query", fail)
+    query = "query Clients { clients { edges { node { name } } } }"
+
+    assert parse_document({'query': query}) is parse_document({'query': query})
+    assert parse_document({'query': "{ not valid"}) is None
+    assert json.loads(post_graphql(client, query).data)['data']['clients']['edges']
+    batch = client.post('/graphql', json=[{'query': query}, {'query': query}])
+    assert all(result['data'] for result in json.loads(batch.data))
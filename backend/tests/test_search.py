@@ -0,0 +1,92 @@
+"""
+Tests for the full-text counterparty search query.
+"""
+
+import os
+import sys
+import json
+import pytest
+from decimal import Decimal
+
+# Add the parent directory to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event, text, update
+
+from models import db, Client, Supplier
+from search import search_counterparties
+
+SEARCH = """
+query Search($term: String!, $first: Int) {
+  search(term: $term, first: $first) {
+    __typename
+    ... on Client { id name markup_rate }
+    ... on Supplier { id name }
+  }
+}
+"""
+
+@pytest.fixture
+def counterparties(app_context):
+    db.session.add_all([
+        Client(name="Acme Construction", markup_rate=Decimal("0.10")),
+        Client(name="Northwind Traders", markup_rate=Decimal("0.15")),
+        Supplier(name="Acme Timber Supply"),
+        Supplier(name="Café Béton"),
+    ])
+    db.session.commit()
+
+def names(results):
+    return [result.name for result in results]
+
+def test_search_matches_word_prefixes(counterparties):
+    assert sorted(names(search_counterparties("acm"))) == ["Acme Construction", "Acme Timber Supply"]
+    assert names(search_counterparties("acme tim")) == ["Acme Timber Supply"]
+    assert names(search_counterparties("north")) == ["Northwind Traders"]
+    # Diacritics are folded
+    assert names(search_counterparties("beton")) == ["Café Béton"]
+    # FTS5 syntax in the term is taken literally
+    assert len(search_counterparties('"acme*')) == 2
+    assert search_counterparties('acme OR north') == []
+    assert search_counterparties("   ") == []
+
+def test_index_follows_inserts_updates_and_deletes(counterparties):
+    client = Client.query.filter_by(name="Northwind Traders").one()
+    db.session.execute(update(Client).where(Client.id == client.id).values(name="Southwind Traders"))
+    db.session.commit()
+    assert search_counterparties("north") == []
+    assert names(search_counterparties("south")) == ["Southwind Traders"]
+
+    supplier = Supplier.query.filter_by(name="Acme Timber Supply").one()
+    db.session.delete(supplier)
+    db.session.add(Supplier(name="Zenith Metals"))
+    db.session.commit()
+    assert names(search_counterparties("acme")) == ["Acme Construction"]
+    assert names(search_counterparties("zen")) == ["Zenith Metals"]
+
+def test_search_query_returns_typed_results(client, counterparties):
+    response = client.post('/graphql', json={'query': SEARCH, 'variables': {'term': "acme", 'first': 1}})
+    results = json.loads(response.data)['data']['search']
+
+    assert len(results) == 1
+    assert results[0]['__typename'] in ("Client", "Supplier")
+    assert results[0]['name'].startswith("Acme")
+
+def test_matches_are_loaded_in_one_query_per_table_in_rank_order(counterparties):
+    """Hits are hydrated with an IN query per table, keeping the index's ranking."""
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    ranked = [rowid for (rowid,) in db.session.execute(text(
+        "SELECT rowid FROM counterparty_search WHERE counterparty_search MATCH '\"acme\"*' ORDER BY rank"))]
+    event.listen(db.engine, "before_cursor_execute", record)
+    try:
+        results = search_counterparties("acme")
+    finally:
+        event.remove(db.engine, "before_cursor_execute", record)
+
+    assert len(statements) == 3
+    assert [(type(result).__name__, result.id) for result in results] == [
+        ("SupplierSnapshot" if rowid % 2 else "ClientSnapshot", rowid // 2) for rowid in ranked]
@@ -0,0 +1,67 @@
+"""
+Tests for the fast JSON codec and streamed GraphQL responses.
+"""
+
+import os
+import sys
+import gzip
+import json
+import pytest
+from decimal import Decimal
+
+# Add the parent directory to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import db, Client
+from serialization import dumps, loads, iter_encode, largest_list_length
+
+CLIENTS_QUERY = "{ clients { edges { node { name markup_rate } cursor } pageInfo { hasNextPage } } }"
+
+@pytest.fixture
+def app(app):
+    """The conftest app streaming results with 10 or more items, with 25 clients."""
+    app.config['GRAPHQL_STREAM_MIN_ITEMS'] = 10
+    with app.app_context():
+        db.session.add_all([Client(name=f"Client {i}", markup_rate=Decimal("0.15")) for i in range(25)])
+        db.session.commit()
+    return app
+
+def test_iter_encode_matches_dumps():
+    """Streaming produces exactly the bytes of a one-shot encoding."""
+    result = {"data": {"items": {
+        "edges": [{"node": {"id": i, "name": f"ü {i}"}, "cursor": str(i)} for i in range(1234)],
+        "pageInfo": {"hasNextPage": True, "endCursor": None},
+    }}, "empty": [], "amount": Decimal("1.50")}
+
+    chunks = list(iter_encode(result, batch_size=100, chunk_bytes=1024))
+
+    assert len(chunks) > 1
+    assert b"".join(chunks) == dumps(result)
+    assert loads(b"".join(chunks))["data"]["items"]["edges"][1233]["node"]["name"] == "ü 1233"
+    assert largest_list_length(result) == 1234
+
+def test_large_results_are_streamed(client):
+    """Results with long lists are sent chunked, compressed, and without an ETag."""
+    response = client.post('/graphql', json={'query': CLIENTS_QUERY}, headers={'Accept-Encoding': 'gzip'})
+
+    assert response.status_code == 200
+    assert 'Content-Length' not in response.headers
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'ETag' not in response.headers
+    data = json.loads(gzip.decompress(response.data))
+    assert len(data['data']['clients']['edges']) == 25
+
+def test_small_results_are_not_streamed(client):
+    """Short lists are encoded in one piece and keep their ETag."""
+    response = client.post('/graphql', json={'query': "{ clients(first: 3) { edges { cursor } } }"})
+
+    assert 'Content-Length' in response.headers
+    assert 'ETag' in response.headers
+    assert len(json.loads(response.data)['data']['clients']['edges']) == 3
+
+def test_invalid_json_body(client):
+    """A malformed JSON body is rejected with a GraphQL-style error."""
+    response = client.post('/graphql', data=b'{"query": ', content_type='application/json')
+
+    assert response.status_code == 400
+    assert json.loads(response.data)['errors'][0]['message'] == "Request body is not valid JSON"
@@ -0,0 +1,92 @@
+"""
+Tests for the production server setup: gunicorn settings and fork safety.
+"""
+
+import os
+import runpy
+import sys
+import pytest
+
+# Add the parent directory to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+
+from app import create_app
+from models import db
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def load_gunicorn_config():
+    return runpy.run_path(os.path.join(BACKEND_DIR, 'gunicorn.conf.py'))
+
+def test_gunicorn_config_reads_environment(monkeypatch):
+    """Worker count, threads and recycling come from the environment."""
+    monkeypatch.setenv('WEB_CONCURRENCY', '3')
+    monkeypatch.setenv('GUNICORN_THREADS', '8')
+    monkeypatch.setenv('GUNICORN_MAX_REQUESTS', '500')
+    monkeypatch.setenv('PORT', '8000')
+    config = load_gunicorn_config()
+
+    assert config['workers'] == 3
+    assert config['threads'] == 8
+    assert config['worker_class'] == 'uvicorn.workers.UvicornWorker'
+    assert config['max_requests'] == 500
+    assert config['bind'] == '0.0.0.0:8000'
+    assert config['preload_app'] is True
+
+def test_workers_are_recycled_only_when_jobs_run_elsewhere(monkeypatch):
+    """Recycling a worker would cancel the background jobs running in it."""
+    monkeypatch.delenv('GUNICORN_MAX_REQUESTS', raising=False)
+    monkeypatch.delenv('JOBS_IN_PROCESS', raising=False)
+    assert load_gunicorn_config()['max_requests'] == 0
+    monkeypatch.setenv('JOBS_IN_PROCESS', 'false')
+    assert load_gunicorn_config()['max_requests'] == 1000
+
+def test_worker_class_can_be_overridden(monkeypatch):
+    monkeypatch.setenv('GUNICORN_WORKER_CLASS', 'gthread')
+    assert load_gunicorn_config()['worker_class'] == 'gthread'
+
+def test_asgi_app_serves_flask_on_worker_threads(monkeypatch):
+    """The deployed ASGI app runs Flask requests on GUNICORN_THREADS threads."""
+    from asgi import create_asgi_app
+
+    monkeypatch.setenv('GUNICORN_THREADS', '6')
+    application = create_asgi_app(create_app(testing=True))
+    assert application.flask_app.config['WORKER_THREADS'] == 6
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason="requires os.fork")
+def test_forked_worker_gets_its_own_connection_pool(tmp_path, monkeypatch):
+    """A child forked from a preloaded app must not reuse the parent's connections."""
+    monkeypatch.setenv('SQLALCHEMY_DATABASE_URI', f"sqlite:///{tmp_path / 'fork.db'}")
+    app = create_app()
+    with app.app_context():
+        with db.engine.connect() as connection:
+            connection.execute(text('SELECT 1'))
+        parent_pool = db.engine.pool
+
+    pid = os.fork()
+    if pid == 0:
+        # Child: report through the exit status, never return into pytest
+        status = 1
+        try:
+            with app.app_context():
+                with db.engine.connect() as connection:
+                    connection.execute(text('SELECT 1'))
+                status = 0 if db.engine.pool is not parent_pool else 2
+        finally:
+            os._exit(status)
+
+    _, wait_status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(wait_status) == 0
+    with app.app_context():
+        assert db.engine.pool is parent_pool
+
+def test_apps_share_one_fork_hook():
+    """Every app is reset after fork through one hook registered at import."""
+    import weakref
+    import app as app_module
+
+    first, second = create_app(testing=True), create_app(testing=True)
+    assert isinstance(app_module._apps, weakref.WeakSet)
+    assert first in app_module._apps and second in app_module._apps
@@ -0,0 +1,124 @@
+"""
+Tests for the settleInvoices bulk settlement mutation.
+"""
+
+import os
+import sys
+import json
+import pytest
+from decimal import Decimal
+from datetime import datetime
+
+from sqlalchemy import event, update
+
+# Add the parent directory to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import settlement
+from models import db, Client, Supplier, MaterialsInvoice, Transaction, Debt, InvoiceStatus
+from utils import to_global_id, markup_amount
+
+SETTLE_INVOICES = """
+mutation Settle($ids: [ID!]!, $paidDate: String) {
+  settleInvoices(ids: $ids, paidDate: $paidDate) {
+    settledInvoices
+    closedDebts
+    failures { id message }
+    errors
+  }
+}
+"""
+
+@pytest.fixture
+def invoice_ids(app_context):
+    """Three unpaid invoices and one paid invoice, each with a transaction and two debts."""
+    client = Client(name="Settlement Client", markup_rate=Decimal("0.10"))
+    supplier = Supplier(name="Settlement Supplier")
+    db.session.add_all([client, supplier])
+    db.session.flush()
+
+    ids = []
+    for status in (InvoiceStatus.UNPAID, InvoiceStatus.PENDING, InvoiceStatus.UNPAID, InvoiceStatus.PAID):
+        invoice = MaterialsInvoice(client_id=client.id, supplier_id=supplier.id, invoiceDate=datetime(2024, 1, 1),
+                                   baseAmount=Decimal("100.00"), status=status)
+        db.session.add(invoice)
+        db.session.flush()
+        amount = markup_amount(invoice.baseAmount, client.markup_rate)
+        db.session.add_all([
+            Transaction(invoice_id=invoice.id, amount=amount),
+            Debt(invoice_id=invoice.id, party="client", amount=amount),
+            Debt(invoice_id=invoice.id, party="supplier", amount=invoice.baseAmount),
+        ])
+        ids.append(invoice.id)
+    db.session.commit()
+    return ids
+
+def settle(client, ids, paid_date="2024-03-15"):
+    response = client.post('/graphql', json={'query': SETTLE_INVOICES, 'variables': {
+        'ids': ids, 'paidDate': paid_date}})
+    assert response.status_code == 200
+    return json.loads(response.data)['data']['settleInvoices']
+
+def test_settle_invoices_flips_status_and_closes_debts(client, invoice_ids, monkeypatch):
+    """Settleable invoices are processed across chunks; transactions are untouched."""
+    monkeypatch.setattr(settlement, "SETTLE_CHUNK_SIZE", 2)
+
+    result = settle(client, [to_global_id("MaterialsInvoice", i) for i in invoice_ids[:3]])
+
+    assert result == {'settledInvoices': 3, 'closedDebts': 6, 'failures': [], 'errors': None}
+    db.session.expire_all()
+    for invoice_id in invoice_ids[:3]:
+        invoice = db.session.get(MaterialsInvoice, invoice_id)
+        assert invoice.status == InvoiceStatus.PAID
+        assert invoice.paidDate == datetime(2024, 3, 15)
+        assert all(d.amount == 0 and d.settledDate == datetime(2024, 3, 15) for d in invoice.debts)
+        assert invoice.transaction.amount == Decimal("110.00")
+
+def test_settle_invoices_reports_failures_per_id(client, invoice_ids):
+    """Bad, missing and already paid ids are reported without blocking the rest."""
+    paid_id = to_global_id("MaterialsInvoice", invoice_ids[3])
+    missing_id = to_global_id("MaterialsInvoice", 9999)
+    client_id = to_global_id("Client", 1)
+
+    result = settle(client, [to_global_id("MaterialsInvoice", invoice_ids[0]), paid_id, missing_id, client_id])
+
+    assert result['settledInvoices'] == 1
+    assert result['closedDebts'] == 2
+    assert {f['id']: f['message'] for f in result['failures']} == {
+        client_id: "Invalid ID types provided",
+        paid_id: "Invoice is already PAID",
+        missing_id: "Invoice not found",
+    }
+
+    # Settling again fails for every id and changes nothing
+    result = settle(client, [to_global_id("MaterialsInvoice", invoice_ids[0])])
+    assert result['settledInvoices'] == 0
+    assert result['failures'][0]['message'] == "Invoice is already PAID"
+
+def test_invoice_paid_concurrently_is_a_failure(app_context, invoice_ids):
+    """Only rows the UPDATEs changed are reported; an invoice paid in between is a failure."""
+    paid = []
+
+    def pay_first(conn, cursor, statement, *args):
+        if statement.startswith("UPDATE materials_invoices") and not paid:
+            paid.append(invoice_ids[0])
+            conn.execute(update(MaterialsInvoice).where(MaterialsInvoice.id == invoice_ids[0])
+                         .values(status=InvoiceStatus.PAID, paidDate=datetime(2024, 3, 1)))
+            conn.execute(update(Debt).where(Debt.invoice_id == invoice_ids[0])
+                         .values(amount=0, settledDate=datetime(2024, 3, 1)))
+
+    event.listen(db.engine, "before_cursor_execute", pay_first)
+    try:
+        result = settlement.settle_invoices(invoice_ids[:2], datetime(2024, 3, 15))
+    finally:
+        event.remove(db.engine, "before_cursor_execute", pay_first)
+
+    assert result.settled_invoices == 1
+    assert {invoice_id for _, invoice_id, _ in result.closed_debts} == {invoice_ids[1]}
+    assert result.failures == {invoice_ids[0]: "Invoice is already PAID"}
+
+def test_settle_invoices_rejects_invalid_paid_date(client, invoice_ids):
+    result = settle(client, [to_global_id("MaterialsInvoice", invoice_ids[0])], paid_date="15/03/2024")
+
+    assert result['settledInvoices'] == 0
+    assert "Invalid paidDate" in result['errors'][0]
@@ -0,0 +1,130 @@
+"""
+Tests for the slow SQL log and its debug endpoint.
+"""
+
+import os
+import sys
+import json
+import pytest
+from decimal import Decimal
+from sqlalchemy import text
+
+# Add the parent directory to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from models import db, Client
+import slow_queries
+from slow_queries import slow_query_log, normalize_statement, parameters_shape, graphql_operation
+
+CLIENT_NAMES = "query ClientNames { clients { edges { node { name } } } }"
+
+@pytest.fixture
+def app(app):
+    """The conftest app with the debug endpoints enabled and one client."""
+    app.config['DEBUG_TOKEN'] = "secret"
+    with app.app_context():
+        db.session.add(Client(name="Slow Client", markup_rate=Decimal("0.15")))
+        db.session.commit()
+    return app
+
+@pytest.fixture
+def record_everything():
+    """Treat every statement as slow."""
+    threshold = slow_query_log.threshold_ms
+    slow_query_log.threshold_ms = 1e-9
+    slow_query_log.clear()
+    yield slow_query_log
+    slow_query_log.threshold_ms = threshold
+    slow_query_log.clear()
+
+def test_normalize_statement():
+    assert normalize_statement(
+        "SELECT t1.id FROM   t1\n WHERE t1.name = 'O''Brien' AND t1.id IN (?, ?, ?) AND t1.x > 10.5 LIMIT ?"
+    ) == "SELECT t1.id FROM t1 WHERE t1.name = ? AND t1.id IN (...) AND t1.x > ? LIMIT ?"
+    assert normalize_statement("UPDATE debts SET amount=%(amount)s WHERE id = $1") == \
+        "UPDATE debts SET amount=? WHERE id = ?"
+
+def test_parameters_shape_has_no_values():
+    assert parameters_shape((1, "secret", None)) == ["int", "str", "NoneType"]
+    assert parameters_shape({"name": "secret"}) == {"name": "str"}
+    assert parameters_shape([(1,), (2,)], executemany=True) == {"rows": 2, "row": ["int"]}
+
+def test_slow_statement_is_recorded_with_plan(app_context, record_everything):
+    with graphql_operation("Report"):
+        db.session.execute(text("SELECT name FROM clients WHERE id = :id"), {"id": 1})
+        db.session.execute(text("SELECT name FROM clients WHERE id = :id"), {"id": 2})
+
+    latest = record_everything.recent()[0]
+    assert latest["statement"] == "SELECT name FROM clients WHERE id = ?"
+    assert latest["parameters"] == ["int"]
+    assert latest["operation"] == "Report"
+    # The plan is captured once per fingerprint and interval
+    assert latest["plan"] is None
+    stats = next(s for s in record_everything.fingerprints() if s["fingerprint"] == latest["fingerprint"])
+    assert stats["count"] == 2
+    assert stats["operations"] == ["Report"]
+    assert "clients" in stats["plan"]
+
+class FakePostgresCursor:
+    """A DBAPI cursor that records what it runs and fails every EXPLAIN."""
+
+    def __init__(self, sent):
+        self.sent = sent
+
+    def execute(self, statement, parameters=None):
+        self.sent.append(statement)
+        if statement.startswith("EXPLAIN"):
+            raise RuntimeError("permission denied")
+
+    def close(self):
+        pass
+
+def test_failed_explain_is_rolled_back_to_a_savepoint_on_postgres():
+    sent = []
+
+    class connection:
+        class dialect:
+            name = "postgresql"
+
+        class connection:
+            class dbapi_connection:
+                cursor = staticmethod(lambda: FakePostgresCursor(sent))
+
+    with pytest.raises(RuntimeError):
+        slow_queries._explain(connection, "SELECT 1", ())
+    assert sent == ["SAVEPOINT slow_query_explain", "EXPLAIN SELECT 1",
+                    "ROLLBACK TO SAVEPOINT slow_query_explain", "RELEASE SAVEPOINT slow_query_explain"]
+
+def test_debug_endpoint_requires_token(client, record_everything):
+    # Relay sends no operationName; the name comes from the document
+    client.post('/graphql', json={'query': CLIENT_NAMES})
+
+    assert client.get('/debug/slow-queries').status_code == 401
+    assert client.get('/debug/slow-queries', headers={'Authorization': "Bearer wrong"}).status_code == 401
+
+    response = client.get('/debug/slow-queries', headers={'Authorization': "Bearer secret"})
+    assert response.status_code == 200
+    report = json.loads(response.data)
+    assert any(entry["operation"] == "ClientNames" and "FROM clients" in entry["statement"]
+               for entry in report["recent"])
+    assert report["fingerprints"]
+
+def test_debug_endpoint_is_absent_without_token(app, client):
+    app.config['DEBUG_TOKEN'] = None
+    assert client.get('/debug/slow-queries').status_code == 404
+
+def test_log_is_configured_from_app_config(monkeypatch):
+    monkeypatch.setenv('SLOW_QUERY_THRESHOLD_MS', '50')
+    monkeypatch.setenv('SLOW_QUERY_LOG_SIZE', '3')
+    try:
+        app = create_app(testing=True)
+        assert app.config['SLOW_QUERY_THRESHOLD_MS'] == 50
+        assert slow_query_log.threshold_ms == 50
+        for i in range(5):
+            slow_query_log.record(f"SELECT {i}", str(i), 60.0, [], None, None)
+        assert [entry["statement"] for entry in slow_query_log.recent()] == ["SELECT 4", "SELECT 3", "SELECT 2"]
+    finally:
+        monkeypatch.undo()
+        create_app(testing=True)
+        slow_query_log.clear()
@@ -0,0 +1,123 @@
+"""
+Tests for per-client statement generation.
+"""
+
+import os
+import sys
+import csv
+import json
+import pytest
+from decimal import Decimal
+from datetime import date, datetime
+
+# Add the parent directory to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from models import db, Client, Supplier, MaterialsInvoice, Transaction, Debt, InvoiceStatus
+from statements import generate_statements
+from utils import to_global_id, markup_amount
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """A file-backed database, so that worker processes can open it too."""
+    monkeypatch.setenv('SQLALCHEMY_DATABASE_URI', f"sqlite:///{tmp_path / 'statements.db'}")
+    app = create_app()
+
+    with app.app_context():
+        db.create_all()
+
+    yield app
+
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+def add_invoice(client, supplier, invoice_date, base_amount, status=InvoiceStatus.UNPAID):
+    invoice = MaterialsInvoice(client_id=client.id, supplier_id=supplier.id, invoiceDate=invoice_date,
+                               baseAmount=base_amount, status=status)
+    db.session.add(invoice)
+    db.session.flush()
+    amount = markup_amount(base_amount, client.markup_rate)
+    db.session.add_all([
+        Transaction(invoice_id=invoice.id, amount=amount, transactionDate=invoice_date),
+        Debt(invoice_id=invoice.id, party="client", amount=0 if status == InvoiceStatus.PAID else amount),
+        Debt(invoice_id=invoice.id, party="supplier", amount=base_amount),
+    ])
+    db.session.flush()
+    return invoice.id
+
+@pytest.fixture
+def clients(app_context):
+    """Five clients with one to three invoices each, plus a client without invoices."""
+    supplier = Supplier(name="Statement Supplier")
+    db.session.add(supplier)
+    db.session.flush()
+    clients = []
+    for n in range(1, 6):
+        client = Client(name=f"Client {n}", markup_rate=Decimal("0.10") * n)
+        db.session.add(client)
+        db.session.flush()
+        for k in range(1, n % 3 + 2):
+            add_invoice(client, supplier, datetime(2024, k, 15), Decimal("100.00") * k,
+                        InvoiceStatus.PAID if k == 1 else InvoiceStatus.UNPAID)
+        clients.append(client)
+    idle = Client(name="Idle Client", markup_rate=Decimal("0.05"))
+    db.session.add(idle)
+    db.session.commit()
+    return clients + [idle]
+
+def read_json(output_dir, client):
+    with open(os.path.join(output_dir, f"client-{client.id}.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+def test_json_statements(clients, tmp_path):
+    """Every client gets a statement with its invoices, markup and outstanding debt."""
+    output_dir = str(tmp_path / "out")
+    progress = []
+
+    written = generate_statements(output_dir, "json", shard_size=2,
+                                  progress=lambda done, total: progress.append((done, total)))
+
+    assert written == {"clients": 6, "invoices": 11}
+    assert progress == [(2, 6), (4, 6), (6, 6)]
+    assert sorted(os.listdir(output_dir)) == sorted(f"client-{c.id}.json" for c in clients)
+
+    statement = read_json(output_dir, clients[1])
+    assert statement["client"] == {"id": to_global_id("Client", clients[1].id), "name": "Client 2",
+                                   "markupRate": "0.2000"}
+    assert [line["baseAmount"] for line in statement["invoices"]] == ["100.00", "200.00", "300.00"]
+    assert [line["status"] for line in statement["invoices"]] == ["PAID", "UNPAID", "UNPAID"]
+    assert [line["markup"] for line in statement["invoices"]] == ["20.00", "40.00", "60.00"]
+    assert [line["outstanding"] for line in statement["invoices"]] == ["0.00", "240.00", "360.00"]
+    assert statement["totals"] == {"baseAmount": "600.00", "markup": "120.00",
+                                   "amount": "720.00", "outstanding": "600.00"}
+
+    assert read_json(output_dir, clients[-1])["invoices"] == []
+
+def test_csv_statements_for_a_period(clients, tmp_path):
+    """The date range includes the whole last day."""
+    output_dir = str(tmp_path / "out")
+
+    written = generate_statements(output_dir, "csv", date_from=date(2024, 2, 1), date_to=date(2024, 2, 15))
+
+    assert written["invoices"] == 4
+    with open(os.path.join(output_dir, f"client-{clients[4].id}.csv"), newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    assert [(row["invoiceDate"], row["amount"], row["outstanding"]) for row in rows] == \
+        [("2024-02-15T00:00:00", "300.00", "300.00")]
+
+def test_worker_processes_write_the_same_files(clients, tmp_path):
+    inline_dir, pool_dir = str(tmp_path / "inline"), str(tmp_path / "pool")
+
+    generate_statements(inline_dir, "json")
+    written = generate_statements(pool_dir, "json", workers=2, shard_size=2)
+
+    assert written == {"clients": 6, "invoices": 11}
+    for name in os.listdir(inline_dir):
+        with open(os.path.join(inline_dir, name)) as a, open(os.path.join(pool_dir, name)) as b:
+            assert a.read() == b.read()
+
+def test_invalid_format(app_context, tmp_path):
+    with pytest.raises(ValueError, match="Invalid format"):
+        generate_statements(str(tmp_path), "xml")
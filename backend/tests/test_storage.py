@@ -0,0 +1,141 @@
+"""
+Tests for the opt-in compact storage types and their migration.
+"""
+
+import os
+import sys
+import json
+import sqlite3
+import subprocess
+import pytest
+from decimal import Decimal
+
+# Add the parent directory to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db_migrations
+from app import create_app
+from db_migrations import check_storage_mode, StorageModeMismatch
+from models import db, Cents, StatusCode, PartyCode, InvoiceStatus, InvalidCode, COMPACT_STORAGE
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in a compact-storage process: creates an invoice and reads it back through GraphQL
+COMPACT_SCRIPT = """
+import json
+from app import create_app
+from utils import to_global_id
+
+app = create_app()
+test_client = app.test_client()
+create = test_client.post('/graphql', json={'query': '''
+    mutation { createMaterialsInvoice(clientId: "%s", supplierId: "%s",
+               invoiceDate: "2024-03-01", baseAmount: 20.05) { errors } }
+''' % (to_global_id("Client", 1), to_global_id("Supplier", 1))})
+query = test_client.post('/graphql', json={'query': '''
+    { invoices(filter: {minAmount: 15, status: ["UNPAID"]}) {
+        edges { node { baseAmount status transaction { amount } debts { edges { node { party amount } } } } } } }
+'''})
+print(json.dumps([create.get_json(), query.get_json()]))
+"""
+
+def test_cents_round_trip():
+    cents = Cents()
+    assert cents.process_bind_param(Decimal("12.34"), None) == 1234
+    assert cents.process_bind_param(0.1 + 0.2, None) == 30
+    assert cents.process_bind_param(Decimal("0.005"), None) == 1
+    assert cents.process_result_value(1234, None) == Decimal("12.34")
+    assert cents.process_bind_param(None, None) is None
+
+def test_codes_round_trip():
+    status = StatusCode()
+    assert status.process_bind_param(InvoiceStatus.PAID, None) == 3
+    assert status.process_bind_param("UNPAID", None) == 4
+    assert status.process_result_value(3, None) is InvoiceStatus.PAID
+
+    party = PartyCode()
+    assert party.process_result_value(party.process_bind_param("supplier", None), None) == "supplier"
+    with pytest.raises(InvalidCode, match="Invalid PartyCode value"):
+        party.process_bind_param("Client", None)
+    with pytest.raises(InvalidCode, match="Unknown PartyCode code"):
+        party.process_result_value(7, None)
+
+def flask_db(database, *args, compact=False):
+    env = dict(os.environ, SQLALCHEMY_DATABASE_URI=f"sqlite:///{database}")
+    env.pop('COMPACT_STORAGE', None)
+    if compact:
+        env['COMPACT_STORAGE'] = '1'
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'db', *args],
+                   cwd=BACKEND_DIR, env=env, check=True, capture_output=True)
+    return env
+
+def test_migration_converts_and_restores_data(tmp_path):
+    """Upgrading with COMPACT_STORAGE stores cents and codes; downgrading restores the values."""
+    database = tmp_path / "compact.db"
+    flask_db(database, 'upgrade', 'a9d3f5b7e284')
+    with sqlite3.connect(database) as connection:
+        connection.execute("INSERT INTO clients (id, name, markup_rate) VALUES (1, 'Client', 0.1)")
+        connection.execute("INSERT INTO suppliers (id, name) VALUES (1, 'Supplier')")
+        connection.execute("INSERT INTO materials_invoices (id, client_id, supplier_id, \"baseAmount\", status) "
+                           "VALUES (1, 1, 1, 12.34, 'PAID')")
+        connection.execute("INSERT INTO transactions (id, invoice_id, amount) VALUES (1, 1, 13.57)")
+        connection.execute("INSERT INTO debts (id, invoice_id, party, amount) "
+                           "VALUES (1, 1, 'client', 13.57), (2, 1, 'supplier', 12.34), (3, 1, 'Supplier', 0)")
+
+    env = flask_db(database, 'upgrade', compact=True)
+    with sqlite3.connect(database) as connection:
+        assert connection.execute('SELECT "baseAmount", status FROM materials_invoices').fetchall() == [(1234, 3)]
+        assert connection.execute('SELECT party, amount FROM debts ORDER BY id').fetchall() == \
+            [(1, 1357), (2, 1234), (2, 0)]
+
+    # The app reads and writes the compact columns through the model types
+    output = subprocess.run([sys.executable, '-c', COMPACT_SCRIPT], cwd=BACKEND_DIR, env=env,
+                            check=True, capture_output=True, text=True).stdout
+    create, query = json.loads(output.strip().splitlines()[-1])
+    assert create == {'data': {'createMaterialsInvoice': {'errors': None}}}
+    [edge] = query['data']['invoices']['edges']
+    assert edge['node']['baseAmount'] == 20.05
+    assert edge['node']['status'] == 'UNPAID'
+    assert edge['node']['transaction']['amount'] == 22.06
+    assert sorted((d['node']['party'], d['node']['amount']) for d in edge['node']['debts']['edges']) == \
+        [('client', 22.06), ('supplier', 20.05)]
+
+    flask_db(database, 'downgrade', 'a9d3f5b7e284', compact=True)
+    with sqlite3.connect(database) as connection:
+        assert connection.execute('SELECT "baseAmount", status FROM materials_invoices WHERE id = 1').fetchall() == \
+            [(12.34, 'PAID')]
+        assert connection.execute('SELECT party, amount FROM debts WHERE id <= 2 ORDER BY id').fetchall() == \
+            [('client', 13.57), ('supplier', 12.34)]
+
+def test_migration_is_a_no_op_by_default(tmp_path):
+    database = tmp_path / "default.db"
+    flask_db(database, 'upgrade')
+    with sqlite3.connect(database) as connection:
+        [(sql,)] = connection.execute("SELECT sql FROM sqlite_master WHERE name = 'debts'").fetchall()
+    assert "NUMERIC(10, 2)" in sql and "VARCHAR(50)" in sql
+
+def test_migration_rejects_unknown_parties(tmp_path):
+    database = tmp_path / "unknown.db"
+    flask_db(database, 'upgrade', 'a9d3f5b7e284')
+    with sqlite3.connect(database) as connection:
+        connection.execute("INSERT INTO debts (id, invoice_id, party, amount) VALUES (1, 1, 'bank', 1)")
+
+    with pytest.raises(subprocess.CalledProcessError) as error:
+        flask_db(database, 'upgrade', compact=True)
+    assert b"unknown parties: ['bank']" in error.value.stderr
+
+def test_storage_mode_mismatch_fails_fast(monkeypatch):
+    """Starting with the other COMPACT_STORAGE setting than the schema's is refused."""
+    app = create_app(testing=True)
+    check_storage_mode(app)  # no tables yet
+    with app.app_context():
+        db.create_all()
+    try:
+        check_storage_mode(app)
+
+        monkeypatch.setattr(db_migrations, "COMPACT_STORAGE", not COMPACT_STORAGE)
+        with pytest.raises(StorageModeMismatch, match="debts.party"):
+            check_storage_mode(app)
+    finally:
+        with app.app_context():
+            db.drop_all()
@@ -0,0 +1,152 @@
+"""
+Tests for the event bus, its cross-process relay and the GraphQL subscriptions it feeds.
+"""
+
+import os
+import sys
+import json
+import asyncio
+import threading
+from decimal import Decimal
+
+# Add the parent directory to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ariadne import make_executable_schema, subscribe
+from asgi import bind_app_context
+from events import EventBus, PostgresEventRelay, event_bus, INVOICE_CREATED, DEBT_CHANGED
+from models import db, Client, Supplier
+from schema import type_defs, bindables
+from utils import to_global_id
+
+CREATE_INVOICE = """
+mutation CreateInvoice($clientId: ID!, $supplierId: ID!) {
+  createMaterialsInvoice(clientId: $clientId, supplierId: $supplierId,
+                         invoiceDate: "2023-04-20", baseAmount: 100.0) {
+    invoice { id }
+    errors
+  }
+}
+"""
+
+def test_event_bus_delivers_across_threads():
+    """Events published from another thread reach matching subscribers only."""
+    bus = EventBus()
+
+    async def consume():
+        everything = bus.subscribe("topic")
+        odd_only = bus.subscribe("topic", lambda event: event % 2 == 1)
+        assert bus.subscriber_count("topic") == 2
+
+        publisher = threading.Thread(target=lambda: [bus.publish("topic", i) for i in range(4)])
+        publisher.start()
+        publisher.join()
+
+        received = [await asyncio.wait_for(everything.__anext__(), 1) for _ in range(4)]
+        filtered = [await asyncio.wait_for(odd_only.__anext__(), 1) for _ in range(2)]
+
+        await everything.aclose()
+        await odd_only.aclose()
+        assert bus.subscriber_count("topic") == 0
+        return received, filtered
+
+    assert asyncio.run(consume()) == ([0, 1, 2, 3], [1, 3])
+
+def test_event_bus_drops_events_for_slow_subscribers():
+    """A full subscriber queue drops new events instead of blocking publishers."""
+    bus = EventBus(maxsize=1)
+
+    async def consume():
+        subscription = bus.subscribe("topic")
+        bus.publish("topic", "first")
+        bus.publish("topic", "second")
+        await asyncio.sleep(0)
+        first = await subscription.__anext__()
+        return first, subscription.dropped
+
+    assert asyncio.run(consume()) == ("first", 1)
+
+class LoopbackRelay(PostgresEventRelay):
+    """A relay whose notifications come straight back, as they do from PostgreSQL."""
+
+    def __init__(self, bus):
+        super().__init__(None, bus)
+        self.messages = []
+        self.listening = 0
+
+    def send(self, topic, payload):
+        self.messages.append(json.dumps({"topic": topic, "payload": payload}))
+
+    def listen(self):
+        self.listening += 1
+
+def test_events_go_through_the_relay_when_there_is_one():
+    """With a relay, subscribers only get events back from it, including this process's own."""
+    bus = EventBus()
+    relay = bus.relay = LoopbackRelay(bus)
+
+    async def consume():
+        subscription = bus.subscribe("topic")
+        assert relay.listening == 1
+        bus.publish("topic", {"id": 1})
+        await asyncio.sleep(0)
+        assert subscription.queue.empty()
+
+        relay._dispatch(relay.messages[0])
+        relay._dispatch("not json")
+        return await asyncio.wait_for(subscription.__anext__(), 1)
+
+    assert asyncio.run(consume()) == {"id": 1}
+
+def test_relay_failures_do_not_fail_the_publisher():
+    bus = EventBus()
+    relay = bus.relay = LoopbackRelay(bus)
+    relay.send = lambda topic, payload: 1 / 0
+    bus.publish("topic", {"id": 1})
+
+def test_invoice_created_subscription(app, client, app_context):
+    """Creating an invoice pushes it and its debts to filtered subscribers."""
+    client_obj = Client(name="Subscribed Client", markup_rate=Decimal("0.15"))
+    supplier_obj = Supplier(name="Subscribed Supplier")
+    db.session.add_all([client_obj, supplier_obj])
+    db.session.commit()
+    client_id = to_global_id("Client", client_obj.id)
+    supplier_id = to_global_id("Supplier", supplier_obj.id)
+    schema = bind_app_context(make_executable_schema(type_defs, *bindables), app)
+
+    async def run():
+        success, invoices = await subscribe(schema, {
+            "query": """subscription($clientId: ID) {
+                invoiceCreated(clientId: $clientId) { baseAmount client { name } transaction { amount } }
+            }""",
+            "variables": {"clientId": client_id},
+        })
+        assert success
+        success, debts = await subscribe(schema, {
+            "query": 'subscription { debtChanged(party: "supplier") { party amount } }',
+        })
+        assert success
+
+        # Sources register when the stream is first awaited
+        next_invoice = asyncio.ensure_future(invoices.__anext__())
+        next_debt = asyncio.ensure_future(debts.__anext__())
+        while event_bus.subscriber_count(INVOICE_CREATED) < 1 or event_bus.subscriber_count(DEBT_CHANGED) < 1:
+            await asyncio.sleep(0.01)
+
+        response = await asyncio.to_thread(client.post, '/graphql', json={
+            'query': CREATE_INVOICE, 'variables': {'clientId': client_id, 'supplierId': supplier_id}})
+        assert json.loads(response.data)['data']['createMaterialsInvoice']['errors'] is None
+
+        invoice_result = await asyncio.wait_for(next_invoice, 5)
+        debt_result = await asyncio.wait_for(next_debt, 5)
+        await invoices.aclose()
+        await debts.aclose()
+        return invoice_result, debt_result
+
+    invoice_result, debt_result = asyncio.run(run())
+
+    assert invoice_result.errors is None
+    assert invoice_result.data == {"invoiceCreated": {
+        "baseAmount": 100.0, "client": {"name": "Subscribed Client"}, "transaction": {"amount": 115.0}}}
+    assert debt_result.data == {"debtChanged": {"party": "supplier", "amount": 100.0}}
+    assert event_bus.subscriber_count(INVOICE_CREATED) == 0
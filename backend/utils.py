@@ -1,4 +1,5 @@
 import base64
+from decimal import Decimal, ROUND_HALF_UP
 
 def to_global_id(type_name: str, database_id: int) -> str:
     """
@@ -17,4 +18,15 @@ def from_global_id(global_id: str) -> tuple:
         db_id = int(db_id_str)
         return type_name, db_id
     except Exception:
-        return None, None 
\ No newline at end of file
+        return None, None 
+
+# Money amounts are stored with two decimal places; round half up like a
+# NUMERIC(10, 2) column does, so Python and SQL computations agree.
+CENT = Decimal('0.01')
+RATE_QUANTUM = Decimal('0.0001')
+
+def markup_amount(base_amount: Decimal, markup_rate: Decimal) -> Decimal:
+    """
+    Returns base_amount * (1 + markup_rate) rounded half up to whole cents.
+    """
+    return (base_amount * (1 + markup_rate)).quantize(CENT, rounding=ROUND_HALF_UP)
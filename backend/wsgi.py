@@ -0,0 +1,11 @@
+"""
+WSGI entry point, for servers that do not need GraphQL subscriptions:
+
+    GUNICORN_WORKER_CLASS=gthread gunicorn -c gunicorn.conf.py wsgi:app
+
+Production runs the ASGI app instead (see asgi.py).
+"""
+
+from app import create_app
+
+app = create_app()